@@ -7,6 +7,12 @@ import io # Para lidar com o arquivo em memória
 import time # Para possíveis pausas
 import plotly.express as px # Para gráficos
 import numpy as np # Para cálculos numéricos (usado no NPS)
+import sqlite3 # Para tratar falhas ao abrir o cache
+from analise_core import ( # Lógica de classificação compartilhada com a linha de comando
+    NOME_MODELO_GEMINI, FORMATO_JSON, FORMATO_TEXTO, todas_categorias_erro,
+    ORIGEM_API, ORIGEM_LOCAL, PRECO_ENTRADA_POR_MILHAO_TOKENS, PRECO_SAIDA_POR_MILHAO_TOKENS, CacheClassificacao, CheckpointAnalise, ControleTaxa, TelemetriaAPI, AgregacaoResultados, ContagemIncremental, TAMANHO_RODADA_AMOSTRA, VALOR_SEM_ESTRATO, analisar_comentarios_concorrente, calcular_hash_resultados, converter_colunas_resultado, agrupar_comentarios, descrever_estimativa, estimar_por_amostra, filtrar_comentarios_validos, gerar_insights, ordenar_amostra_estratificada, preparar_estratos, ler_arquivo_comentarios, listar_colunas_arquivo, pre_classificar_local,
+)
+from fila_analise import FilaAnalise, estados_finais, iniciar_workers_em_segundo_plano, ler_comentarios_trabalho # Fila persistente executada por processos separados
 
 # --- Configuração da Página ---
 st.set_page_config(
@@ -20,7 +26,12 @@ if 'api_key_configured' not in st.session_state: st.session_state.api_key_config
 if 'api_key_input_value' not in st.session_state: st.session_state.api_key_input_value = ""
 if 'analysis_done' not in st.session_state: st.session_state.analysis_done = False
 if 'df_results' not in st.session_state: st.session_state.df_results = None
+if 'hash_resultados' not in st.session_state: st.session_state.hash_resultados = None
+if 'estimativa' not in st.session_state: st.session_state.estimativa = None # Preenchida só no modo amostragem
 if 'insights_generated' not in st.session_state: st.session_state.insights_generated = None
+if 'resumo_retentativas' not in st.session_state: st.session_state.resumo_retentativas = None
+if 'telemetria' not in st.session_state: st.session_state.telemetria = TelemetriaAPI()
+if 'trabalho_id' not in st.session_state: st.session_state.trabalho_id = None # Trabalho da fila acompanhado nesta sessão
 
 # --- Configuração da API Key ---
 api_key_source = None
@@ -55,218 +66,24 @@ model = None
 if st.session_state.api_key_input_value and not st.session_state.api_key_configured:
     try:
         genai.configure(api_key=st.session_state.api_key_input_value)
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        model = genai.GenerativeModel(NOME_MODELO_GEMINI)
         st.session_state.api_key_configured = True
         if api_key_source != "secrets":
             st.sidebar.success("API Key configurada com sucesso!", icon="🔑")
-        st.sidebar.caption(f"Modelo Gemini: gemini-1.5-flash")
+        st.sidebar.caption(f"Modelo Gemini: {NOME_MODELO_GEMINI}")
     except Exception as e:
         st.sidebar.error(f"Erro ao configurar API Key/Modelo. Verifique a chave.", icon="🚨")
         st.session_state.api_key_configured = False
         model = None
 elif st.session_state.api_key_configured:
      try:
-         model = genai.GenerativeModel('gemini-1.5-flash')
+         model = genai.GenerativeModel(NOME_MODELO_GEMINI)
      except Exception as e:
          st.sidebar.error(f"Erro ao recarregar o Modelo: {e}", icon="🚨")
          st.session_state.api_key_configured = False
          model = None
 
 
-# --- Prompt Principal REFINADO v7 (Baseado na Análise Comparativa e Feedback v3) ---
-seu_prompt_completo = """
-Persona: Você é uma IA Analista de Feedback de Clientes e Social Listening altamente especializada no setor bancário brasileiro, com profundo conhecimento sobre o Banco Itaú e seu ecossistema de marcas (Itaú, Personnalité, Uniclass, Empresas, íon, Private, BBA, Itubers). Você compreende produtos (CDB, LCI, Pix), jargões (TED, DOC) e o contexto de campanhas (influenciadores, eventos como Rock in Rio, The Town). Sua análise combina rigor na aplicação das regras com compreensão contextual.
-
-Objetivo:
-1.	Primário: Classificar CADA mensagem recebida em Português do Brasil (Pt-BR) em UMA categoria de Sentimento e UMA categoria Temática, aderindo ESTRITAMENTE às definições, regras e prioridades abaixo.
-2.	Secundário: (Este prompt foca APENAS na classificação).
-
-Contexto Geral: Mensagens de clientes/público sobre posts/conteúdos do Itaú e submarcas (produtos, serviços, atendimento, plataformas, campanhas, patrocínios, imagem). Reações curtas são contextuais ao post original.
-
-=== REGRAS GERAIS E DE OURO ===
-1.  Análise Dupla Obrigatória: Sentimento + Tema para cada mensagem.
-2.  **APLIQUE AS REGRAS DE "NÃO CLASSIFICADO" PRIMEIRO:** Se a mensagem se encaixar em QUALQUER critério de Não Classificado (ver seção NC abaixo), classifique IMEDIATAMENTE como Sentimento: Não Classificado, Tema: Não Classificado (Tema) e NÃO prossiga. Só avance para P/N/Neutro se NENHUM critério NC se aplicar.
-3.  Priorize P/N/Neutro: Se não for NC, use as definições abaixo.
-4.  Vinculação NC Estrita: Se Sentimento = Não Classificado, Tema DEVE SER SEMPRE Não Classificado (Tema). SEM EXCEÇÕES.
-5.  Foco no Conteúdo Relevante: Ignore ruídos como saudações isoladas no início/fim se houver conteúdo principal. Classifique com base na intenção principal da mensagem.
-
-=== NÃO CLASSIFICADO (APLICAR PRIMEIRO!) ===
-4.	Não Classificado: APLICAR **OBRIGATORIAMENTE E PRIORITARIAMENTE** SE A MENSAGEM ATENDER A UM DESTES CRITÉRIOS (ANTES de tentar P/N/Neutro):
-    1.	**Idioma Estrangeiro (predominante):** Ex: "What time?", "gracias por venir", "Do not sleep on solta o pavo", "You ❤️ vírus", "@itau We are urging...".
-    2.	**Incompreensível:** Erros graves, digitação aleatória, texto sem sentido lógico, gírias/termos muito específicos e incompreensíveis sem contexto. Ex: "asdf ghjk", "L0p9l9", "Kbut", ".oitoitoitameiamei", "Tadala! K", "Só química por são broxar", "Mercado de banco", `^`, `>>`, "👑🌎👑".
-    3.	**Menção @ Isolada ou Menção + Texto Incompleto/Ambíguo:** Contém APENAS o símbolo `@` isolado, ou menção (@ ou []) mas o texto acompanhante é incompreensível, ambíguo demais para classificar, ou apenas uma letra/número/emoji sem contexto claro. Ex: `"@"` (como única mensagem), `@itau p`, `@itau 2`, `@itau ...`, `@2🥺`. **NÃO inclui menção a usuário isolada (ex: `@pedrotavares`), que é Positivo/Interação.**
-    4.	**Spam/Link Isolado:** Conteúdo repetitivo óbvio (Illuminati, Pedidos de amizade), promoções não relacionadas, propaganda de terceiros, URL isolada SEM contexto relevante ou explicação. Ex: "Confira: https://...", "https://t.co/xxxxx", "Buy #Bitcoin 👍", "Apostas Grátis...", "@c................:não traduza...", "Carlos Correa Você quer se tornar...", "Helcia Ione Olá 🤗...", "As indicações da @eu.luisaschz é surreal...", "Gente to com uma plataforma nova boa...", "Revendo IPTV me chamem".
-    5.	**Totalmente Off-Topic:** Assunto sem QUALQUER conexão clara com Itaú, bancos, finanças, produtos/serviços financeiros, a campanha/evento em questão, ou figuras públicas associadas. Ex: "Receita de bolo", "Anistia já!", "É movimento pro Alckmin assumir?", "@que Deus abençoe vocês...", "ESTOU COM DOR ORE POR MIM", "@moço de onde é esse calendário?", "Trump está chegando...", "Vocês atendem a N.O.M.", comentário sobre time de futebol não relacionado a patrocínio, "@Não, obrigado... De repetição já ch ga minha mulher reclamando.", "Hermes trismegisto...", "Fernanda Torres é Truong My Lan.", "Roupa de cama e toalha cheirosinha...", "hoje em dia faz sol e eu penso...", "Nv cash melhor", "Cadê a sobrancelha?", "Spotfy e netflix", "A NOSSA CAMISA JAMAIS SERÁ VERMELHA...", "Quem fala :   QUEM ME CONHECE, SABE...", "tem o banco central para resolver tudo isso...", "Gente esquisita, papo estranho!", "Ggmax", "Papa francisco", "Não.dependo.de.baco", "Assistem ao filme : Polícia Federal...", "O dedo de marcar meu cunhado chega coçar", "Eu sou inturiana com ascendente planilheriana 🤭", "Consulta urgente = devo comprar passagem...", "pois é minha amiga Deus escreve certo...", "mamae". **Inclui discussões sobre pirataria/alternativas não oficiais:** "Compro na gg Max combo...", "Gatonet sempre salvando", "Eles pagam pra ver filmes...", "Não gasto nada eu baixo música...", "Uso gato. Kkk", "I ❤️ torrent", "20 reais IPTV viva a pirataria", "Eu uso youcine...", "20 reais no youcine tenho tudo kkkkk", "Rede Canais reina", "Tmj YouCine e CineVs", "Vendo filme no redecanais...", "Avisa aí que vende um aparelho...".
-    6.	**Interação Social Pura Textual/Emoji Isolada:** Mensagem contém APENAS saudações/despedidas ("Bom dia", "Boa noite amigo", "@BOA TADE", "Oi", "Tchau"), APENAS risadas textuais ("kkkk", "rsrs", "😂😂😂😂", "Kkkkkk aiai"), APENAS agradecimentos/expressões religiosas genéricas isoladas ("Obg", "Amem", "@amem", "Amém 🙏🙏"), APENAS concordâncias curtas isoladas ("Isso aí"), ou APENAS emojis de interação social ou pontuação isolados. Ex: "@amem", "@boa noite", "kkkk", "👍" (isolado), "❤️" (isolado), `☺️` (isolado), `@Oi?`, `!!!!!!!!!!!!!!` (isolado), `.` (isolado), `😂` (isolado). *NÃO aplicar se a interação acompanha conteúdo classificável (Ex: "kkkk adorei" -> classificar "adorei").*
-
-=== DEFINIÇÕES DE SENTIMENTO (Escolha UMA, APÓS verificar regras NC) ===
-
-1.	Positivo: Expressa satisfação, apoio, entusiasmo, gratidão genuína, apreciação (mesmo moderada), concordância clara, ou engajamento positivo explícito, **incluindo menção a usuário isolada ou @respostas vagas com tom positivo.**
-    *   Indicadores: **Menção a usuário isolada (Ex: `@pedrotavares`, `[Luiz Erik]`, `@katia.alje`, `@livinhalp_`) - SEMPRE Positivo/Interação Social.** **@Respostas vagas com interjeições/emojis positivos (Ex: `@rafabarrosr aaaaa feliz demais 🧡`, `@victorreegis 🧡!`, `@_a.amandah ebaaaa!...`, `@gggggabito UHULLL`, `@juliavarga ❤️❤️`, `@stephaniebegami ❤️`) - Positivo/Interação Social.** Elogios claros ("Amei", "Top", "Excelente", "Maravilhoso", "Grande Mestre", "Melhor propaganda", "amo amo", "A dicção dessa mulher é um absurdo." [elogio], "itau pfvr nao teria pessoa melhor", "GENTE EH COM MTA ALEGRIA Q ANUNCIO Q EU E @itau ESTAMOS BEM...", "Que bom oubrigado"), Agradecimentos específicos, Apoio/Torcida ("Parabéns", "QUEREMOS TURNÊ!", "Vocês são os MAIORAIS"), Apreciação ("Belo post", "Interessante", "De arrepiar", "Kkkkkk arrepiou aqui também"), Concordância explícita positiva; **Influência positiva por figura pública ("Silêncio estou estudando com a Ari Segatto", "recebi a notificação... mas já que a julia falou, vou ver")**, **Intenção positiva ("Agora vou correndo abrir minha conta", "quero fazer as pazes com o itaú tb!!!", "eu que pedi essa categoria...")**. Emojis claramente positivos isolados ou acompanhando texto positivo (😍, ❤️, 👍, 🎉, ✨, 👏, 🙌, 🙏, 🫶, 💖, 🧡, 💙, ✨❤️, 😂👏, 🙌👏, 👑🌎👑, 😘, 👄, 🌷, 🌹); Combinações Texto/Emoji Positivo. **Focar no ponto principal em mensagens mistas (Ex: "@itau Alguem q investe em musica de verdade e nao essa bosta de sertanejo... Salve Jorge!!!" -> Foco no "investe em musica de verdade/Salve Jorge" -> Positivo).**
-
-2.	Negativo: Expressa insatisfação, crítica, raiva, frustração, reclamação, tristeza, **sarcasmo, ironia, deboche, acusação**, ou **afirmação/relato direto** de problema, falha, erro, golpe, fraude ou experiência ruim.
-    *   Indicadores: Críticas diretas ("Péssimo", "Banco lixo", "Que bosta", "A MOÇA DO ITAÚ... FUI ENGANADO.", "É muita reclamação", "Itaú está péssimo", "Pior banco"), **Relato/afirmação de problemas ("Não funciona CDB", "Cobrança indevida", "Fui vítima de golpe", "@itau Erro TED", "não estava conseguindo acessar o app", "@itau Cuidado com o app...Banco não computa...", "Fizeram a migração sem minha autorização... Cadê meu dinheiroooo? 😡😡🙄", "Bug na migração... chave Pix... sumiu", "O Itaú é uma porcaria pra entrar...", "Carregador portátil não funciona.")**, Reclamações diretas ("Atendimento horrível", "Péssimo atendimento"), Insatisfação direta ("Taxa alta", "Quero taxa mais baixa", "Pago um monte de taxas...", "limite tinha diminuido", "Assisti esperando... antigamente tinham vários descontos... hoje não tem mais nada 🤨"), Frustração (CAIXA ALTA negativa), Advertência ("Não recomendo"); **Sarcasmo/Ironia/Deboche (Ex: "@itau São 86 anos de Alquimia!...Pedra Filosofal!", "Que ótimo, o app caiu de novo", "Acho uma afronta mostrar quanto a gente gasta... 😂", "aiii deixa só o itaú ver o cachorro quente...", "Muquirana que gasta tudo...", "puts a casa caiu")**; **Provocação/Comparação negativa com concorrente (Ex: "@abibfilho na dúvida vou chamar o @bancodobrasil...")**; **Acusação/Denúncia (Ex: "#ÉTudoGolpeDessaMiseravel👹", "BANCO ITAÚ SE RECUSA A PAGAR...", "Cancelando minha conta, Absurdo nao comprir uma ordem judicial...", "A propaganda e bonita, mas na prática? O que estão fazendo?", "Cala boca itau", "e fria] o banco nao procura vc]", "Pior banco da vida!!!!!! Mais de três meses para a liberação...", "‼️‼️‼️NÃO USEM O BANCO ITAÚ! ‼️‼️‼️ Dia 09/04/25 meu pai sofreu um sequestro...", "@leanvsz @itau se pronuncie", "@itau qual é o problema em liberar o dinheiro...", "Que merda hein itauzinho?", "Que situação, bloqueou o dinheiro...", "Acho que o Itaú deve ter gastado...", "Verdade,@ Itaú principalmente de vocês que enganam com consórcio", "Quando vão tomar uma atitude...", "Estão fazendo cliente de refém?????", "Cadê o dinheiro do Rodrigo Constantino???", "O que falta para liberar a conta...", "Este banco este deixando o #rodrigoconstantino morrer...", "Roubando dinheiro do Constantino????", "Itaú libera o dinheiro...", "Gastaram o $$$ do Constantino????", "Quem for de direita tem o dever de encerrar...", "Cancelando minha conta no Itaú!!!!", "Devolvam o $$$$ do #rodrigoconstantino !!!!!", "Tá na hora de tirar o patrocínio da CBF...", "@itau por que não liberaram o dinheiro...", "CANCELANDO na semana que vem minha contra Itaú empresas...", "Desbloqueiem a conta do @rodrigoconstantino...", "E o $$$ do Constantino????? Comeram???", "Se não desbloquearem as contas...", "Que banco é esse???? Militante também?", "Itaú agora é parceira oficial da corrupção.", "Quem financia bandido, vira cúmplice.", "Saia, esse banco vive de mãos dadas com a corrupção.", "Sai desse banco desumano...", "@goncaloassisbrasil esse banco Itaú é terrível")**, **Pedido de cancelamento explícito ("Cancelei com sussesso")**, **Comentários depreciativos vagos ("AQUELA TIPICA RICA NOJENTA...", "Pobre")**, **Perguntas acusatórias/retóricas sobre problemas graves ou sensíveis (Ex: "Cadê meus rendimentos que estavam no ITI?")**, **Mocking/Deboche (Ex: "KKKKKK QUEM TE COMHECE?", "Carai, parece uma entidade ...kkk")**. Emojis claramente negativos (😠, 😡, 👎, 😢, 💩, 🤮, 🤢, 😪). Comentários sobre política/governo associados negativamente ao banco. Afirmação "Bom, mas..." (Ex: "O banco Itaú é bom, mas o chat é meio devagar...") -> Negativo. Reclamação sobre spam ("NÃO QUERO RECEBER OFERTA DE CONSIGNADO."). Declaração de problema/sentimento negativo ("Meu Deus se eu olhar o meu 🤦🏻‍♀️🥲", "Pequenos gastos, grandes prejuízos 😅", "E consegui dormir com fome?").
-
-3.	Neutro: Busca/fornece informação, observação factual, **pergunta** (mesmo sobre problemas simples), **sugestão**, **pedido**, expressão de equilíbrio, **relato de experiência sem forte valência P/N**, ou reação ambígua. **Pedidos/Sugestões/Perguntas são GERALMENTE Neutros, mesmo com emojis positivos/negativos leves se o foco for o pedido/pergunta.**
-    *   Indicadores: **Perguntas objetivas/informativas/sobre problemas simples ("Como faço?", "Quando terá?", "O que isso tem a ver?", "@itau @jorgebenjor divo o app de vcs ta fora do ar?" [simples], "@itau oloko ele ainda tá vivo?", "@itau Os ruanistas?", "@cabedelos show em cabedelo*", "Pera,isso é pra mim saber ou eles?")**; Respostas a perguntas; **Pedidos/Sugestões diretas ("@itau Aumenta meu limite 👍", "@itau tragam #technotronic", "Me da dinheiro kkkk", "Me da um emprego🙏", "@itau Itaú ? Faz uma publi...", "@itau ITAÚ ME LEVA PRO THE TOWN", "@tatinhagrassi pede pra ele...", "@itau, ajuda nós que somos clientes Uniclass...", "Oferece o recovery @itau !!!", "@itau direct responder lá", "Preciso de ajuda", "@itau quando tu vai lançar a boa com um CDB...")**; Expressões de equilíbrio ("Ok", "0 sigo a vida com propagandas mesmo 😅", "Não gasto nada.", "Assinaturas não quer dizer...", "TODAS AS VEZES QUE ABRIREM UMA AGÊNCIA, ABRAM UMA SÓ PARA IDOSOS...", "Não devo nada."); **Relato de experiência sem forte valência P/N ("Sim mano, uso todo streaming...", "to precisando disso", "to precisando desse controle...", "Sou cliente Itaú", "EU sou cliente Itaú", "Parei de ver em roupinha pra o pet. 😂", "Isso que dá pensar entre comprar uma moto e um sapato...")**. Observações factuais/neutras ("O Rock in Rio é patrocinado", "Entendido", "Les alchimistes", "Ainda bem que não gosto de café 😂", "Juntando todas 😂😂😂", "Meu perfil de compras é aquele que de fato compra 😂", "Kkkkk o meu foi os cafezinhos mesmo", "se for o cafézinho da Deola, é o dobro"); **@Respostas vagas sem forte tom positivo/negativo (Ex: `@gabirichard eu tbem`, `@icaro.__ fortíssimo`, `@icaro.__ vemvem`, `@mendes_isabella seráãn?`, `@jorgediegopeixoto oi Jorge...`, `@jose07.dias o mlk q fala isso kkkk`, `@peraltamariane mulher não estraga a publi...`)**. Emojis ambíguos padrão isolados (🙏, 🤔, 👀, `[👈😀👈]`); Termos/siglas ("ESG"). Avisos/Declarações factuais ("@itau JORGE BEN JOR NAO DEIXE A POLITICA TE USAR", "Não conheço esse país").
-
-=== DEFINIÇÕES DE TEMA (Escolha UMA - Aplicar Regras de Prioridade Abaixo, SOMENTE SE NÃO FOR NC) ===
-***IMPORTANTE: Use EXATAMENTE um dos nomes de Tema 1 a 9 abaixo. Se Sentimento = Não Classificado, Tema = Não Classificado (Tema).***
-
-1.	Marca e Imagem: Percepção geral da marca Itaú ou submarcas, reputação, campanhas institucionais, patrocínios gerais. Críticas/elogios genéricos ao banco. Intenção de abrir/cancelar conta sem motivo específico. (Sentimento: P/N/Neutro)
-2.	Produtos e Serviços (Geral): Sobre cartões, contas, seguros, investimentos (CDB, LCI, íon), crédito (consignado, financiamento), taxas, limites, benefícios, portabilidade, consórcio, espólio. (Sentimento: P/N/Neutro)
-3.	Atendimento e Suporte: Sobre canais (agência, telefone, chat, SAC, Ouvidoria), qualidade do suporte, resolução de problemas pelo atendimento, demora, falta de retorno. (Sentimento: P/N/Neutro)
-4.	Plataformas Digitais (App/Site/ATM): Feedback sobre usabilidade, design, funcionalidades (PIX, TED, DOC, login, reconhecimento facial, cofrinho, controle de gastos), performance/disponibilidade de app, site, caixas eletrônicos. (Sentimento: P/N/Neutro)
-5.	Figuras Públicas e Representantes: Foco em atletas, influenciadores, creators, "laranjinhas", executivos, artistas (Jorge Ben Jor, Julia Iorio, Ari Segatto, Fran) associados a campanhas ou à marca. Comentários sobre o desempenho/influência deles na campanha. (Sentimento: P/N/Neutro)
-6.	Eventos e Campanhas Específicas: Discussões focadas em evento/campanha nomeado (Rock in Rio, The Town, Mapa Gastal), logística, experiência, tema. (Sentimento: P/N/Neutro)
-7.	Segurança e Fraude: Sobre golpes, fraudes (sequestro, Pix indevido), segurança da conta, phishing, roubos, cobranças indevidas percebidas como erro grave/golpe, bloqueio de contas/recursos (caso Constantino). (Sentimento: Geralmente Negativo, pode ser Neutro)
-8.	**Solicitação/Dúvida/Sugestão (Transversal):** Prioridade média. Usar quando o FOCO PRINCIPAL da mensagem (Sentimento **Neutro**) é uma pergunta, pedido ou sugestão sobre QUALQUER tema (produto, serviço, evento, plataforma, atendimento, etc.). Ex: "App fora do ar?", "Aumenta meu limite", "Faz publi com Davi", "Liberem acesso sala VIP", "Direct responder lá". (Sentimento: **Neutro**)
-9.	**Interação Social e Engajamento:** Prioridade MÍNIMA. Usar SOMENTE para: **Menção a usuário isolada (@username) - SEMPRE Positivo**; **@Respostas vagas (sem pergunta/pedido/sugestão/crítica/elogio direto ao Itaú/campanha) - Geralmente Neutro (Ex: `@gabirichard eu tbem`) ou Positivo (Ex: `@rafabarrosr aaaaa feliz demais 🧡`)**; Emojis P/N/Neutro ISOLADOS sem outro tema claro. (Sentimento: Conforme caso).
-10.	Não Classificado (Tema): Exclusivamente quando Sentimento = Não Classificado.
-
-=== REGRAS DE PRIORIDADE PARA TEMAS (Aplicar SOMENTE SE NÃO FOR NC) ===
-Aplique na seguinte ordem. Se a mensagem se encaixar em múltiplos temas, escolha o primeiro da lista que se aplicar:
-1.	Segurança e Fraude: (Prioridade Máxima) Se mencionar golpe, fraude, segurança, bloqueio de contas/recursos, cobrança indevida grave.
-2.	Plataformas Digitais (App/Site/ATM): Se o feedback (P/N/Neutro - *exceto se for SÓ pergunta/pedido/sugestão*) for especificamente sobre essas plataformas (app fora do ar, PIX não funciona, usabilidade, controle de gastos no app).
-3.	Atendimento e Suporte: Se o foco (P/N/Neutro - *exceto se for SÓ pergunta/pedido/sugestão*) for a interação com canais de atendimento (chat, SAC, agência, gerente).
-4.	Produtos e Serviços (Geral): Se sobre características, taxas, contratação/cancelamento, limites, rendimentos, portabilidade de produtos/serviços (conta, cartão, CDB, LCI, crédito, consórcio, espólio). (P/N/Neutro - *exceto se for SÓ pergunta/pedido/sugestão*).
-5.	**Solicitação/Dúvida/Sugestão (Transversal):** Se o foco principal for a pergunta/pedido/sugestão em si (Sentimento Neutro).
-6.	Eventos e Campanhas Específicas: Se claramente focado em um evento/campanha nomeado (Mapa Gastal, The Town).
-7.	Figuras Públicas e Representantes: Se o foco principal for a pessoa/representante (elogio/crítica a Julia Iorio, Ari Segatto, Jorge Ben).
-8.	Marca e Imagem: Para comentários gerais sobre a marca/reputação/patrocínios gerais ou críticas/elogios vagos sem especificar produto/serviço/canal/plataforma. Intenção de abrir/cancelar conta.
-9.	**Interação Social e Engajamento:** Para @username isolado (Positivo), @respostas vagas, emojis isolados. (Prioridade Mínima).
-10.	Não Classificado (Tema): Apenas se Sentimento = Não Classificado.
-
-=== INSTRUÇÕES ADICIONAIS DE CLASSIFICAÇÃO ===
-*   Formato de Resposta: EXATAMENTE DUAS LINHAS, SEMPRE:
-    Sentimento: [Nome Exato da Categoria de Sentimento]
-    Tema: [Nome Exato da Categoria de Tema]
-    (Não inclua NADA MAIS).
-*   **Priorize NÃO CLASSIFICADO:** Verifique TODAS as regras de NC primeiro. Se alguma aplicar, use NC/NC(Tema) e PARE.
-*   Aplicar Prioridade de Tema: Se não for NC, siga estritamente as regras de prioridade de tema.
-*   Detectar Sarcasmo/Ironia/Deboche: Identificar (contradições, elogios exagerados, comparações negativas, tom zombeteiro) e classificar como **Negativo**. Tema segue prioridade. Ex: "@itau São 86 anos...", "@abibfilho na dúvida vou chamar o @bancodobrasil...", "Acho uma afronta mostrar... 😂".
-*   **Menções:** `@` isolado -> NC. `@username` isolado -> Positivo/Interação. `@` + texto claro -> Classificar pelo texto. `@` + texto vago/resposta -> Neutro/Interação ou Positivo/Interação (se claramente positivo). `@` + texto incompreensível -> NC.
-*   Emojis: Emojis positivos em pedidos/sugestões/perguntas NÃO tornam o sentimento Positivo -> **Neutro**. Emojis negativos isolados -> Negativo/Interação. Emojis positivos isolados -> Positivo/Interação. Emojis neutros/risada isolados -> NC.
-*   **Perguntas:** Informativas/Problemas simples -> **Neutro/Solicitação ou Tema relevante**. Acusatórias/Problemas graves/Repetitivas/Emocionais -> **Negativo/Tema relevante (Segurança, Atendimento, etc.)**.
-*   Ênfase (!!!, ???): Modifica/reforça sentimento base. Isolado (`!!!!!!!!!!!!!!`) -> NC.
-*   **Mensagens Mistas:** Classifique pelo elemento PREDOMINANTE/FOCO PRINCIPAL (Reclamação/Problema Grave/Fraude/Sarcasmo > Elogio > Pergunta/Sugestão/Observação Neutra). Ex: Critica sertanejo mas elogia Itaú/Jorge Ben -> **Positivo / Figuras Públicas ou Marca e Imagem**. Ex: "Banco bom, mas chat devagar" -> **Negativo / Atendimento e Suporte**.
-*   "Absurdo": Se usado como gíria de intensidade positiva (Ex: "dicção absurda") -> Positivo. Se usado literalmente -> Negativo. Analisar contexto.
-
-Agora, classifique a seguinte mensagem:
-{comment}
-"""
-
-
-# --- Prompt para Geração de Insights ---
-# ... (sem alterações aqui, mantenha como estava)
-prompt_geracao_insights = """
-Persona: Você é um Analista de Social Listening Sênior, especializado no Banco Itaú e seu ecossistema. Sua tarefa é interpretar um resumo de dados de classificação de sentimentos e temas de comentários de clientes/público e gerar insights acionáveis.
-
-Contexto: Você recebeu um resumo da análise de {total_comentarios_analisados} comentários. As classificações foram feitas seguindo critérios específicos para o Itaú (Sentimento: Positivo, Negativo, Neutro, NC; Temas: Marca, Produtos, Atendimento, Plataformas, Figuras Públicas, Eventos, Segurança, Interação, Solicitação, NC).
-
-Dados de Resumo Fornecidos:
-*   Distribuição Geral de Sentimentos (Total: {total_comentarios_analisados}):
-    - Positivo: {count_pos} ({perc_pos:.1f}%)
-    - Negativo: {count_neg} ({perc_neg:.1f}%)
-    - Neutro: {count_neu} ({perc_neu:.1f}%)
-    - Não Classificado / Erros: {count_nc_err} ({perc_nc_err:.1f}%)
-*   Top 5 Temas Mais Comentados (Excluindo Interação Social, NC e Erros. Total destes temas: {total_temas_insights}):
-{top_temas_formatado}
-*   Top 3 Temas Associados ao Sentimento NEGATIVO (Total de comentários negativos com tema válido: {total_temas_neg}):
-{top_temas_negativos_formatado}
-
-Tarefa: Com base EXCLUSIVAMENTE nos dados de resumo fornecidos acima, elabore um bloco conciso de "Insights e Percepções Acionáveis". Organize sua resposta usando os seguintes tópicos em Markdown:
-
-### Principais Destaques Positivos:
-*   (Comente a proporção de comentários positivos. Se houver dados nos Top Temas, relacione o sentimento positivo a algum tema específico, se possível inferir indiretamente. Ex: "Alto volume positivo pode estar ligado a X tema, se este for predominante.")
-
-### Principais Pontos de Atenção (Negativos):
-*   (Comente a proporção de comentários negativos. **Crucialmente, foque nos 'Top 3 Temas Associados ao Sentimento NEGATIVO'**. Identifique as principais áreas de reclamação/crítica. Chame atenção para possíveis "telhados de vidro" ou problemas recorrentes nesses temas.)
-
-### Oportunidades e Sugestões:
-*   (Analise a proporção de comentários Neutros. Se o tema 'Solicitação/Dúvida/Sugestão' aparecer nos Top Temas, indique oportunidade de esclarecimento ou melhoria com base no alto volume de perguntas/pedidos. Se temas negativos recorrentes aparecerem, sugira investigação ou ação específica para mitigar.)
-
-### Observações Gerais:
-*   (Faça um balanço geral. Comente se a distribuição de sentimentos parece saudável ou preocupante. Mencione se a proporção de 'Não Classificado/Erros' é alta, indicando possíveis problemas na coleta ou classificação - *uma % alta de NC após este refinamento pode indicar muitos comentários realmente sem contexto/off-topic ou necessidade de mais ajustes*). Destaque algum tema específico que dominou a conversa, se for o caso.)
-
-Instruções Adicionais:
-*   Seja direto e focado em insights que possam gerar ações para o Itaú.
-*   Baseie-se APENAS nos dados fornecidos no resumo. Não invente informações ou temas não listados.
-*   Se algum dado crucial estiver faltando ou for insuficiente (ex: muito poucos comentários negativos para tirar conclusões sobre temas negativos), mencione essa limitação.
-*   Mantenha a linguagem profissional e analítica.
-*   Use bullet points (*) para listar os insights dentro de cada tópico.
-"""
-
-
-# --- Listas de Categorias Válidas ---
-categorias_sentimento_validas = ["Positivo", "Negativo", "Neutro", "Não Classificado"]
-categorias_tema_validas = [
-    "Marca e Imagem",
-    "Produtos e Serviços (Geral)",
-    "Atendimento e Suporte",
-    "Plataformas Digitais (App/Site/ATM)",
-    "Figuras Públicas e Representantes",
-    "Eventos e Campanhas Específicas",
-    "Segurança e Fraude",
-    "Solicitação/Dúvida/Sugestão (Transversal)",
-    "Interação Social e Engajamento",
-    "Não Classificado (Tema)"
-]
-categorias_erro = ["Erro Parsing", "Erro API"]
-categorias_erro_tema_especifico = ["Erro API (Timeout)", "Erro API (Geral)", "Erro API (Modelo não iniciado)", "Erro API (Conteúdo Bloqueado)"]
-todas_categorias_erro = list(set(categorias_erro + categorias_erro_tema_especifico))
-categorias_excluir_sentimento = ["Não Classificado"] + todas_categorias_erro
-categorias_excluir_tema = ["Não Classificado (Tema)", "Interação Social e Engajamento"] + todas_categorias_erro
-
-
-# --- Função para Analisar um Comentário ---
-# ... (Lógica interna da função permanece a mesma) ...
-def analisar_comentario(comentario, modelo_gemini):
-    if not comentario or not isinstance(comentario, str) or comentario.strip() == "": return "Não Classificado", "Não Classificado (Tema)"
-    if not modelo_gemini: return "Erro API", "Erro API (Modelo não iniciado)"
-    prompt_com_comentario = seu_prompt_completo.format(comment=comentario)
-    try:
-        safety_settings = { "HARM_CATEGORY_HARASSMENT": "BLOCK_NONE", "HARM_CATEGORY_HATE_SPEECH": "BLOCK_NONE", "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_NONE", "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE" }
-        request_options = {"timeout": 60}
-        response = modelo_gemini.generate_content( prompt_com_comentario, safety_settings=safety_settings, request_options=request_options )
-        texto_resposta = response.text.strip(); sentimento_extraido = "Erro Parsing"; tema_extraido = "Erro Parsing"; linhas = texto_resposta.split('\n')
-        for linha in linhas:
-            linha_strip = linha.strip()
-            if linha_strip.lower().startswith("sentimento:"): sentimento_extraido = linha_strip.split(":", 1)[1].strip()
-            elif linha_strip.lower().startswith("tema:"): tema_extraido = linha_strip.split(":", 1)[1].strip()
-        if sentimento_extraido == "Erro Parsing" or tema_extraido == "Erro Parsing": return "Erro Parsing", "Erro Parsing"
-        if sentimento_extraido not in categorias_sentimento_validas: return "Erro Parsing", "Erro Parsing"
-        if sentimento_extraido == "Não Classificado": return "Não Classificado", "Não Classificado (Tema)"
-        else:
-             if tema_extraido not in categorias_tema_validas or tema_extraido == "Não Classificado (Tema)": return sentimento_extraido, "Erro Parsing"
-             else: return sentimento_extraido, tema_extraido
-    except genai.types.StopCandidateException as e: return "Erro API", "Erro API (Conteúdo Bloqueado)"
-    except Exception as e:
-        error_type = "Erro API (Geral)"; error_message = str(e).lower()
-        if "timeout" in error_message or "deadline exceeded" in error_message: error_type = "Erro API (Timeout)"
-        return "Erro API", error_type
-
-# --- Função para Gerar Insights ---
-# ... (Lógica interna da função permanece a mesma) ...
-def gerar_insights(df_resultados_func, modelo_gemini):
-    if df_resultados_func is None or df_resultados_func.empty: return "Não há dados suficientes para gerar insights."
-    if not modelo_gemini: return "*Erro: Modelo Gemini não inicializado. Não é possível gerar insights.*"
-    try:
-        total_analisados_func = len(df_resultados_func); sent_counts_total = df_resultados_func['Sentimento_Classificado'].value_counts(); count_pos_func = sent_counts_total.get('Positivo', 0); count_neg_func = sent_counts_total.get('Negativo', 0); count_neu_func = sent_counts_total.get('Neutro', 0); count_nc_err_func = total_analisados_func - (count_pos_func + count_neg_func + count_neu_func); perc_pos_func = (count_pos_func / total_analisados_func * 100) if total_analisados_func > 0 else 0; perc_neg_func = (count_neg_func / total_analisados_func * 100) if total_analisados_func > 0 else 0; perc_neu_func = (count_neu_func / total_analisados_func * 100) if total_analisados_func > 0 else 0; perc_nc_err_func = (count_nc_err_func / total_analisados_func * 100) if total_analisados_func > 0 else 0; df_tema_insights = df_resultados_func[~df_resultados_func['Tema_Classificado'].isin(categorias_excluir_tema)].copy(); tema_counts_insights = df_tema_insights['Tema_Classificado'].value_counts(); top_temas_formatado_func = ""; total_temas_insights_func = 0
-        if not tema_counts_insights.empty: total_temas_insights_func = tema_counts_insights.sum(); top_temas_formatado_func = "\n".join([ f"    - {tema}: {count} ({count / total_temas_insights_func * 100:.1f}%)" for tema, count in tema_counts_insights.head(5).items()]) if total_temas_insights_func > 0 else "    - Nenhum tema relevante classificado."
-        else: top_temas_formatado_func = "    - Nenhum tema relevante classificado."
-        df_negativos = df_resultados_func[df_resultados_func['Sentimento_Classificado'] == 'Negativo'].copy(); df_negativos_filtrados = df_negativos[~df_negativos['Tema_Classificado'].isin(categorias_excluir_tema)]; tema_neg_counts = df_negativos_filtrados['Tema_Classificado'].value_counts(); top_temas_negativos_formatado_func = ""; total_temas_neg_func = 0
-        if not tema_neg_counts.empty: total_temas_neg_func = tema_neg_counts.sum(); top_temas_negativos_formatado_func = "\n".join([ f"    - {tema}: {count} ({count / total_temas_neg_func * 100:.1f}%)" for tema, count in tema_neg_counts.head(3).items()]) if total_temas_neg_func > 0 else "    - Nenhum tema negativo relevante classificado."
-        else: top_temas_negativos_formatado_func = "    - Nenhum tema negativo relevante classificado (ou nenhum comentário negativo com tema válido)."
-        prompt_final_insights = prompt_geracao_insights.format(total_comentarios_analisados=total_analisados_func, count_pos=count_pos_func, perc_pos=perc_pos_func, count_neg=count_neg_func, perc_neg=perc_neg_func, count_neu=count_neu_func, perc_neu=perc_neu_func, count_nc_err=count_nc_err_func, perc_nc_err=perc_nc_err_func, total_temas_insights=total_temas_insights_func, top_temas_formatado=top_temas_formatado_func, total_temas_neg=total_temas_neg_func, top_temas_negativos_formatado=top_temas_negativos_formatado_func)
-        safety_settings = { "HARM_CATEGORY_HARASSMENT": "BLOCK_NONE", "HARM_CATEGORY_HATE_SPEECH": "BLOCK_NONE", "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_NONE", "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE"}; request_options = {"timeout": 90}
-        response_insights = modelo_gemini.generate_content(prompt_final_insights, safety_settings=safety_settings, request_options=request_options)
-        if response_insights and hasattr(response_insights, 'text'): st.session_state.insights_generated = response_insights.text.strip(); return st.session_state.insights_generated
-        else: error_info = "Resposta da API vazia ou inválida."; # ...(código de tratamento de erro igual)...
-        if response_insights and hasattr(response_insights, 'prompt_feedback'): error_info = f"Possível bloqueio pela API. Feedback: {response_insights.prompt_feedback}"
-        st.warning(f"Não foi possível gerar insights: {error_info}", icon="⚠️"); st.session_state.insights_generated = f"*Não foi possível gerar insights: {error_info}*"; return st.session_state.insights_generated
-    except Exception as e: st.error(f"Erro durante a geração de insights: {e}", icon="🚨"); st.session_state.insights_generated = f"*Ocorreu um erro inesperado durante a geração dos insights: {str(e)}*"; return st.session_state.insights_generated
-
 # --- Interface Principal ---
 st.title("📊 Aplicativo para análise de sentimento e temática automatizado por IA")
 # Texto Introdutório ATUALIZADO
@@ -280,36 +97,95 @@ st.markdown("---")
 st.sidebar.divider()
 st.sidebar.header("Controles")
 uploaded_file = st.sidebar.file_uploader(
-    "1. Escolha o arquivo (.csv ou .xlsx)", type=["csv", "xlsx"], key="file_uploader",
-    help="Faça upload de um arquivo CSV ou Excel que contenha uma coluna chamada 'Conteúdo' com os textos a serem analisados."
+    "1. Escolha o arquivo (.csv, .xlsx ou .parquet)", type=["csv", "xlsx", "parquet"], key="file_uploader",
+    help="Faça upload de um arquivo CSV, Excel ou Parquet que contenha uma coluna chamada 'Conteúdo' com os textos a serem analisados."
 )
 
 # Nome da Coluna ATUALIZADO para 'Conteúdo' (C maiúsculo)
 coluna_conteudo = 'Conteúdo'
 
+@st.cache_data(max_entries=4, show_spinner=False)
+def obter_colunas_arquivo(hash_arquivo, nome_arquivo, _conteudo): return listar_colunas_arquivo(_conteudo, nome_arquivo)
+
+@st.cache_data(max_entries=2, show_spinner="Lendo o arquivo...")
+def carregar_arquivo(hash_arquivo, nome_arquivo, colunas, _conteudo): return ler_arquivo_comentarios(_conteudo, nome_arquivo, list(colunas)) # Reruns reaproveitam o arquivo já lido
+
+conteudo_arquivo = None; hash_arquivo = None; colunas_arquivo = []; colunas_extras = []; erro_leitura_colunas = None
+if uploaded_file is not None:
+    conteudo_arquivo = uploaded_file.getvalue(); hash_arquivo = CheckpointAnalise.calcular_hash(conteudo_arquivo)
+    try: colunas_arquivo = obter_colunas_arquivo(hash_arquivo, uploaded_file.name, conteudo_arquivo)
+    except Exception as e: erro_leitura_colunas = e # Exibido na área principal
+    colunas_extras = st.sidebar.multiselect("Colunas extras no resultado", [coluna for coluna in colunas_arquivo if coluna != coluna_conteudo], key="colunas_extras", help="Só a coluna 'Conteúdo' é lida para a análise. Selecione outras colunas (data, canal, link...) para carregá-las também e incluí-las na pré-visualização e no download.")
+
 botao_habilitado = st.session_state.get('api_key_configured', False) and uploaded_file is not None
 analisar_btn = st.sidebar.button( "2. Analisar Comentários", key="analyze_button", disabled=(not botao_habilitado), help="Clique para iniciar a análise dos comentários na coluna 'Conteúdo' do arquivo carregado.")
 if not st.session_state.get('api_key_configured', False): st.sidebar.warning("API Key do Google não configurada ou inválida.", icon="⚠️")
 if not uploaded_file: st.sidebar.info("Aguardando upload do arquivo...", icon="📤")
 if botao_habilitado: st.sidebar.info("Pronto para analisar!", icon="✅")
 
+with st.sidebar.expander("Execução (desempenho)"):
+    num_workers = st.slider("Chamadas simultâneas à API", min_value=1, max_value=32, value=8, key="num_workers", help="Quantidade de comentários enviados ao Gemini em paralelo.")
+    tamanho_lote = st.slider("Comentários por chamada (lote)", min_value=1, max_value=50, value=1, key="tamanho_lote", help="Envia vários comentários numerados na mesma chamada, sem repetir o prompt para cada um. Itens que voltarem incompletos são reenviados individualmente.")
+    pre_classificar = st.checkbox("Classificar comentários triviais localmente", value=True, key="pre_classificar", help="Menções isoladas, risadas, saudações, emojis isolados e críticas curtas como 'Péssimo' são rotulados por regras locais, sem chamada à API.")
+    limiar_confianca_local = st.slider("Confiança mínima das regras locais", min_value=0.70, max_value=1.00, value=0.90, step=0.01, key="limiar_confianca_local", disabled=not pre_classificar, help="Só as regras com confiança igual ou maior são aplicadas; o restante vai para o Gemini. Valores menores também rotulam emojis isolados e 'Ok'.")
+    agrupar_duplicados = st.checkbox("Agrupar comentários duplicados", value=True, key="agrupar_duplicados", help="Comentários iguais (ignorando @menções, emojis, maiúsculas e pontuação) são classificados uma única vez e o resultado é copiado para todo o grupo.")
+    limiar_similaridade = st.slider("Similaridade mínima para agrupar", min_value=0.85, max_value=1.00, value=1.00, step=0.01, key="limiar_similaridade", disabled=not agrupar_duplicados, help="1.00 agrupa apenas textos idênticos após a normalização (mesmo padrão da linha de comando). Valores menores também agrupam variações próximas (MinHash/LSH), mas podem juntar comentários opostos que diferem por poucas palavras, como uma frase com e sem \"não\".")
+    resposta_json = st.checkbox("Resposta estruturada (JSON)", value=False, key="resposta_json", help="O Gemini responde um JSON restrito às categorias válidas, em vez de duas linhas de texto: elimina os erros de formato ('Erro Parsing') e as chamadas repetidas que eles causam.")
+    formato_resposta = FORMATO_JSON if resposta_json else FORMATO_TEXTO
+    limite_rpm = st.number_input("Limite de requisições por minuto (0 = sem limite)", min_value=0, max_value=10000, value=0, step=10, key="limite_rpm", help="Teto de chamadas por minuto para não estourar a cota da API Key. Em caso de erros 429/timeout, as chamadas são repetidas com espera crescente e a quantidade de chamadas simultâneas é reduzida automaticamente.")
+
+with st.sidebar.expander("Modo amostragem (estimativa rápida)"):
+    modo_amostragem = st.checkbox("Estimar por amostragem", value=False, key="modo_amostragem", help="Classifica só uma amostra aleatória estratificada e estima NPS, sentimentos e temas de todo o arquivo, com intervalos de confiança. Útil para monitoramento de crise em exportações grandes.")
+    opcao_sem_estrato = "(sem estratificação)"
+    coluna_estrato = st.selectbox("Estratificar por", [opcao_sem_estrato] + colunas_extras, key="coluna_estrato", disabled=not modo_amostragem, help="A amostra mantém a proporção de cada valor desta coluna (datas são agrupadas por dia). Só aparecem as colunas escolhidas em 'Colunas extras no resultado'.")
+    coluna_estrato = None if coluna_estrato == opcao_sem_estrato else coluna_estrato
+    tamanho_maximo_amostra = st.number_input("Tamanho máximo da amostra", min_value=TAMANHO_RODADA_AMOSTRA, max_value=100_000, value=2000, step=TAMANHO_RODADA_AMOSTRA, key="tamanho_maximo_amostra", disabled=not modo_amostragem)
+    confianca_amostragem = st.selectbox("Nível de confiança", [0.90, 0.95, 0.99], index=1, format_func=lambda nivel: f"{nivel:.0%}", key="confianca_amostragem", disabled=not modo_amostragem)
+    parar_na_margem = st.checkbox("Parar ao atingir a margem de erro", value=True, key="parar_na_margem", disabled=not modo_amostragem, help=f"Classifica em rodadas de {TAMANHO_RODADA_AMOSTRA} comentários e para quando a maior margem de erro das participações de Positivo, Neutro e Negativo fica abaixo do valor escolhido.")
+    margem_alvo = st.slider("Margem de erro desejada (p.p.)", min_value=1.0, max_value=10.0, value=3.0, step=0.5, key="margem_alvo", disabled=not (modo_amostragem and parar_na_margem))
+
+@st.cache_resource
+def obter_fila_analise(): return FilaAnalise()
+
+fila_analise = None; usar_fila = False
+with st.sidebar.expander("Fila de análises (segundo plano)"):
+    try: fila_analise = obter_fila_analise()
+    except sqlite3.Error as e: st.warning(f"Fila indisponível: {e}", icon="⚠️")
+    if fila_analise:
+        usar_fila = st.checkbox("Enviar a análise para a fila", value=False, key="usar_fila", help="A análise roda em processos separados (workers), e não nesta aba: fechar o navegador ou reiniciar o app não a interrompe, e várias análises grandes podem rodar ao mesmo tempo. O modo amostragem e o checkpoint não se aplicam à fila.")
+        workers_fila = fila_analise.workers_ativos(); st.caption(f"Workers ativos: {len(workers_fila)}" + (f" ({', '.join(sorted({rotulo for rotulo, _ in workers_fila}))})" if workers_fila else " — inicie um abaixo ou rode `python fila_analise.py` no servidor."))
+        if st.button("Iniciar worker com esta API Key", key="iniciar_worker", disabled=not st.session_state.api_key_configured, help="Sobe um processo de worker independente com a API Key configurada, as chamadas simultâneas e o limite por minuto de 'Execução (desempenho)'. Para dividir a carga entre várias chaves, use GOOGLE_API_KEYS=chave1,chave2 python fila_analise.py."):
+            st.toast(f"Worker iniciado (PID {iniciar_workers_em_segundo_plano([st.session_state.api_key_input_value], num_workers, limite_rpm)}).", icon="⚙️")
+        trabalhos_recentes = fila_analise.listar(10)
+        if trabalhos_recentes:
+            rotulos_trabalhos = {trabalho['id']: f"{trabalho['nome_arquivo']} — {trabalho['estado']} ({trabalho['processados']}/{trabalho['total']}) — {time.strftime('%d/%m %H:%M', time.localtime(trabalho['criado_em']))}" for trabalho in trabalhos_recentes}
+            opcoes_trabalhos = [None] + list(rotulos_trabalhos)
+            if st.session_state.trabalho_id not in opcoes_trabalhos: opcoes_trabalhos.append(st.session_state.trabalho_id)
+            st.session_state.trabalho_id = st.selectbox("Acompanhar trabalho", opcoes_trabalhos, index=opcoes_trabalhos.index(st.session_state.trabalho_id), format_func=lambda id_trabalho: "(nenhum)" if id_trabalho is None else rotulos_trabalhos.get(id_trabalho, id_trabalho), help="Trabalhos enviados por qualquer sessão; o andamento é lido da fila, então pode ser acompanhado depois de fechar e reabrir o app.")
+
+@st.cache_resource
+def obter_cache_classificacao(): return CacheClassificacao()
+
+cache_classificacao = None
+with st.sidebar.expander("Cache de classificações"):
+    try: cache_classificacao = obter_cache_classificacao()
+    except sqlite3.Error as e: st.warning(f"Cache indisponível: {e}", icon="⚠️")
+    if cache_classificacao:
+        usar_cache = st.checkbox("Reutilizar classificações anteriores", value=True, key="usar_cache", help="Comentários já classificados com o mesmo prompt e modelo não são enviados de novo à API.")
+        contador_cache = st.empty()
+        if st.button("Limpar cache", key="limpar_cache"): cache_classificacao.limpar(); st.toast("Cache de classificações limpo.", icon="🧹")
+        contador_cache.caption(f"Acertos: {cache_classificacao.acertos} | Falhas: {cache_classificacao.falhas} | Entradas: {cache_classificacao.tamanho()}")
+        if not usar_cache: cache_classificacao = None
+painel_telemetria = st.sidebar.empty() # Preenchido no fim do script, depois da análise e dos insights
+
 
 # --- Área Principal: Pré-visualização e Resultados ---
-df_original = None; df_para_analise = None; total_comentarios_para_analisar = 0
+df_original = None; df_para_analise = None; total_comentarios_para_analisar = 0; checkpoint_analise = None; resultados_checkpoint = {}; retomar_analise = False; reprocessar_erros_btn = False
 if uploaded_file is not None:
     try:
-        if uploaded_file.name.endswith('.csv'):
-            try: df_original = pd.read_csv(uploaded_file)
-            except UnicodeDecodeError: uploaded_file.seek(0); df_original = pd.read_csv(uploaded_file, encoding='latin1')
-            # Adicional: Tentar detectar separador se a leitura falhar inicialmente
-            except pd.errors.ParserError:
-                 uploaded_file.seek(0)
-                 st.warning("Não foi possível ler o CSV com ',', tentando com ';'", icon="⚠️")
-                 try: df_original = pd.read_csv(uploaded_file, sep=';')
-                 except UnicodeDecodeError: uploaded_file.seek(0); df_original = pd.read_csv(uploaded_file, sep=';', encoding='latin1')
-                 except Exception as inner_e: st.error(f"Erro ao tentar ler CSV com ';': {inner_e}", icon="🚨"); df_original = None
-
-        else: df_original = pd.read_excel(uploaded_file)
+        if erro_leitura_colunas is not None: raise erro_leitura_colunas
+        # Lê só a coluna de comentários e as extras escolhidas; sem a coluna, um frame vazio basta para o erro abaixo
+        df_original = carregar_arquivo(hash_arquivo, uploaded_file.name, tuple([coluna_conteudo] + colunas_extras), conteudo_arquivo) if coluna_conteudo in colunas_arquivo else pd.DataFrame(columns=colunas_arquivo)
 
         # Verifica se a coluna 'Conteúdo' existe
         if df_original is not None and coluna_conteudo not in df_original.columns:
@@ -317,10 +193,10 @@ if uploaded_file is not None:
             df_original = None # Impede processamento adicional
         elif df_original is not None:
             # Prepara o DataFrame para análise: remove linhas com conteúdo vazio/nulo
-            df_para_analise = df_original.copy()
-            df_para_analise.dropna(subset=[coluna_conteudo], inplace=True)
-            df_para_analise = df_para_analise[df_para_analise[coluna_conteudo].astype(str).str.strip() != '']
+            df_para_analise = filtrar_comentarios_validos(df_original, coluna_conteudo)
             total_comentarios_para_analisar = len(df_para_analise)
+            checkpoint_analise = CheckpointAnalise(hash_arquivo)
+            resultados_checkpoint = {indice: resultado for indice, resultado in checkpoint_analise.carregar().items() if indice in df_para_analise.index}
 
             # Mostra pré-visualização dos dados originais
             st.subheader("Pré-visualização dos dados originais:")
@@ -330,61 +206,220 @@ if uploaded_file is not None:
             else:
                  st.info(f"Total de comentários válidos para análise: **{total_comentarios_para_analisar}**", icon="ℹ️")
 
+            # Oferece retomar uma análise anterior deste mesmo arquivo (checkpoint em disco)
+            if resultados_checkpoint:
+                total_erros_checkpoint = sum(1 for sentimento, tema, _ in resultados_checkpoint.values() if sentimento in todas_categorias_erro or tema in todas_categorias_erro)
+                st.info(f"Este arquivo já foi analisado antes: **{len(resultados_checkpoint)}** de {total_comentarios_para_analisar} comentários classificados ({total_erros_checkpoint} com erro).", icon="💾")
+                col_retomar, col_reprocessar = st.columns(2)
+                with col_retomar: retomar_analise = st.checkbox("Retomar análise anterior (classificar apenas o que falta)", value=True, key="retomar_analise")
+                with col_reprocessar: reprocessar_erros_btn = st.button(f"🔁 Reprocessar apenas linhas com erro ({total_erros_checkpoint})", key="reprocessar_erros", disabled=(total_erros_checkpoint == 0 or not model), help="Reenvia à API somente as linhas marcadas com erro (e as que ainda não foram classificadas), mantendo as demais classificações do checkpoint.")
+
     except Exception as e:
         st.error(f"Erro ao ler ou processar o arquivo '{uploaded_file.name}': {e}", icon="🚨")
         df_original = None; df_para_analise = None
 
 results_container = st.container()
 
+# --- Gráficos (resultados finais e painel ao vivo) ---
+INTERVALO_ATUALIZACAO_SEGUNDOS = 2.0 # Progresso e painel ao vivo são redesenhados no máximo uma vez por intervalo
+
+def formatar_duracao(segundos):
+    minutos, segundos = divmod(int(round(segundos)), 60); horas, minutos = divmod(minutos, 60)
+    return f"{horas}h {minutos:02d}min" if horas else f"{minutos}min {segundos:02d}s" if minutos else f"{segundos}s"
+
+def criar_grafico_sentimento(agregacao, titulo='Sentimentos (Excluindo Não Classif./Erros)'):
+    df_plot_sent = pd.DataFrame({'Sentimento': agregacao.sentimentos_grafico.index.astype(str), 'Volume': agregacao.sentimentos_grafico.values}) # Já na ordem Positivo, Neutro, Negativo
+    fig_sent = px.pie(df_plot_sent, names='Sentimento', values='Volume', hole=0.4, color='Sentimento', color_discrete_map={'Positivo': '#28a745', 'Negativo': '#dc3545', 'Neutro': '#ffc107'}, title=titulo)
+    fig_sent.update_traces(textposition='outside', textinfo='percent+label', hovertemplate="<b>%{label}</b><br>Volume: %{value}<br>Percentual: %{percent:.1%}<extra></extra>"); fig_sent.update_layout(showlegend=False, title_x=0.5, height=350, margin=dict(l=10, r=10, t=40, b=10))
+    return fig_sent
+
+def criar_grafico_temas(agregacao, titulo='Principais Temas (Excluindo NC/Erro/Interação)'):
+    tema_counts_chart = agregacao.temas_grafico; tema_perc_chart = (tema_counts_chart / tema_counts_chart.sum() * 100)
+    df_plot_tema = pd.DataFrame({'Tema': tema_counts_chart.index.astype(str), 'Volume': tema_counts_chart.values, 'Percentual': tema_perc_chart.values})
+    fig_tema = px.bar(df_plot_tema, x='Tema', y='Volume', color_discrete_sequence=['#007bff']*len(df_plot_tema), title=titulo, hover_data={'Tema': False, 'Volume': True, 'Percentual': ':.1f%'}, text='Volume')
+    fig_tema.update_traces(textposition='outside'); fig_tema.update_layout(xaxis_title=None, yaxis_title="Volume Bruto", title_x=0.5, height=350, margin=dict(l=10, r=10, t=40, b=10)); fig_tema.update_xaxes(tickangle= -30)
+    return fig_tema
+
+def exibir_painel_ao_vivo(painel, agregacao, numero_atualizacao):
+    """Redesenha NPS e gráficos parciais no placeholder; as chaves mudam a cada atualização para não repetir IDs no mesmo rerun."""
+    with painel.container():
+        nps_col, chart_col1, chart_col2 = st.columns([1, 2, 2])
+        with nps_col: st.markdown("##### NPS Social (parcial)"); st.metric(label="(Escala 0-10)", value=f"{agregacao.nps:.1f}" if agregacao.nps is not None else "N/A"); st.caption(f"{agregacao.total} comentários classificados até agora.")
+        with chart_col1:
+            if agregacao.total_sentimentos_grafico > 0: st.plotly_chart(criar_grafico_sentimento(agregacao, 'Sentimentos (parcial)'), use_container_width=True, key=f"grafico_sentimento_ao_vivo_{numero_atualizacao}")
+        with chart_col2:
+            if agregacao.temas_grafico.sum() > 0: st.plotly_chart(criar_grafico_temas(agregacao, 'Principais Temas (parcial)'), use_container_width=True, key=f"grafico_temas_ao_vivo_{numero_atualizacao}")
+
 # --- Lógica de Análise ---
-# ... (sem alterações aqui) ...
-if analisar_btn and df_para_analise is not None:
+if analisar_btn and usar_fila and df_para_analise is not None:
+    # Fila: só grava o arquivo e os parâmetros; os workers classificam e esta sessão apenas acompanha
+    if total_comentarios_para_analisar == 0: st.warning(f"Nenhum comentário válido encontrado na coluna '{coluna_conteudo}' para análise.", icon="⚠️")
+    else:
+        parametros_fila = {'confianca_local': limiar_confianca_local if pre_classificar else None, 'limiar': limiar_similaridade if agrupar_duplicados else None, 'lote': tamanho_lote, 'formato_resposta': formato_resposta}
+        st.session_state.trabalho_id = fila_analise.enviar(conteudo_arquivo, uploaded_file.name, coluna_conteudo, colunas_extras, total_comentarios_para_analisar, parametros_fila)
+        st.toast(f"Análise de {total_comentarios_para_analisar} comentários enviada para a fila.", icon="📥")
+        if not fila_analise.workers_ativos(): st.warning("Nenhum worker ativo: a análise fica pendente até um worker ser iniciado na barra lateral (Fila de análises) ou com `python fila_analise.py`.", icon="⚙️")
+elif (analisar_btn or reprocessar_erros_btn) and df_para_analise is not None:
     if total_comentarios_para_analisar == 0: st.warning(f"Nenhum comentário válido encontrado na coluna '{coluna_conteudo}' para análise.", icon="⚠️")
     elif not model: st.error("Erro: Modelo Gemini não inicializado. Verifique a configuração da API Key na barra lateral.", icon="🚨")
     else:
-        st.session_state.analysis_done = False; st.session_state.df_results = None; st.session_state.insights_generated = None
-        with st.spinner(f"Analisando {total_comentarios_para_analisar} comentários... Isso pode levar alguns minutos."):
-            progress_bar = st.progress(0.0); status_text = st.empty(); resultados_sentimento = []; resultados_tema = []; df_copy_analise = df_para_analise.copy(); start_time = time.time()
-            for i, comentario in enumerate(df_copy_analise[coluna_conteudo]):
-                sentimento, tema = analisar_comentario(str(comentario), model); resultados_sentimento.append(sentimento); resultados_tema.append(tema); progresso = (i + 1) / total_comentarios_para_analisar; progress_bar.progress(progresso); status_text.text(f"Analisando: {i+1}/{total_comentarios_para_analisar} ({progresso:.1%})")
-            end_time = time.time(); tempo_total = end_time - start_time; progress_bar.empty(); status_text.success(f"✅ Análise concluída em {tempo_total:.2f} segundos!", icon="🎉")
-            df_copy_analise['Sentimento_Classificado'] = resultados_sentimento; df_copy_analise['Tema_Classificado'] = resultados_tema; st.session_state.df_results = df_copy_analise; st.session_state.analysis_done = True
+        st.session_state.analysis_done = False; st.session_state.df_results = None; st.session_state.insights_generated = None; st.session_state.resumo_retentativas = None; st.session_state.telemetria = TelemetriaAPI(); st.session_state.estimativa = None
+        amostrar = modo_amostragem and not reprocessar_erros_btn
+        # Define o que ainda precisa ir para a API: tudo, só o que falta no checkpoint, ou só as linhas com erro
+        if amostrar:
+            # Amostragem: a ordem estratificada (fixa para o arquivo) define a amostra; rótulos que já estão no checkpoint são reaproveitados
+            resultados_finais = dict(resultados_checkpoint); estratos = preparar_estratos(df_para_analise[coluna_estrato]) if coluna_estrato else pd.Series(VALOR_SEM_ESTRATO, index=df_para_analise.index)
+            ordem_amostra = ordenar_amostra_estratificada(estratos, semente=int(hash_arquivo[:8], 16))[:tamanho_maximo_amostra]; indices_pendentes = [indice for indice in ordem_amostra if indice not in resultados_finais]
+        elif reprocessar_erros_btn: resultados_finais = dict(resultados_checkpoint); indices_pendentes = [indice for indice in df_para_analise.index if indice not in resultados_checkpoint or resultados_checkpoint[indice][0] in todas_categorias_erro or resultados_checkpoint[indice][1] in todas_categorias_erro]
+        elif retomar_analise: resultados_finais = dict(resultados_checkpoint); indices_pendentes = [indice for indice in df_para_analise.index if indice not in resultados_checkpoint]
+        else: checkpoint_analise.remover(); resultados_finais = {}; indices_pendentes = list(df_para_analise.index)
+        total_pendentes = len(indices_pendentes)
+        with st.spinner(f"Analisando {'uma amostra de até ' + str(len(ordem_amostra)) if amostrar else total_pendentes} comentários... Isso pode levar alguns minutos."):
+            progress_bar = st.progress(0.0); status_text = st.empty(); status_amostragem = st.empty(); painel_ao_vivo = st.empty(); df_copy_analise = df_para_analise.copy(); controle_taxa = ControleTaxa(limite_rpm, num_workers); start_time = time.time()
+            estatisticas = {'locais': 0, 'para_api': 0, 'chamadas': 0, 'classificados': 0, 'atualizacoes': 0}
+            # Contagens do painel ao vivo: começam com o que já veio do checkpoint e só recebem incrementos
+            contagem_parcial = ContagemIncremental()
+            if not amostrar:
+                conjunto_pendentes = set(indices_pendentes)
+                for indice, (sentimento, tema, _) in resultados_finais.items():
+                    if indice not in conjunto_pendentes: contagem_parcial.adicionar(sentimento, tema)
+
+            def classificar_indices(indices):
+                """Regras locais, agrupamento e motor concorrente para as linhas indicadas; grava cada resultado no checkpoint e em resultados_finais."""
+                estatisticas['classificados'] += len(indices)
+                if pre_classificar and indices:
+                    # Regras locais primeiro: o que for rotulado aqui não gasta chamada à API
+                    pre_classificacao = pre_classificar_local(df_copy_analise.loc[indices, coluna_conteudo], limiar_confianca_local); pre_classificacao = pre_classificacao[pre_classificacao['Sentimento'].notna()]; estatisticas['locais'] += len(pre_classificacao)
+                    for (sentimento, tema), indices_grupo in pre_classificacao.groupby(['Sentimento', 'Tema']).groups.items():
+                        checkpoint_analise.gravar(indices_grupo, sentimento, tema, ORIGEM_LOCAL); contagem_parcial.adicionar(sentimento, tema, len(indices_grupo))
+                        for indice in indices_grupo: resultados_finais[indice] = (sentimento, tema, ORIGEM_LOCAL)
+                    indices_locais = set(pre_classificacao.index); indices = [indice for indice in indices if indice not in indices_locais]
+                total_para_api = len(indices); estatisticas['para_api'] += total_para_api
+                if total_para_api == 0: return
+                comentarios_pendentes = df_copy_analise.loc[indices, coluna_conteudo]
+                representantes = agrupar_comentarios(comentarios_pendentes, limiar_similaridade) if agrupar_duplicados else np.arange(total_para_api)
+                posicoes_representantes = np.unique(representantes); total_chamadas = len(posicoes_representantes); membros_por_representante = pd.Series(indices).groupby(representantes).indices; estatisticas['chamadas'] += total_chamadas
+                inicio_api = time.monotonic(); ultima_atualizacao = 0.0; comentarios_concluidos = 0
+                for concluidos, (posicao, (sentimento, tema)) in enumerate(analisar_comentarios_concorrente(comentarios_pendentes.iloc[posicoes_representantes], model, num_workers=num_workers, limite_rpm=limite_rpm, tamanho_lote=tamanho_lote, cache=cache_classificacao, controle=controle_taxa, telemetria=st.session_state.telemetria, formato_resposta=formato_resposta), start=1):
+                    indices_grupo = [indices[membro] for membro in membros_por_representante[posicoes_representantes[posicao]]]
+                    checkpoint_analise.gravar(indices_grupo, sentimento, tema, ORIGEM_API) # Grava já em disco: sobrevive a rerun, refresh ou queda do processo
+                    for indice in indices_grupo: resultados_finais[indice] = (sentimento, tema, ORIGEM_API)
+                    contagem_parcial.adicionar(sentimento, tema, len(indices_grupo)); comentarios_concluidos += len(indices_grupo); agora = time.monotonic()
+                    # Cada redesenho é uma ida e volta ao navegador: só a cada INTERVALO_ATUALIZACAO_SEGUNDOS (e no último resultado)
+                    if agora - ultima_atualizacao >= INTERVALO_ATUALIZACAO_SEGUNDOS or concluidos == total_chamadas:
+                        ultima_atualizacao = agora; decorrido = max(agora - inicio_api, 1e-9); progresso = concluidos / total_chamadas; tempo_restante = (total_chamadas - concluidos) * decorrido / concluidos; estatisticas['atualizacoes'] += 1
+                        progress_bar.progress(progresso); status_text.text(f"Analisando: {concluidos}/{total_chamadas} ({progresso:.1%}) | {comentarios_concluidos / decorrido:.1f} comentários/s | Tempo restante estimado: {formatar_duracao(tempo_restante)} | Chamadas simultâneas: {int(controle_taxa.limite_concorrencia)} | Retentativas: {sum(controle_taxa.retentativas.values())}")
+                        exibir_painel_ao_vivo(painel_ao_vivo, contagem_parcial.agregacao(), estatisticas['atualizacoes'])
+
+            if amostrar:
+                # Rodadas crescentes da mesma ordem estratificada até a margem de erro pedida (ou até o tamanho máximo)
+                tamanho_amostra = 0; estimativa = None
+                while tamanho_amostra < len(ordem_amostra):
+                    tamanho_anterior = tamanho_amostra; tamanho_amostra = min(len(ordem_amostra), tamanho_amostra + TAMANHO_RODADA_AMOSTRA) if parar_na_margem else len(ordem_amostra)
+                    novos = ordem_amostra[tamanho_anterior:tamanho_amostra]
+                    for indice in novos:
+                        if indice in resultados_finais: contagem_parcial.adicionar(*resultados_finais[indice][:2])
+                    classificar_indices([indice for indice in novos if indice not in resultados_finais])
+                    amostra_atual = ordem_amostra[:tamanho_amostra]; resultados_amostra = pd.DataFrame([resultados_finais[indice][:2] for indice in amostra_atual], index=amostra_atual, columns=['Sentimento_Classificado', 'Tema_Classificado'])
+                    estimativa = estimar_por_amostra(resultados_amostra, estratos, confianca_amostragem); status_amostragem.info(f"📐 {descrever_estimativa(estimativa)}.")
+                    if parar_na_margem and estimativa['margem_maxima'] <= margem_alvo: break
+                st.session_state.estimativa = estimativa; df_copy_analise = df_copy_analise.loc[ordem_amostra[:tamanho_amostra]]
+            else: classificar_indices(indices_pendentes)
+            end_time = time.time(); tempo_total = end_time - start_time; progress_bar.empty(); painel_ao_vivo.empty(); status_text.success(f"✅ Análise concluída em {tempo_total:.2f} segundos ({estatisticas['classificados'] / tempo_total if tempo_total > 0 else 0:.1f} comentários/s)!", icon="🎉")
+            if amostrar and parar_na_margem:
+                if estimativa['margem_maxima'] <= margem_alvo: status_amostragem.info(f"📐 Margem de erro de ±{margem_alvo:.1f} p.p. atingida com {len(df_copy_analise)} comentários. {descrever_estimativa(estimativa)}.")
+                else: status_amostragem.warning(f"📐 Tamanho máximo da amostra atingido antes da margem de ±{margem_alvo:.1f} p.p. {descrever_estimativa(estimativa)}.")
+            if estatisticas['locais'] > 0: st.info(f"Pré-classificador local: **{estatisticas['locais']}** comentários triviais rotulados por regras, sem chamada à API.", icon="⚡")
+            if estatisticas['chamadas'] < estatisticas['para_api']: st.info(f"Agrupamento de duplicados: {estatisticas['para_api']} comentários em {estatisticas['chamadas']} grupos. **{estatisticas['para_api'] - estatisticas['chamadas']}** chamadas à API economizadas.", icon="♻️")
+            if len(df_copy_analise) > estatisticas['classificados']: st.info(f"{len(df_copy_analise) - estatisticas['classificados']} comentários reaproveitados do checkpoint anterior.", icon="💾")
+            st.session_state.resumo_retentativas = controle_taxa.resumo()
+            if cache_classificacao: contador_cache.caption(f"Acertos: {cache_classificacao.acertos} | Falhas: {cache_classificacao.falhas} | Entradas: {cache_classificacao.tamanho()}")
+            df_copy_analise['Sentimento_Classificado'] = [resultados_finais[indice][0] for indice in df_copy_analise.index]; df_copy_analise['Tema_Classificado'] = [resultados_finais[indice][1] for indice in df_copy_analise.index]; df_copy_analise['Origem_Classificacao'] = [resultados_finais[indice][2] for indice in df_copy_analise.index]
+            st.session_state.df_results = converter_colunas_resultado(df_copy_analise); st.session_state.hash_resultados = calcular_hash_resultados(df_copy_analise); st.session_state.analysis_done = True
+
+# --- Acompanhamento do Trabalho na Fila ---
+@st.fragment(run_every=INTERVALO_ATUALIZACAO_SEGUNDOS)
+def acompanhar_trabalho(id_trabalho):
+    """Consulta a fila a cada intervalo e redesenha só este trecho; ao terminar, recarrega a página inteira."""
+    trabalho = fila_analise.obter(id_trabalho)
+    if trabalho is None or trabalho['estado'] in estados_finais: st.rerun(scope="app")
+    decorrido = max(time.time() - trabalho['criado_em'], 1e-9); progresso = trabalho['processados'] / trabalho['total'] if trabalho['total'] else 0.0
+    velocidade = trabalho['processados'] / decorrido; tempo_restante = f"{formatar_duracao((trabalho['total'] - trabalho['processados']) / velocidade)}" if velocidade > 0 else "-"
+    st.progress(progresso); st.text(f"{'Na fila, aguardando worker' if trabalho['estado'] == 'pendente' else 'Analisando'}: {trabalho['processados']}/{trabalho['total']} ({progresso:.1%}) | {velocidade:.1f} comentários/s | Tempo restante estimado: {tempo_restante} | Workers ativos: {len(fila_analise.workers_ativos())}")
+    contagem_parcial = ContagemIncremental()
+    for sentimento, tema, quantidade in fila_analise.contagens(id_trabalho): contagem_parcial.adicionar(sentimento, tema, quantidade)
+    if contagem_parcial.agregacao().total > 0: exibir_painel_ao_vivo(st.empty(), contagem_parcial.agregacao(), 0)
+    if st.button("Cancelar trabalho", key="cancelar_trabalho"): fila_analise.cancelar(id_trabalho); st.rerun(scope="app")
+
+def carregar_resultados_trabalho(trabalho):
+    """Monta o DataFrame de resultados a partir da cópia do arquivo guardada na fila; trabalhos interrompidos trazem só as linhas já classificadas."""
+    df_trabalho = ler_comentarios_trabalho(trabalho, trabalho['colunas_extras']).join(fila_analise.resultados(trabalho['id']))
+    return df_trabalho[df_trabalho['Sentimento_Classificado'].notna()]
+
+if fila_analise and st.session_state.trabalho_id:
+    trabalho_fila = fila_analise.obter(st.session_state.trabalho_id)
+    if trabalho_fila:
+        st.markdown("---"); st.subheader(f"Fila de análises: {trabalho_fila['nome_arquivo']}")
+        if trabalho_fila['estado'] not in estados_finais: acompanhar_trabalho(trabalho_fila['id'])
+        else:
+            if trabalho_fila['estado'] == 'concluido': st.success(f"Trabalho concluído: {trabalho_fila['total']} comentários classificados.", icon="✅")
+            elif trabalho_fila['estado'] == 'erro': st.error(f"Trabalho interrompido por erro após {trabalho_fila['processados']} de {trabalho_fila['total']} comentários: {trabalho_fila['mensagem']}", icon="🚨")
+            else: st.warning(f"Trabalho cancelado após {trabalho_fila['processados']} de {trabalho_fila['total']} comentários.", icon="⏹️")
+            if trabalho_fila['processados'] > 0 and st.button("📊 Carregar resultados do trabalho", key="carregar_trabalho"):
+                with st.spinner("Carregando resultados da fila..."): df_trabalho = carregar_resultados_trabalho(trabalho_fila)
+                st.session_state.insights_generated = None; st.session_state.resumo_retentativas = None; st.session_state.telemetria = TelemetriaAPI(); st.session_state.estimativa = None
+                st.session_state.df_results = converter_colunas_resultado(df_trabalho); st.session_state.hash_resultados = calcular_hash_resultados(df_trabalho); st.session_state.analysis_done = True; st.rerun()
 
 # --- Exibição dos Resultados ---
-# ... (sem alterações no código de exibição: gráficos, tabelas, download, insights) ...
+@st.cache_data(max_entries=4, show_spinner=False)
+def obter_agregacao(hash_resultados, _df_resultados): return AgregacaoResultados(_df_resultados) # Calculada uma vez por conjunto de resultados; reruns só leem
+
 if st.session_state.analysis_done and st.session_state.df_results is not None:
     with results_container:
-        df_results = st.session_state.df_results; total_analisados_results = len(df_results); st.markdown("---"); st.subheader("Visualização dos Resultados")
-        df_sent_chart = df_results[~df_results['Sentimento_Classificado'].isin(categorias_excluir_sentimento)].copy(); sent_counts_chart = df_sent_chart['Sentimento_Classificado'].value_counts(); total_sent_chart = sent_counts_chart.sum(); nps_score_num = None
-        if total_sent_chart > 0: count_pos_chart = sent_counts_chart.get('Positivo', 0); count_neg_chart = sent_counts_chart.get('Negativo', 0); perc_pos_chart = count_pos_chart / total_sent_chart; perc_neg_chart = count_neg_chart / total_sent_chart; nps_formula_standard = ((perc_pos_chart - perc_neg_chart) + 1) / 2 * 10; nps_score_num = max(0, min(10, nps_formula_standard))
+        df_results = st.session_state.df_results; estimativa = st.session_state.estimativa
+        # No modo amostragem, NPS, gráficos e tabelas usam as contagens estimadas para o arquivo inteiro
+        if estimativa: agregacao = AgregacaoResultados.de_contagens(estimativa['contagem_sentimento'], estimativa['contagem_tema'], estimativa['contagem_tema_negativo'])
+        else: agregacao = obter_agregacao(st.session_state.hash_resultados or calcular_hash_resultados(df_results), df_results)
+        total_analisados_results = agregacao.total; st.markdown("---"); st.subheader("Visualização dos Resultados (estimativas por amostragem)" if estimativa else "Visualização dos Resultados")
+        if estimativa: st.warning(f"📐 {descrever_estimativa(estimativa)}. Os números abaixo são **estimativas** para os {estimativa['total_populacao']} comentários do arquivo, não contagens exatas.", icon="⚠️")
+        total_sent_chart = agregacao.total_sentimentos_grafico; nps_score_num = estimativa['nps'] if estimativa and not np.isnan(estimativa['nps']) else agregacao.nps
         nps_col, chart_col1, chart_col2 = st.columns([1, 2, 2])
-        with nps_col: st.markdown("##### NPS Social"); st.metric(label="(Escala 0-10)", value=f"{nps_score_num:.1f}" if nps_score_num is not None else "N/A"); st.caption("Sem dados P/N/Neu." if nps_score_num is None else "")
+        with nps_col:
+            st.markdown("##### NPS Social"); st.metric(label="(Escala 0-10, estimado)" if estimativa else "(Escala 0-10)", value=f"{nps_score_num:.1f}" if nps_score_num is not None else "N/A"); st.caption("Sem dados P/N/Neu." if nps_score_num is None else "")
+            if estimativa and nps_score_num is not None: st.caption(f"IC {estimativa['confianca']:.0%}: {estimativa['nps_inferior']:.1f} a {estimativa['nps_superior']:.1f}")
         with chart_col1:
             st.markdown("##### Distribuição de Sentimento")
-            if total_sent_chart > 0:
-                df_plot_sent = pd.DataFrame({'Sentimento': sent_counts_chart.index, 'Volume': sent_counts_chart.values}); df_plot_sent['Sentimento'] = pd.Categorical(df_plot_sent['Sentimento'], categories=["Positivo", "Neutro", "Negativo"], ordered=True); df_plot_sent = df_plot_sent.sort_values('Sentimento')
-                fig_sent = px.pie(df_plot_sent, names='Sentimento', values='Volume', hole=0.4, color='Sentimento', color_discrete_map={'Positivo': '#28a745', 'Negativo': '#dc3545', 'Neutro': '#ffc107'}, title='Sentimentos (Excluindo Não Classif./Erros)')
-                fig_sent.update_traces(textposition='outside', textinfo='percent+label', hovertemplate="<b>%{label}</b><br>Volume: %{value}<br>Percentual: %{percent:.1%}<extra></extra>"); fig_sent.update_layout(showlegend=False, title_x=0.5, height=350, margin=dict(l=10, r=10, t=40, b=10)); st.plotly_chart(fig_sent, use_container_width=True)
+            if total_sent_chart > 0: st.plotly_chart(criar_grafico_sentimento(agregacao), use_container_width=True)
             else: st.warning("Nenhum sentimento Positivo, Negativo ou Neutro classificado para exibir gráfico.", icon="📊")
         with chart_col2:
             st.markdown("##### Distribuição Temática")
-            df_tema_chart = df_results[~df_results['Tema_Classificado'].isin(categorias_excluir_tema)].copy(); tema_counts_chart = df_tema_chart['Tema_Classificado'].value_counts(); total_tema_chart = tema_counts_chart.sum()
-            if total_tema_chart > 0:
-                tema_perc_chart = (tema_counts_chart / total_tema_chart * 100); df_plot_tema = pd.DataFrame({'Tema': tema_counts_chart.index, 'Volume': tema_counts_chart.values, 'Percentual': tema_perc_chart.values}).sort_values(by='Volume', ascending=False)
-                fig_tema = px.bar(df_plot_tema, x='Tema', y='Volume', color_discrete_sequence=['#007bff']*len(df_plot_tema), title='Principais Temas (Excluindo NC/Erro/Interação)', hover_data={'Tema': False, 'Volume': True, 'Percentual': ':.1f%'}, text='Volume')
-                fig_tema.update_traces(textposition='outside'); fig_tema.update_layout(xaxis_title=None, yaxis_title="Volume Bruto", title_x=0.5, height=350, margin=dict(l=10, r=10, t=40, b=10)); fig_tema.update_xaxes(tickangle= -30); st.plotly_chart(fig_tema, use_container_width=True)
+            if agregacao.temas_grafico.sum() > 0: st.plotly_chart(criar_grafico_temas(agregacao), use_container_width=True)
             else: st.warning("Nenhum tema válido (excluindo NC/Erro/Interação) classificado para exibir gráfico.", icon="📊")
 
-        st.markdown("---"); st.subheader("Tabelas de Resumo Completas"); col_t1, col_t2 = st.columns(2)
-        with col_t1:
-            st.markdown("###### Tabela 1: Sentimento (Completa)"); todas_cats_sent = categorias_sentimento_validas + sorted(list(set(todas_categorias_erro))); sent_counts_all = df_results['Sentimento_Classificado'].value_counts().reindex(todas_cats_sent, fill_value=0); sent_perc_all = (sent_counts_all / total_analisados_results * 100) if total_analisados_results > 0 else 0; tabela_sent = pd.DataFrame({'Sentimento': sent_counts_all.index, 'Volume Bruto': sent_counts_all.values, 'Percentual (%)': sent_perc_all.values}); total_row_sent = pd.DataFrame({'Sentimento': ['Total Geral'], 'Volume Bruto': [total_analisados_results], 'Percentual (%)': [100.0]}); tabela_sent_final = pd.concat([tabela_sent[tabela_sent['Volume Bruto'] > 0], total_row_sent], ignore_index=True); st.table(tabela_sent_final.style.format({'Percentual (%)': '{:.2f}%'}))
-        with col_t2:
-            st.markdown("###### Tabela 2: Temática (Completa)"); todas_cats_tema = categorias_tema_validas + sorted(list(set(todas_categorias_erro))); tema_counts_all = df_results['Tema_Classificado'].value_counts().reindex(todas_cats_tema, fill_value=0); tema_counts_all = tema_counts_all[~tema_counts_all.index.duplicated(keep='first')]; tema_perc_all = (tema_counts_all / total_analisados_results * 100) if total_analisados_results > 0 else 0; tabela_tema = pd.DataFrame({'Tema': tema_counts_all.index, 'Volume Bruto': tema_counts_all.values, 'Percentual (%)': tema_perc_all.values}); total_row_tema = pd.DataFrame({'Tema': ['Total Geral'], 'Volume Bruto': [total_analisados_results], 'Percentual (%)': [100.0]}); tabela_tema_final = pd.concat([tabela_tema[tabela_tema['Volume Bruto'] > 0], total_row_tema], ignore_index=True); st.table(tabela_tema_final.style.format({'Percentual (%)': '{:.2f}%'}))
-
-        st.markdown("---"); st.subheader("Resultados Completos Detalhados"); st.dataframe(df_results, use_container_width=True)
+        def tabela_resumo(contagem, rotulo):
+            contagem = contagem[contagem > 0]; percentual = (contagem / total_analisados_results * 100) if total_analisados_results > 0 else contagem * 0; coluna_volume = 'Volume Estimado' if estimativa else 'Volume Bruto'
+            tabela = pd.DataFrame({rotulo: contagem.index.astype(str), coluna_volume: contagem.values, 'Percentual (%)': percentual.values}); total_row = pd.DataFrame({rotulo: ['Total Geral'], coluna_volume: [total_analisados_results], 'Percentual (%)': [100.0]})
+            return pd.concat([tabela, total_row], ignore_index=True).style.format({'Percentual (%)': '{:.2f}%'})
+        if estimativa:
+            st.markdown("---"); st.subheader(f"Estimativas com Intervalo de Confiança ({estimativa['confianca']:.0%})"); col_e1, col_e2 = st.columns(2)
+            formato_estimativa = {coluna: '{:.1f}' for coluna in estimativa['sentimentos'].columns if coluna != 'Categoria'}
+            with col_e1: st.markdown("###### Sentimento (entre Positivo, Neutro e Negativo)"); st.table(estimativa['sentimentos'].style.format(formato_estimativa))
+            with col_e2: st.markdown("###### Temas (excluindo NC/Erro/Interação)"); st.table(estimativa['temas'].head(10).style.format(formato_estimativa))
+            if estimativa['estratos_amostrados'] < estimativa['estratos']: st.caption(f"{estimativa['estratos'] - estimativa['estratos_amostrados']} de {estimativa['estratos']} estratos não entraram na amostra (são pequenos demais para o tamanho da amostra) e não são representados nas estimativas.")
+        st.markdown("---"); st.subheader("Tabelas de Resumo Completas (estimadas)" if estimativa else "Tabelas de Resumo Completas"); col_t1, col_t2 = st.columns(2)
+        with col_t1: st.markdown("###### Tabela 1: Sentimento (Completa)"); st.table(tabela_resumo(agregacao.contagem_sentimento, 'Sentimento'))
+        with col_t2: st.markdown("###### Tabela 2: Temática (Completa)"); st.table(tabela_resumo(agregacao.contagem_tema, 'Tema'))
+
+        resumo_retentativas = st.session_state.resumo_retentativas
+        if resumo_retentativas and (resumo_retentativas["retentativas"] or resumo_retentativas["falhas_definitivas"]):
+            st.markdown("###### Tabela 3: Retentativas da API"); motivos = sorted(set(resumo_retentativas["retentativas"]) | set(resumo_retentativas["falhas_definitivas"]))
+            tabela_retentativas = pd.DataFrame({'Motivo': motivos, 'Retentativas': [resumo_retentativas["retentativas"].get(motivo, 0) for motivo in motivos], 'Falhas após todas as tentativas': [resumo_retentativas["falhas_definitivas"].get(motivo, 0) for motivo in motivos]})
+            st.table(tabela_retentativas); st.caption(f"Chamadas à API: {resumo_retentativas['chamadas']} | Chamadas simultâneas ao final (ajuste automático): {resumo_retentativas['concorrencia_final']}")
+
+        st.markdown("---"); st.subheader(f"Comentários da Amostra ({len(df_results)})" if estimativa else "Resultados Completos Detalhados"); st.dataframe(df_results, use_container_width=True)
         @st.cache_data
         def convert_df_to_csv(df_conv): return df_conv.to_csv(index=False, encoding='utf-8-sig').encode('utf-8-sig')
-        if uploaded_file: base_name = uploaded_file.name.split('.')[0]; download_filename = f"{base_name}_analise_gemini.csv"
+        if uploaded_file: base_name = uploaded_file.name.split('.')[0]; download_filename = f"{base_name}_analise_gemini{'_amostra' if estimativa else ''}.csv"
         else: download_filename = 'analise_gemini_resultados.csv'
         csv_output = convert_df_to_csv(df_results)
         st.download_button(label="💾 Download Resultados Completos (.csv)", data=csv_output, file_name=download_filename, mime='text/csv', key='download_csv', help="Baixa a tabela completa acima, incluindo as classificações de Sentimento e Tema, em formato CSV.")
@@ -392,11 +427,28 @@ if st.session_state.analysis_done and st.session_state.df_results is not None:
         st.markdown("---"); st.subheader("💡 Insights e Percepções Acionáveis")
         if st.session_state.analysis_done and st.session_state.df_results is not None and model:
             if st.session_state.insights_generated is None:
-                with st.spinner("Gerando insights com base nos resultados..."): gerar_insights(st.session_state.df_results, model)
+                with st.spinner("Gerando insights com base nos resultados..."): st.session_state.insights_generated = gerar_insights(st.session_state.df_results, model, st.session_state.telemetria, agregacao, estimativa)
             if st.session_state.insights_generated: st.markdown(st.session_state.insights_generated)
             else: st.warning("Não foi possível gerar ou carregar os insights.", icon="⚠️")
         elif not model: st.warning("Modelo Gemini não inicializado. Não é possível gerar insights.", icon="⚠️")
         else: st.info("Realize uma análise primeiro para poder gerar os insights.", icon="ℹ️")
 
 elif not uploaded_file and not st.session_state.analysis_done :
-     st.info("⬅️ Para começar, configure sua API Key (se necessário) e faça o upload de um arquivo .csv ou .xlsx na barra lateral.", icon="👈")
\ No newline at end of file
+     st.info("⬅️ Para começar, configure sua API Key (se necessário) e faça o upload de um arquivo .csv, .xlsx ou .parquet na barra lateral.", icon="👈")
+
+# --- Telemetria das Chamadas à API (barra lateral) ---
+with painel_telemetria.container():
+    with st.expander("Telemetria da API"):
+        preco_entrada = st.number_input("US$ por 1M tokens de entrada", min_value=0.0, value=PRECO_ENTRADA_POR_MILHAO_TOKENS, step=0.005, format="%.3f", key="preco_entrada", help=f"Preço de referência do {NOME_MODELO_GEMINI}; ajuste conforme o contrato.")
+        preco_saida = st.number_input("US$ por 1M tokens de saída", min_value=0.0, value=PRECO_SAIDA_POR_MILHAO_TOKENS, step=0.01, format="%.3f", key="preco_saida")
+        resumo_telemetria = st.session_state.telemetria.resumo(preco_entrada, preco_saida)
+        if resumo_telemetria is None: st.caption("Nenhuma chamada registrada nesta análise.")
+        else:
+            coluna_1, coluna_2 = st.columns(2)
+            coluna_1.metric("Comentários/s", f"{resumo_telemetria['comentarios_por_segundo']:.1f}" if resumo_telemetria['comentarios_por_segundo'] else "-"); coluna_2.metric("Custo estimado", f"US$ {resumo_telemetria['custo_estimado_usd']:.4f}")
+            coluna_1.metric("Tokens/comentário", f"{resumo_telemetria['tokens_por_comentario']:.0f}" if resumo_telemetria['tokens_por_comentario'] else "-"); coluna_2.metric("Chamadas", resumo_telemetria['chamadas'])
+            st.caption(f"Latência por chamada (com retentativas): p50 {resumo_telemetria['latencia_p50']:.2f}s | p95 {resumo_telemetria['latencia_p95']:.2f}s | p99 {resumo_telemetria['latencia_p99']:.2f}s")
+            st.caption(f"Tokens: {resumo_telemetria['tokens_prompt']:,} de entrada e {resumo_telemetria['tokens_resposta']:,} de saída | Tentativas extras: {resumo_telemetria['tentativas_extras']}".replace(",", "."))
+            st.caption("Resultados: " + " | ".join(f"{resultado}: {quantidade}" for resultado, quantidade in resumo_telemetria['resultados'].items()))
+            if resumo_telemetria['chamadas_sem_uso_informado']: st.caption(f"{resumo_telemetria['chamadas_sem_uso_informado']} chamadas sem contagem de tokens na resposta (não entram no custo).")
+            st.download_button("Exportar log (.jsonl)", data=st.session_state.telemetria.exportar_jsonl(), file_name="telemetria_gemini.jsonl", mime="application/jsonl", key="download_telemetria", help="Uma linha JSON por chamada: operação, duração, tentativas, tokens e resultado.")
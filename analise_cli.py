@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Classificação em lote pela linha de comando, sem Streamlit.
+
+Lê o arquivo de entrada (.csv, .xlsx ou .parquet) em blocos, classifica cada bloco com o
+mesmo núcleo do app e grava as linhas no arquivo de saída (.csv ou .parquet)
+à medida que avança, de modo que o uso de memória não depende do tamanho da
+entrada.
+
+Exemplo:
+    GOOGLE_API_KEY=... python analise_cli.py comentarios.csv -o comentarios_analise.csv --workers 16 --rpm 1000
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+import pandas as pd
+
+from analise_core import (
+    NOME_MODELO_GEMINI, ORIGEM_API, ORIGEM_LOCAL, ORIGEM_SEM_CONTEUDO, CacheClassificacao, ControleTaxa, TelemetriaAPI, agrupar_comentarios, analisar_comentarios_concorrente, configurar_modelo, detectar_formato_csv, extensoes_entrada, formatos_resposta, FORMATO_TEXTO, pre_classificar_local,
+)
+
+# --- Leitura em Blocos ---
+def ler_em_blocos(caminho, tamanho_bloco):
+    """Gera DataFrames de até tamanho_bloco linhas; no CSV e no XLSX todas as colunas são lidas como texto."""
+    if caminho.lower().endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for lote in pq.ParquetFile(caminho).iter_batches(batch_size=tamanho_bloco): yield lote.to_pandas().reset_index(drop=True) # Sem o índice gravado no arquivo
+    elif caminho.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook # Modo somente leitura: as linhas são lidas sob demanda
+        pasta_trabalho = load_workbook(caminho, read_only=True, data_only=True)
+        try:
+            linhas = pasta_trabalho.active.iter_rows(values_only=True); colunas = [str(coluna) for coluna in next(linhas, ())]; bloco = []
+            for linha in linhas:
+                bloco.append(linha)
+                if len(bloco) >= tamanho_bloco: yield pd.DataFrame(bloco, columns=colunas, dtype=object); bloco = []
+            if bloco: yield pd.DataFrame(bloco, columns=colunas, dtype=object)
+        finally: pasta_trabalho.close()
+    else:
+        codificacao, separador = detectar_formato_csv(caminho)
+        yield from pd.read_csv(caminho, sep=separador, encoding=codificacao, dtype=str, keep_default_na=False, na_values=[''], chunksize=tamanho_bloco)
+
+
+# --- Gravação Incremental ---
+class GravadorSaida:
+    """Acrescenta blocos ao arquivo de saída (.csv ou .parquet) sem manter o resultado em memória."""
+    def __init__(self, caminho):
+        self.caminho = caminho; self.parquet = caminho.lower().endswith('.parquet'); self._escritor_parquet = None; self._cabecalho_escrito = False
+
+    def gravar(self, bloco):
+        if self.parquet:
+            import pyarrow as pa, pyarrow.parquet as pq
+            tabela = pa.Table.from_pandas(bloco.astype("string"), preserve_index=False)
+            if self._escritor_parquet is None: self._escritor_parquet = pq.ParquetWriter(self.caminho, tabela.schema)
+            self._escritor_parquet.write_table(tabela.cast(self._escritor_parquet.schema))
+        else:
+            bloco.to_csv(self.caminho, mode='a' if self._cabecalho_escrito else 'w', header=not self._cabecalho_escrito, index=False, encoding='utf-8-sig' if not self._cabecalho_escrito else 'utf-8')
+            self._cabecalho_escrito = True
+
+    def fechar(self):
+        if self._escritor_parquet is not None: self._escritor_parquet.close()
+
+
+# --- Execução ---
+def classificar_bloco(bloco, coluna_conteudo, modelo, argumentos, cache, controle=None, telemetria=None):
+    """Classifica um bloco e devolve (bloco com as colunas de resultado, comentários enviados à API, rotulados localmente).
+
+    Linhas sem conteúdo (nulas ou só com espaços, o mesmo critério de
+    filtrar_comentarios_validos) ficam na saída como "Não Classificado", com
+    origem ORIGEM_SEM_CONTEUDO, sem passar pelas regras locais nem pela API.
+    """
+    comentarios = bloco[coluna_conteudo].fillna("").astype(str).reset_index(drop=True)
+    sentimentos = pd.Series(None, index=comentarios.index, dtype=object); temas = sentimentos.copy(); origens = pd.Series(ORIGEM_API, index=comentarios.index, dtype=object)
+    vazios = comentarios.str.strip() == ""; sentimentos[vazios] = "Não Classificado"; temas[vazios] = "Não Classificado (Tema)"; origens[vazios] = ORIGEM_SEM_CONTEUDO
+    if argumentos.confianca_local is not None:
+        pre_classificacao = pre_classificar_local(comentarios, argumentos.confianca_local); locais = pre_classificacao['Sentimento'].notna() & ~vazios
+        sentimentos[locais] = pre_classificacao.loc[locais, 'Sentimento']; temas[locais] = pre_classificacao.loc[locais, 'Tema']; origens[locais] = ORIGEM_LOCAL
+    comentarios_api = comentarios[sentimentos.isna()]
+    representantes = agrupar_comentarios(comentarios_api, argumentos.limiar) if argumentos.limiar is not None else list(range(len(comentarios_api)))
+    posicoes_representantes = sorted(set(representantes)); resultados = {}
+    for posicao, resultado in analisar_comentarios_concorrente(comentarios_api.iloc[posicoes_representantes], modelo, num_workers=argumentos.workers, limite_rpm=argumentos.rpm, tamanho_lote=argumentos.lote, cache=cache, controle=controle, telemetria=telemetria, formato_resposta=argumentos.formato_resposta):
+        resultados[posicoes_representantes[posicao]] = resultado
+    sentimentos[comentarios_api.index] = [resultados[representante][0] for representante in representantes]; temas[comentarios_api.index] = [resultados[representante][1] for representante in representantes]
+    bloco = bloco.assign(Sentimento_Classificado=sentimentos.to_numpy(), Tema_Classificado=temas.to_numpy(), Origem_Classificacao=origens.to_numpy())
+    return bloco, len(posicoes_representantes), int((origens == ORIGEM_LOCAL).sum())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classifica sentimento e tema de comentários com o Gemini, em blocos e sem Streamlit.")
+    parser.add_argument("entrada", help="Arquivo .csv, .xlsx ou .parquet com a coluna de comentários.")
+    parser.add_argument("-o", "--saida", required=True, help="Arquivo de saída (.csv ou .parquet).")
+    parser.add_argument("--coluna", default="Conteúdo", help="Nome da coluna com os comentários (padrão: Conteúdo).")
+    parser.add_argument("--tamanho-bloco", type=int, default=5000, help="Linhas lidas, classificadas e gravadas por vez (padrão: 5000).")
+    parser.add_argument("--workers", type=int, default=8, help="Chamadas simultâneas à API (padrão: 8).")
+    parser.add_argument("--rpm", type=int, default=0, help="Limite de requisições por minuto; 0 = sem limite.")
+    parser.add_argument("--lote", type=int, default=1, help="Comentários por chamada (padrão: 1).")
+    parser.add_argument("--limiar", type=float, default=1.0, help="Similaridade mínima para agrupar duplicados dentro do bloco (1.0 = só idênticos após normalização).")
+    parser.add_argument("--sem-agrupamento", dest="limiar", action="store_const", const=None, help="Classifica todas as linhas, sem agrupar duplicados.")
+    parser.add_argument("--confianca-local", type=float, default=0.9, help="Confiança mínima das regras locais que rotulam comentários triviais sem chamar a API (padrão: 0.9).")
+    parser.add_argument("--sem-pre-classificacao", dest="confianca_local", action="store_const", const=None, help="Envia todos os comentários à API, sem as regras locais.")
+    parser.add_argument("--formato-resposta", choices=formatos_resposta, default=FORMATO_TEXTO, help="texto: duas linhas Sentimento:/Tema: (padrão); json: resposta estruturada restrita às categorias válidas por esquema.")
+    parser.add_argument("--sem-cache", action="store_true", help="Não consulta nem grava o cache de classificações.")
+    parser.add_argument("--telemetria", help="Grava um log JSON por linha de cada chamada à API (duração, tentativas, tokens e resultado) neste arquivo .jsonl.")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY"), help="Google API Key (padrão: variável de ambiente GOOGLE_API_KEY).")
+    argumentos = parser.parse_args(argv)
+
+    if not argumentos.api_key: parser.error("informe --api-key ou defina GOOGLE_API_KEY.")
+    if not argumentos.entrada.lower().endswith(extensoes_entrada): parser.error("a entrada deve ser .csv, .xlsx ou .parquet.")
+    if not argumentos.saida.lower().endswith(('.csv', '.parquet')): parser.error("a saída deve ser .csv ou .parquet.")
+    modelo = configurar_modelo(argumentos.api_key); cache = None if argumentos.sem_cache else CacheClassificacao(); controle = ControleTaxa(argumentos.rpm, argumentos.workers); telemetria = TelemetriaAPI(argumentos.telemetria, max_registros=0) # Só totais em memória; o log vai direto para o arquivo
+    gravador = GravadorSaida(argumentos.saida); contagem_sentimentos = Counter(); total_linhas = 0; total_chamadas = 0; total_locais = 0; total_sem_conteudo = 0; inicio = time.time()
+    print(f"Modelo: {NOME_MODELO_GEMINI} | Entrada: {argumentos.entrada} | Saída: {argumentos.saida}", file=sys.stderr)
+    try:
+        for numero_bloco, bloco in enumerate(ler_em_blocos(argumentos.entrada, argumentos.tamanho_bloco), start=1):
+            if argumentos.coluna not in bloco.columns: parser.error(f"coluna '{argumentos.coluna}' não encontrada em {argumentos.entrada}.")
+            inicio_bloco = time.time(); bloco, chamadas_bloco, locais_bloco = classificar_bloco(bloco, argumentos.coluna, modelo, argumentos, cache, controle, telemetria); gravador.gravar(bloco)
+            total_linhas += len(bloco); total_chamadas += chamadas_bloco; total_locais += locais_bloco; total_sem_conteudo += int((bloco['Origem_Classificacao'] == ORIGEM_SEM_CONTEUDO).sum()); contagem_sentimentos.update(bloco['Sentimento_Classificado']); decorrido = time.time() - inicio
+            print(f"Bloco {numero_bloco}: {len(bloco)} linhas em {time.time() - inicio_bloco:.1f}s | Total: {total_linhas} linhas, {total_linhas / decorrido:.1f} linhas/s", file=sys.stderr)
+    finally: gravador.fechar(); telemetria.fechar()
+
+    decorrido = time.time() - inicio
+    print(f"Concluído: {total_linhas} linhas em {decorrido:.1f}s ({total_linhas / decorrido if decorrido > 0 else 0:.1f} linhas/s), {total_chamadas} comentários enviados para classificação, {total_locais} rotulados por regras locais, {total_sem_conteudo} linhas sem conteúdo.", file=sys.stderr)
+    if cache: print(f"Cache: {cache.acertos} acertos, {cache.falhas} falhas.", file=sys.stderr)
+    resumo = controle.resumo(); print(f"Chamadas à API: {resumo['chamadas']} | Retentativas: {resumo['retentativas'] or 0} | Falhas após todas as tentativas: {resumo['falhas_definitivas'] or 0}", file=sys.stderr)
+    resumo_telemetria = telemetria.resumo()
+    if resumo_telemetria: print(f"Latência por chamada: p50 {resumo_telemetria['latencia_p50']:.2f}s, p95 {resumo_telemetria['latencia_p95']:.2f}s, p99 {resumo_telemetria['latencia_p99']:.2f}s | Tokens: {resumo_telemetria['tokens_prompt']} de entrada, {resumo_telemetria['tokens_resposta']} de saída ({resumo_telemetria['tokens_por_comentario'] or 0:.0f} por comentário) | Custo estimado: US$ {resumo_telemetria['custo_estimado_usd']:.4f}", file=sys.stderr)
+    for sentimento, quantidade in contagem_sentimentos.most_common(): print(f"  {sentimento}: {quantidade}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
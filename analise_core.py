@@ -0,0 +1,1046 @@
+# -*- coding: utf-8 -*-
+"""Núcleo da análise de sentimento e temática, sem dependência do Streamlit.
+
+Reúne os prompts, as categorias válidas e toda a lógica de classificação
+(chamadas ao Gemini, lote, cache, agrupamento, checkpoints e insights), para
+ser usado tanto pelo app (analise_app.py) quanto pela linha de comando
+(analise_cli.py).
+"""
+
+import pandas as pd
+import google.generativeai as genai
+import time # Para o controle de taxa e os horários do cache
+import random # Para o jitter do backoff entre retentativas
+import numpy as np # Para o agrupamento de duplicados (MinHash)
+import re # Para interpretar as respostas em lote
+import threading # Para o controle de taxa compartilhado entre workers
+import os # Para localizar o cache e os checkpoints
+import sqlite3 # Para o cache persistente de classificações
+import hashlib # Para as chaves do cache e o hash dos arquivos
+import unicodedata # Para normalizar o texto antes de gerar a chave do cache
+import json # Para os checkpoints de análise em JSONL
+import csv # Para detectar o separador dos arquivos CSV
+import io # Para ler o arquivo enviado a partir dos bytes em memória
+import logging
+from collections import Counter, deque
+from statistics import NormalDist # Para os intervalos de confiança do modo amostragem
+from concurrent.futures import ThreadPoolExecutor, as_completed # Para a análise concorrente
+
+logger = logging.getLogger(__name__)
+
+try: import pyarrow # Parser de CSV mais rápido e suporte a Parquet (opcional)
+except ImportError: pyarrow = None
+
+NOME_MODELO_GEMINI = 'gemini-1.5-flash'
+
+
+# --- Configuração do Modelo ---
+def configurar_modelo(api_key, nome_modelo=NOME_MODELO_GEMINI):
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(nome_modelo)
+
+
+# --- Leitura dos Arquivos de Entrada ---
+TAMANHO_AMOSTRA_CSV = 64 * 1024 # bytes lidos para detectar codificação e separador
+extensoes_entrada = ('.csv', '.xlsx', '.parquet')
+
+def _detectar_formato_amostra(amostra):
+    try: amostra_texto = amostra.decode('utf-8-sig'); codificacao = 'utf-8-sig'
+    except UnicodeDecodeError as e:
+        # A amostra pode terminar no meio de um caractere multibyte
+        if e.start >= len(amostra) - 3: amostra_texto = amostra[:e.start].decode('utf-8-sig'); codificacao = 'utf-8-sig'
+        else: amostra_texto = amostra.decode('latin1'); codificacao = 'latin1'
+    try: separador = csv.Sniffer().sniff(amostra_texto.split('\n', 1)[0], delimiters=",;\t|").delimiter
+    except csv.Error: separador = ','
+    return codificacao, separador, amostra_texto
+
+def detectar_formato_csv(caminho):
+    """Detecta codificação (utf-8 ou latin1) e separador a partir de uma amostra do início do arquivo."""
+    with open(caminho, 'rb') as arquivo: amostra = arquivo.read(TAMANHO_AMOSTRA_CSV)
+    return _detectar_formato_amostra(amostra)[:2]
+
+def listar_colunas_arquivo(conteudo, nome_arquivo):
+    """Nomes das colunas de um arquivo .csv, .xlsx ou .parquet (em bytes), lendo só o cabeçalho."""
+    nome_arquivo = nome_arquivo.lower()
+    if nome_arquivo.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(io.BytesIO(conteudo)).names)
+    if nome_arquivo.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        pasta_trabalho = load_workbook(io.BytesIO(conteudo), read_only=True, data_only=True)
+        try: return [str(coluna) for coluna in next(pasta_trabalho.active.iter_rows(max_row=1, values_only=True), ())]
+        finally: pasta_trabalho.close()
+    _, separador, amostra_texto = _detectar_formato_amostra(conteudo[:TAMANHO_AMOSTRA_CSV])
+    return next(csv.reader(io.StringIO(amostra_texto), delimiter=separador), [])
+
+def ler_arquivo_comentarios(conteudo, nome_arquivo, colunas=None):
+    """Lê um arquivo .csv, .xlsx ou .parquet (em bytes) em uma única passada, carregando apenas as colunas pedidas.
+
+    No CSV, codificação e separador vêm de uma amostra (sem tentativas de leitura
+    completa) e o parser do pyarrow é usado quando disponível. O XLSX é lido em
+    modo somente leitura, linha a linha. colunas=None carrega todas.
+    """
+    nome_arquivo = nome_arquivo.lower()
+    if nome_arquivo.endswith('.parquet'): return pd.read_parquet(io.BytesIO(conteudo), columns=colunas).reset_index(drop=True) # Descarta o índice gravado no arquivo (pode ser texto ou repetido), como no CSV e no XLSX
+    if nome_arquivo.endswith('.xlsx'):
+        from openpyxl import load_workbook # Modo somente leitura: as linhas são lidas sob demanda
+        pasta_trabalho = load_workbook(io.BytesIO(conteudo), read_only=True, data_only=True)
+        try:
+            linhas = pasta_trabalho.active.iter_rows(values_only=True); cabecalho = [str(coluna) for coluna in next(linhas, ())]
+            posicoes = [posicao for posicao, coluna in enumerate(cabecalho) if colunas is None or coluna in colunas]
+            return pd.DataFrame([[linha[posicao] if posicao < len(linha) else None for posicao in posicoes] for linha in linhas], columns=[cabecalho[posicao] for posicao in posicoes])
+        finally: pasta_trabalho.close()
+    codificacao, separador, _ = _detectar_formato_amostra(conteudo[:TAMANHO_AMOSTRA_CSV])
+    parametros = dict(sep=separador, encoding=codificacao, usecols=colunas)
+    if pyarrow is not None:
+        try: return pd.read_csv(io.BytesIO(conteudo), engine='pyarrow', **parametros)
+        except Exception as e: logger.info("Leitor pyarrow falhou (%s); usando o parser padrão do pandas.", e)
+    return pd.read_csv(io.BytesIO(conteudo), **parametros)
+
+
+# --- Preparação dos Dados ---
+def filtrar_comentarios_validos(df, coluna_conteudo):
+    """Remove as linhas com conteúdo nulo ou vazio na coluna de comentários (sem copiar o DataFrame inteiro duas vezes)."""
+    return df[df[coluna_conteudo].notna() & (df[coluna_conteudo].astype(str).str.strip() != '')]
+
+
+# --- Prompt Principal REFINADO v7 (Baseado na Análise Comparativa e Feedback v3) ---
+seu_prompt_completo = """
+Persona: Você é uma IA Analista de Feedback de Clientes e Social Listening altamente especializada no setor bancário brasileiro, com profundo conhecimento sobre o Banco Itaú e seu ecossistema de marcas (Itaú, Personnalité, Uniclass, Empresas, íon, Private, BBA, Itubers). Você compreende produtos (CDB, LCI, Pix), jargões (TED, DOC) e o contexto de campanhas (influenciadores, eventos como Rock in Rio, The Town). Sua análise combina rigor na aplicação das regras com compreensão contextual.
+
+Objetivo:
+1.	Primário: Classificar CADA mensagem recebida em Português do Brasil (Pt-BR) em UMA categoria de Sentimento e UMA categoria Temática, aderindo ESTRITAMENTE às definições, regras e prioridades abaixo.
+2.	Secundário: (Este prompt foca APENAS na classificação).
+
+Contexto Geral: Mensagens de clientes/público sobre posts/conteúdos do Itaú e submarcas (produtos, serviços, atendimento, plataformas, campanhas, patrocínios, imagem). Reações curtas são contextuais ao post original.
+
+=== REGRAS GERAIS E DE OURO ===
+1.  Análise Dupla Obrigatória: Sentimento + Tema para cada mensagem.
+2.  **APLIQUE AS REGRAS DE "NÃO CLASSIFICADO" PRIMEIRO:** Se a mensagem se encaixar em QUALQUER critério de Não Classificado (ver seção NC abaixo), classifique IMEDIATAMENTE como Sentimento: Não Classificado, Tema: Não Classificado (Tema) e NÃO prossiga. Só avance para P/N/Neutro se NENHUM critério NC se aplicar.
+3.  Priorize P/N/Neutro: Se não for NC, use as definições abaixo.
+4.  Vinculação NC Estrita: Se Sentimento = Não Classificado, Tema DEVE SER SEMPRE Não Classificado (Tema). SEM EXCEÇÕES.
+5.  Foco no Conteúdo Relevante: Ignore ruídos como saudações isoladas no início/fim se houver conteúdo principal. Classifique com base na intenção principal da mensagem.
+
+=== NÃO CLASSIFICADO (APLICAR PRIMEIRO!) ===
+4.	Não Classificado: APLICAR **OBRIGATORIAMENTE E PRIORITARIAMENTE** SE A MENSAGEM ATENDER A UM DESTES CRITÉRIOS (ANTES de tentar P/N/Neutro):
+    1.	**Idioma Estrangeiro (predominante):** Ex: "What time?", "gracias por venir", "Do not sleep on solta o pavo", "You ❤️ vírus", "@itau We are urging...".
+    2.	**Incompreensível:** Erros graves, digitação aleatória, texto sem sentido lógico, gírias/termos muito específicos e incompreensíveis sem contexto. Ex: "asdf ghjk", "L0p9l9", "Kbut", ".oitoitoitameiamei", "Tadala! K", "Só química por são broxar", "Mercado de banco", `^`, `>>`, "👑🌎👑".
+    3.	**Menção @ Isolada ou Menção + Texto Incompleto/Ambíguo:** Contém APENAS o símbolo `@` isolado, ou menção (@ ou []) mas o texto acompanhante é incompreensível, ambíguo demais para classificar, ou apenas uma letra/número/emoji sem contexto claro. Ex: `"@"` (como única mensagem), `@itau p`, `@itau 2`, `@itau ...`, `@2🥺`. **NÃO inclui menção a usuário isolada (ex: `@pedrotavares`), que é Positivo/Interação.**
+    4.	**Spam/Link Isolado:** Conteúdo repetitivo óbvio (Illuminati, Pedidos de amizade), promoções não relacionadas, propaganda de terceiros, URL isolada SEM contexto relevante ou explicação. Ex: "Confira: https://...", "https://t.co/xxxxx", "Buy #Bitcoin 👍", "Apostas Grátis...", "@c................:não traduza...", "Carlos Correa Você quer se tornar...", "Helcia Ione Olá 🤗...", "As indicações da @eu.luisaschz é surreal...", "Gente to com uma plataforma nova boa...", "Revendo IPTV me chamem".
+    5.	**Totalmente Off-Topic:** Assunto sem QUALQUER conexão clara com Itaú, bancos, finanças, produtos/serviços financeiros, a campanha/evento em questão, ou figuras públicas associadas. Ex: "Receita de bolo", "Anistia já!", "É movimento pro Alckmin assumir?", "@que Deus abençoe vocês...", "ESTOU COM DOR ORE POR MIM", "@moço de onde é esse calendário?", "Trump está chegando...", "Vocês atendem a N.O.M.", comentário sobre time de futebol não relacionado a patrocínio, "@Não, obrigado... De repetição já ch ga minha mulher reclamando.", "Hermes trismegisto...", "Fernanda Torres é Truong My Lan.", "Roupa de cama e toalha cheirosinha...", "hoje em dia faz sol e eu penso...", "Nv cash melhor", "Cadê a sobrancelha?", "Spotfy e netflix", "A NOSSA CAMISA JAMAIS SERÁ VERMELHA...", "Quem fala :   QUEM ME CONHECE, SABE...", "tem o banco central para resolver tudo isso...", "Gente esquisita, papo estranho!", "Ggmax", "Papa francisco", "Não.dependo.de.baco", "Assistem ao filme : Polícia Federal...", "O dedo de marcar meu cunhado chega coçar", "Eu sou inturiana com ascendente planilheriana 🤭", "Consulta urgente = devo comprar passagem...", "pois é minha amiga Deus escreve certo...", "mamae". **Inclui discussões sobre pirataria/alternativas não oficiais:** "Compro na gg Max combo...", "Gatonet sempre salvando", "Eles pagam pra ver filmes...", "Não gasto nada eu baixo música...", "Uso gato. Kkk", "I ❤️ torrent", "20 reais IPTV viva a pirataria", "Eu uso youcine...", "20 reais no youcine tenho tudo kkkkk", "Rede Canais reina", "Tmj YouCine e CineVs", "Vendo filme no redecanais...", "Avisa aí que vende um aparelho...".
+    6.	**Interação Social Pura Textual/Emoji Isolada:** Mensagem contém APENAS saudações/despedidas ("Bom dia", "Boa noite amigo", "@BOA TADE", "Oi", "Tchau"), APENAS risadas textuais ("kkkk", "rsrs", "😂😂😂😂", "Kkkkkk aiai"), APENAS agradecimentos/expressões religiosas genéricas isoladas ("Obg", "Amem", "@amem", "Amém 🙏🙏"), APENAS concordâncias curtas isoladas ("Isso aí"), ou APENAS emojis de interação social ou pontuação isolados. Ex: "@amem", "@boa noite", "kkkk", "👍" (isolado), "❤️" (isolado), `☺️` (isolado), `@Oi?`, `!!!!!!!!!!!!!!` (isolado), `.` (isolado), `😂` (isolado). *NÃO aplicar se a interação acompanha conteúdo classificável (Ex: "kkkk adorei" -> classificar "adorei").*
+
+=== DEFINIÇÕES DE SENTIMENTO (Escolha UMA, APÓS verificar regras NC) ===
+
+1.	Positivo: Expressa satisfação, apoio, entusiasmo, gratidão genuína, apreciação (mesmo moderada), concordância clara, ou engajamento positivo explícito, **incluindo menção a usuário isolada ou @respostas vagas com tom positivo.**
+    *   Indicadores: **Menção a usuário isolada (Ex: `@pedrotavares`, `[Luiz Erik]`, `@katia.alje`, `@livinhalp_`) - SEMPRE Positivo/Interação Social.** **@Respostas vagas com interjeições/emojis positivos (Ex: `@rafabarrosr aaaaa feliz demais 🧡`, `@victorreegis 🧡!`, `@_a.amandah ebaaaa!...`, `@gggggabito UHULLL`, `@juliavarga ❤️❤️`, `@stephaniebegami ❤️`) - Positivo/Interação Social.** Elogios claros ("Amei", "Top", "Excelente", "Maravilhoso", "Grande Mestre", "Melhor propaganda", "amo amo", "A dicção dessa mulher é um absurdo." [elogio], "itau pfvr nao teria pessoa melhor", "GENTE EH COM MTA ALEGRIA Q ANUNCIO Q EU E @itau ESTAMOS BEM...", "Que bom oubrigado"), Agradecimentos específicos, Apoio/Torcida ("Parabéns", "QUEREMOS TURNÊ!", "Vocês são os MAIORAIS"), Apreciação ("Belo post", "Interessante", "De arrepiar", "Kkkkkk arrepiou aqui também"), Concordância explícita positiva; **Influência positiva por figura pública ("Silêncio estou estudando com a Ari Segatto", "recebi a notificação... mas já que a julia falou, vou ver")**, **Intenção positiva ("Agora vou correndo abrir minha conta", "quero fazer as pazes com o itaú tb!!!", "eu que pedi essa categoria...")**. Emojis claramente positivos isolados ou acompanhando texto positivo (😍, ❤️, 👍, 🎉, ✨, 👏, 🙌, 🙏, 🫶, 💖, 🧡, 💙, ✨❤️, 😂👏, 🙌👏, 👑🌎👑, 😘, 👄, 🌷, 🌹); Combinações Texto/Emoji Positivo. **Focar no ponto principal em mensagens mistas (Ex: "@itau Alguem q investe em musica de verdade e nao essa bosta de sertanejo... Salve Jorge!!!" -> Foco no "investe em musica de verdade/Salve Jorge" -> Positivo).**
+
+2.	Negativo: Expressa insatisfação, crítica, raiva, frustração, reclamação, tristeza, **sarcasmo, ironia, deboche, acusação**, ou **afirmação/relato direto** de problema, falha, erro, golpe, fraude ou experiência ruim.
+    *   Indicadores: Críticas diretas ("Péssimo", "Banco lixo", "Que bosta", "A MOÇA DO ITAÚ... FUI ENGANADO.", "É muita reclamação", "Itaú está péssimo", "Pior banco"), **Relato/afirmação de problemas ("Não funciona CDB", "Cobrança indevida", "Fui vítima de golpe", "@itau Erro TED", "não estava conseguindo acessar o app", "@itau Cuidado com o app...Banco não computa...", "Fizeram a migração sem minha autorização... Cadê meu dinheiroooo? 😡😡🙄", "Bug na migração... chave Pix... sumiu", "O Itaú é uma porcaria pra entrar...", "Carregador portátil não funciona.")**, Reclamações diretas ("Atendimento horrível", "Péssimo atendimento"), Insatisfação direta ("Taxa alta", "Quero taxa mais baixa", "Pago um monte de taxas...", "limite tinha diminuido", "Assisti esperando... antigamente tinham vários descontos... hoje não tem mais nada 🤨"), Frustração (CAIXA ALTA negativa), Advertência ("Não recomendo"); **Sarcasmo/Ironia/Deboche (Ex: "@itau São 86 anos de Alquimia!...Pedra Filosofal!", "Que ótimo, o app caiu de novo", "Acho uma afronta mostrar quanto a gente gasta... 😂", "aiii deixa só o itaú ver o cachorro quente...", "Muquirana que gasta tudo...", "puts a casa caiu")**; **Provocação/Comparação negativa com concorrente (Ex: "@abibfilho na dúvida vou chamar o @bancodobrasil...")**; **Acusação/Denúncia (Ex: "#ÉTudoGolpeDessaMiseravel👹", "BANCO ITAÚ SE RECUSA A PAGAR...", "Cancelando minha conta, Absurdo nao comprir uma ordem judicial...", "A propaganda e bonita, mas na prática? O que estão fazendo?", "Cala boca itau", "e fria] o banco nao procura vc]", "Pior banco da vida!!!!!! Mais de três meses para a liberação...", "‼️‼️‼️NÃO USEM O BANCO ITAÚ! ‼️‼️‼️ Dia 09/04/25 meu pai sofreu um sequestro...", "@leanvsz @itau se pronuncie", "@itau qual é o problema em liberar o dinheiro...", "Que merda hein itauzinho?", "Que situação, bloqueou o dinheiro...", "Acho que o Itaú deve ter gastado...", "Verdade,@ Itaú principalmente de vocês que enganam com consórcio", "Quando vão tomar uma atitude...", "Estão fazendo cliente de refém?????", "Cadê o dinheiro do Rodrigo Constantino???", "O que falta para liberar a conta...", "Este banco este deixando o #rodrigoconstantino morrer...", "Roubando dinheiro do Constantino????", "Itaú libera o dinheiro...", "Gastaram o $$$ do Constantino????", "Quem for de direita tem o dever de encerrar...", "Cancelando minha conta no Itaú!!!!", "Devolvam o $$$$ do #rodrigoconstantino !!!!!", "Tá na hora de tirar o patrocínio da CBF...", "@itau por que não liberaram o dinheiro...", "CANCELANDO na semana que vem minha contra Itaú empresas...", "Desbloqueiem a conta do @rodrigoconstantino...", "E o $$$ do Constantino????? Comeram???", "Se não desbloquearem as contas...", "Que banco é esse???? Militante também?", "Itaú agora é parceira oficial da corrupção.", "Quem financia bandido, vira cúmplice.", "Saia, esse banco vive de mãos dadas com a corrupção.", "Sai desse banco desumano...", "@goncaloassisbrasil esse banco Itaú é terrível")**, **Pedido de cancelamento explícito ("Cancelei com sussesso")**, **Comentários depreciativos vagos ("AQUELA TIPICA RICA NOJENTA...", "Pobre")**, **Perguntas acusatórias/retóricas sobre problemas graves ou sensíveis (Ex: "Cadê meus rendimentos que estavam no ITI?")**, **Mocking/Deboche (Ex: "KKKKKK QUEM TE COMHECE?", "Carai, parece uma entidade ...kkk")**. Emojis claramente negativos (😠, 😡, 👎, 😢, 💩, 🤮, 🤢, 😪). Comentários sobre política/governo associados negativamente ao banco. Afirmação "Bom, mas..." (Ex: "O banco Itaú é bom, mas o chat é meio devagar...") -> Negativo. Reclamação sobre spam ("NÃO QUERO RECEBER OFERTA DE CONSIGNADO."). Declaração de problema/sentimento negativo ("Meu Deus se eu olhar o meu 🤦🏻‍♀️🥲", "Pequenos gastos, grandes prejuízos 😅", "E consegui dormir com fome?").
+
+3.	Neutro: Busca/fornece informação, observação factual, **pergunta** (mesmo sobre problemas simples), **sugestão**, **pedido**, expressão de equilíbrio, **relato de experiência sem forte valência P/N**, ou reação ambígua. **Pedidos/Sugestões/Perguntas são GERALMENTE Neutros, mesmo com emojis positivos/negativos leves se o foco for o pedido/pergunta.**
+    *   Indicadores: **Perguntas objetivas/informativas/sobre problemas simples ("Como faço?", "Quando terá?", "O que isso tem a ver?", "@itau @jorgebenjor divo o app de vcs ta fora do ar?" [simples], "@itau oloko ele ainda tá vivo?", "@itau Os ruanistas?", "@cabedelos show em cabedelo*", "Pera,isso é pra mim saber ou eles?")**; Respostas a perguntas; **Pedidos/Sugestões diretas ("@itau Aumenta meu limite 👍", "@itau tragam #technotronic", "Me da dinheiro kkkk", "Me da um emprego🙏", "@itau Itaú ? Faz uma publi...", "@itau ITAÚ ME LEVA PRO THE TOWN", "@tatinhagrassi pede pra ele...", "@itau, ajuda nós que somos clientes Uniclass...", "Oferece o recovery @itau !!!", "@itau direct responder lá", "Preciso de ajuda", "@itau quando tu vai lançar a boa com um CDB...")**; Expressões de equilíbrio ("Ok", "0 sigo a vida com propagandas mesmo 😅", "Não gasto nada.", "Assinaturas não quer dizer...", "TODAS AS VEZES QUE ABRIREM UMA AGÊNCIA, ABRAM UMA SÓ PARA IDOSOS...", "Não devo nada."); **Relato de experiência sem forte valência P/N ("Sim mano, uso todo streaming...", "to precisando disso", "to precisando desse controle...", "Sou cliente Itaú", "EU sou cliente Itaú", "Parei de ver em roupinha pra o pet. 😂", "Isso que dá pensar entre comprar uma moto e um sapato...")**. Observações factuais/neutras ("O Rock in Rio é patrocinado", "Entendido", "Les alchimistes", "Ainda bem que não gosto de café 😂", "Juntando todas 😂😂😂", "Meu perfil de compras é aquele que de fato compra 😂", "Kkkkk o meu foi os cafezinhos mesmo", "se for o cafézinho da Deola, é o dobro"); **@Respostas vagas sem forte tom positivo/negativo (Ex: `@gabirichard eu tbem`, `@icaro.__ fortíssimo`, `@icaro.__ vemvem`, `@mendes_isabella seráãn?`, `@jorgediegopeixoto oi Jorge...`, `@jose07.dias o mlk q fala isso kkkk`, `@peraltamariane mulher não estraga a publi...`)**. Emojis ambíguos padrão isolados (🙏, 🤔, 👀, `[👈😀👈]`); Termos/siglas ("ESG"). Avisos/Declarações factuais ("@itau JORGE BEN JOR NAO DEIXE A POLITICA TE USAR", "Não conheço esse país").
+
+=== DEFINIÇÕES DE TEMA (Escolha UMA - Aplicar Regras de Prioridade Abaixo, SOMENTE SE NÃO FOR NC) ===
+***IMPORTANTE: Use EXATAMENTE um dos nomes de Tema 1 a 9 abaixo. Se Sentimento = Não Classificado, Tema = Não Classificado (Tema).***
+
+1.	Marca e Imagem: Percepção geral da marca Itaú ou submarcas, reputação, campanhas institucionais, patrocínios gerais. Críticas/elogios genéricos ao banco. Intenção de abrir/cancelar conta sem motivo específico. (Sentimento: P/N/Neutro)
+2.	Produtos e Serviços (Geral): Sobre cartões, contas, seguros, investimentos (CDB, LCI, íon), crédito (consignado, financiamento), taxas, limites, benefícios, portabilidade, consórcio, espólio. (Sentimento: P/N/Neutro)
+3.	Atendimento e Suporte: Sobre canais (agência, telefone, chat, SAC, Ouvidoria), qualidade do suporte, resolução de problemas pelo atendimento, demora, falta de retorno. (Sentimento: P/N/Neutro)
+4.	Plataformas Digitais (App/Site/ATM): Feedback sobre usabilidade, design, funcionalidades (PIX, TED, DOC, login, reconhecimento facial, cofrinho, controle de gastos), performance/disponibilidade de app, site, caixas eletrônicos. (Sentimento: P/N/Neutro)
+5.	Figuras Públicas e Representantes: Foco em atletas, influenciadores, creators, "laranjinhas", executivos, artistas (Jorge Ben Jor, Julia Iorio, Ari Segatto, Fran) associados a campanhas ou à marca. Comentários sobre o desempenho/influência deles na campanha. (Sentimento: P/N/Neutro)
+6.	Eventos e Campanhas Específicas: Discussões focadas em evento/campanha nomeado (Rock in Rio, The Town, Mapa Gastal), logística, experiência, tema. (Sentimento: P/N/Neutro)
+7.	Segurança e Fraude: Sobre golpes, fraudes (sequestro, Pix indevido), segurança da conta, phishing, roubos, cobranças indevidas percebidas como erro grave/golpe, bloqueio de contas/recursos (caso Constantino). (Sentimento: Geralmente Negativo, pode ser Neutro)
+8.	**Solicitação/Dúvida/Sugestão (Transversal):** Prioridade média. Usar quando o FOCO PRINCIPAL da mensagem (Sentimento **Neutro**) é uma pergunta, pedido ou sugestão sobre QUALQUER tema (produto, serviço, evento, plataforma, atendimento, etc.). Ex: "App fora do ar?", "Aumenta meu limite", "Faz publi com Davi", "Liberem acesso sala VIP", "Direct responder lá". (Sentimento: **Neutro**)
+9.	**Interação Social e Engajamento:** Prioridade MÍNIMA. Usar SOMENTE para: **Menção a usuário isolada (@username) - SEMPRE Positivo**; **@Respostas vagas (sem pergunta/pedido/sugestão/crítica/elogio direto ao Itaú/campanha) - Geralmente Neutro (Ex: `@gabirichard eu tbem`) ou Positivo (Ex: `@rafabarrosr aaaaa feliz demais 🧡`)**; Emojis P/N/Neutro ISOLADOS sem outro tema claro. (Sentimento: Conforme caso).
+10.	Não Classificado (Tema): Exclusivamente quando Sentimento = Não Classificado.
+
+=== REGRAS DE PRIORIDADE PARA TEMAS (Aplicar SOMENTE SE NÃO FOR NC) ===
+Aplique na seguinte ordem. Se a mensagem se encaixar em múltiplos temas, escolha o primeiro da lista que se aplicar:
+1.	Segurança e Fraude: (Prioridade Máxima) Se mencionar golpe, fraude, segurança, bloqueio de contas/recursos, cobrança indevida grave.
+2.	Plataformas Digitais (App/Site/ATM): Se o feedback (P/N/Neutro - *exceto se for SÓ pergunta/pedido/sugestão*) for especificamente sobre essas plataformas (app fora do ar, PIX não funciona, usabilidade, controle de gastos no app).
+3.	Atendimento e Suporte: Se o foco (P/N/Neutro - *exceto se for SÓ pergunta/pedido/sugestão*) for a interação com canais de atendimento (chat, SAC, agência, gerente).
+4.	Produtos e Serviços (Geral): Se sobre características, taxas, contratação/cancelamento, limites, rendimentos, portabilidade de produtos/serviços (conta, cartão, CDB, LCI, crédito, consórcio, espólio). (P/N/Neutro - *exceto se for SÓ pergunta/pedido/sugestão*).
+5.	**Solicitação/Dúvida/Sugestão (Transversal):** Se o foco principal for a pergunta/pedido/sugestão em si (Sentimento Neutro).
+6.	Eventos e Campanhas Específicas: Se claramente focado em um evento/campanha nomeado (Mapa Gastal, The Town).
+7.	Figuras Públicas e Representantes: Se o foco principal for a pessoa/representante (elogio/crítica a Julia Iorio, Ari Segatto, Jorge Ben).
+8.	Marca e Imagem: Para comentários gerais sobre a marca/reputação/patrocínios gerais ou críticas/elogios vagos sem especificar produto/serviço/canal/plataforma. Intenção de abrir/cancelar conta.
+9.	**Interação Social e Engajamento:** Para @username isolado (Positivo), @respostas vagas, emojis isolados. (Prioridade Mínima).
+10.	Não Classificado (Tema): Apenas se Sentimento = Não Classificado.
+
+=== INSTRUÇÕES ADICIONAIS DE CLASSIFICAÇÃO ===
+*   Formato de Resposta: EXATAMENTE DUAS LINHAS, SEMPRE:
+    Sentimento: [Nome Exato da Categoria de Sentimento]
+    Tema: [Nome Exato da Categoria de Tema]
+    (Não inclua NADA MAIS).
+*   **Priorize NÃO CLASSIFICADO:** Verifique TODAS as regras de NC primeiro. Se alguma aplicar, use NC/NC(Tema) e PARE.
+*   Aplicar Prioridade de Tema: Se não for NC, siga estritamente as regras de prioridade de tema.
+*   Detectar Sarcasmo/Ironia/Deboche: Identificar (contradições, elogios exagerados, comparações negativas, tom zombeteiro) e classificar como **Negativo**. Tema segue prioridade. Ex: "@itau São 86 anos...", "@abibfilho na dúvida vou chamar o @bancodobrasil...", "Acho uma afronta mostrar... 😂".
+*   **Menções:** `@` isolado -> NC. `@username` isolado -> Positivo/Interação. `@` + texto claro -> Classificar pelo texto. `@` + texto vago/resposta -> Neutro/Interação ou Positivo/Interação (se claramente positivo). `@` + texto incompreensível -> NC.
+*   Emojis: Emojis positivos em pedidos/sugestões/perguntas NÃO tornam o sentimento Positivo -> **Neutro**. Emojis negativos isolados -> Negativo/Interação. Emojis positivos isolados -> Positivo/Interação. Emojis neutros/risada isolados -> NC.
+*   **Perguntas:** Informativas/Problemas simples -> **Neutro/Solicitação ou Tema relevante**. Acusatórias/Problemas graves/Repetitivas/Emocionais -> **Negativo/Tema relevante (Segurança, Atendimento, etc.)**.
+*   Ênfase (!!!, ???): Modifica/reforça sentimento base. Isolado (`!!!!!!!!!!!!!!`) -> NC.
+*   **Mensagens Mistas:** Classifique pelo elemento PREDOMINANTE/FOCO PRINCIPAL (Reclamação/Problema Grave/Fraude/Sarcasmo > Elogio > Pergunta/Sugestão/Observação Neutra). Ex: Critica sertanejo mas elogia Itaú/Jorge Ben -> **Positivo / Figuras Públicas ou Marca e Imagem**. Ex: "Banco bom, mas chat devagar" -> **Negativo / Atendimento e Suporte**.
+*   "Absurdo": Se usado como gíria de intensidade positiva (Ex: "dicção absurda") -> Positivo. Se usado literalmente -> Negativo. Analisar contexto.
+
+Agora, classifique a seguinte mensagem:
+{comment}
+"""
+
+
+# --- Prompt para Classificação em Lote ---
+# Reaproveita todas as regras do prompt principal e troca apenas o formato de resposta e a mensagem final,
+# para enviar vários comentários numerados em uma única chamada.
+prompt_regras_classificacao = seu_prompt_completo.split("Agora, classifique a seguinte mensagem:")[0]
+prompt_lote_sufixo = """
+=== FORMATO DE RESPOSTA PARA LOTE (SUBSTITUI O FORMATO DE DUAS LINHAS ACIMA) ===
+*   Você receberá VÁRIAS mensagens numeradas no formato "[ID n] texto". Classifique CADA mensagem de forma INDEPENDENTE, aplicando todas as regras acima.
+*   Para CADA mensagem, responda EXATAMENTE TRÊS LINHAS, na mesma ordem recebida:
+    ID: [número da mensagem]
+    Sentimento: [Nome Exato da Categoria de Sentimento]
+    Tema: [Nome Exato da Categoria de Tema]
+*   Não pule nenhum ID, não junte mensagens e não inclua NADA MAIS.
+
+Agora, classifique as seguintes mensagens:
+{comentarios_numerados}
+"""
+
+
+# --- Prompts e Esquemas para Resposta Estruturada (JSON) ---
+# Mesmas regras; a resposta é um JSON restrito por response_schema às categorias válidas, então não há texto livre para interpretar.
+FORMATO_TEXTO = "texto"
+FORMATO_JSON = "json"
+formatos_resposta = [FORMATO_TEXTO, FORMATO_JSON]
+prompt_json_completo = prompt_regras_classificacao + """
+=== FORMATO DE RESPOSTA JSON (SUBSTITUI O FORMATO DE DUAS LINHAS ACIMA) ===
+*   Responda APENAS com um objeto JSON com os campos "s" (Nome Exato da Categoria de Sentimento) e "t" (Nome Exato da Categoria de Tema).
+
+Agora, classifique a seguinte mensagem:
+{comment}
+"""
+prompt_lote_json_sufixo = """
+=== FORMATO DE RESPOSTA JSON PARA LOTE (SUBSTITUI O FORMATO DE DUAS LINHAS ACIMA) ===
+*   Você receberá VÁRIAS mensagens numeradas no formato "[ID n] texto". Classifique CADA mensagem de forma INDEPENDENTE, aplicando todas as regras acima.
+*   Responda APENAS com uma lista JSON com um objeto por mensagem, na mesma ordem recebida, com os campos "id" (número da mensagem), "s" (Nome Exato da Categoria de Sentimento) e "t" (Nome Exato da Categoria de Tema).
+*   Não pule nenhum ID e não junte mensagens.
+
+Agora, classifique as seguintes mensagens:
+{comentarios_numerados}
+"""
+
+
+# --- Prompt para Geração de Insights ---
+prompt_geracao_insights = """
+Persona: Você é um Analista de Social Listening Sênior, especializado no Banco Itaú e seu ecossistema. Sua tarefa é interpretar um resumo de dados de classificação de sentimentos e temas de comentários de clientes/público e gerar insights acionáveis.
+
+Contexto: Você recebeu um resumo da análise de {total_comentarios_analisados} comentários. As classificações foram feitas seguindo critérios específicos para o Itaú (Sentimento: Positivo, Negativo, Neutro, NC; Temas: Marca, Produtos, Atendimento, Plataformas, Figuras Públicas, Eventos, Segurança, Interação, Solicitação, NC).
+
+Dados de Resumo Fornecidos:
+*   Distribuição Geral de Sentimentos (Total: {total_comentarios_analisados}):
+    - Positivo: {count_pos} ({perc_pos:.1f}%)
+    - Negativo: {count_neg} ({perc_neg:.1f}%)
+    - Neutro: {count_neu} ({perc_neu:.1f}%)
+    - Não Classificado / Erros: {count_nc_err} ({perc_nc_err:.1f}%)
+*   Top 5 Temas Mais Comentados (Excluindo Interação Social, NC e Erros. Total destes temas: {total_temas_insights}):
+{top_temas_formatado}
+*   Top 3 Temas Associados ao Sentimento NEGATIVO (Total de comentários negativos com tema válido: {total_temas_neg}):
+{top_temas_negativos_formatado}
+
+Tarefa: Com base EXCLUSIVAMENTE nos dados de resumo fornecidos acima, elabore um bloco conciso de "Insights e Percepções Acionáveis". Organize sua resposta usando os seguintes tópicos em Markdown:
+
+### Principais Destaques Positivos:
+*   (Comente a proporção de comentários positivos. Se houver dados nos Top Temas, relacione o sentimento positivo a algum tema específico, se possível inferir indiretamente. Ex: "Alto volume positivo pode estar ligado a X tema, se este for predominante.")
+
+### Principais Pontos de Atenção (Negativos):
+*   (Comente a proporção de comentários negativos. **Crucialmente, foque nos 'Top 3 Temas Associados ao Sentimento NEGATIVO'**. Identifique as principais áreas de reclamação/crítica. Chame atenção para possíveis "telhados de vidro" ou problemas recorrentes nesses temas.)
+
+### Oportunidades e Sugestões:
+*   (Analise a proporção de comentários Neutros. Se o tema 'Solicitação/Dúvida/Sugestão' aparecer nos Top Temas, indique oportunidade de esclarecimento ou melhoria com base no alto volume de perguntas/pedidos. Se temas negativos recorrentes aparecerem, sugira investigação ou ação específica para mitigar.)
+
+### Observações Gerais:
+*   (Faça um balanço geral. Comente se a distribuição de sentimentos parece saudável ou preocupante. Mencione se a proporção de 'Não Classificado/Erros' é alta, indicando possíveis problemas na coleta ou classificação - *uma % alta de NC após este refinamento pode indicar muitos comentários realmente sem contexto/off-topic ou necessidade de mais ajustes*). Destaque algum tema específico que dominou a conversa, se for o caso.)
+
+Instruções Adicionais:
+*   Seja direto e focado em insights que possam gerar ações para o Itaú.
+*   Baseie-se APENAS nos dados fornecidos no resumo. Não invente informações ou temas não listados.
+*   Se algum dado crucial estiver faltando ou for insuficiente (ex: muito poucos comentários negativos para tirar conclusões sobre temas negativos), mencione essa limitação.
+*   Mantenha a linguagem profissional e analítica.
+*   Use bullet points (*) para listar os insights dentro de cada tópico.
+"""
+
+
+# --- Aviso Adicionado ao Prompt de Insights no Modo Amostragem ---
+prompt_aviso_estimativa = """
+ATENÇÃO - DADOS ESTIMADOS: {descricao}. As contagens e percentuais do resumo abaixo são estimativas para o total de comentários, não contagens exatas. NPS Social estimado: {nps:.1f} (intervalo de confiança de {nps_inferior:.1f} a {nps_superior:.1f}).
+Ao citar números, deixe claro que são estimativas, não trate como relevantes diferenças menores que a margem de erro e mencione essa limitação em "Observações Gerais".
+"""
+
+# --- Listas de Categorias Válidas ---
+categorias_sentimento_validas = ["Positivo", "Negativo", "Neutro", "Não Classificado"]
+categorias_tema_validas = [
+    "Marca e Imagem",
+    "Produtos e Serviços (Geral)",
+    "Atendimento e Suporte",
+    "Plataformas Digitais (App/Site/ATM)",
+    "Figuras Públicas e Representantes",
+    "Eventos e Campanhas Específicas",
+    "Segurança e Fraude",
+    "Solicitação/Dúvida/Sugestão (Transversal)",
+    "Interação Social e Engajamento",
+    "Não Classificado (Tema)"
+]
+# Esquemas do modo JSON: enum limita a resposta às categorias válidas; campos de uma letra ("s" = sentimento, "t" = tema) para encurtar a resposta
+esquema_classificacao_json = {"type": "OBJECT", "properties": {"s": {"type": "STRING", "format": "enum", "enum": categorias_sentimento_validas}, "t": {"type": "STRING", "format": "enum", "enum": categorias_tema_validas}}, "required": ["s", "t"]}
+configuracao_geracao_json = {"response_mime_type": "application/json", "response_schema": esquema_classificacao_json}
+
+def _configuracao_geracao(formato_resposta, tamanho_lote=None):
+    """generation_config da chamada: None no modo texto; no JSON, o esquema de um comentário ou de uma lista com exatamente tamanho_lote itens."""
+    if formato_resposta != FORMATO_JSON: return None
+    if tamanho_lote is None: return configuracao_geracao_json
+    esquema_lote = {"type": "ARRAY", "min_items": tamanho_lote, "max_items": tamanho_lote, "items": {"type": "OBJECT", "properties": {"id": {"type": "INTEGER"}, **esquema_classificacao_json["properties"]}, "required": ["id", "s", "t"]}}
+    return {"response_mime_type": "application/json", "response_schema": esquema_lote}
+
+categorias_erro = ["Erro Parsing", "Erro API"]
+categorias_erro_tema_especifico = ["Erro API (Timeout)", "Erro API (Geral)", "Erro API (Modelo não iniciado)", "Erro API (Conteúdo Bloqueado)"]
+todas_categorias_erro = list(set(categorias_erro + categorias_erro_tema_especifico))
+categorias_excluir_sentimento = ["Não Classificado"] + todas_categorias_erro
+categorias_excluir_tema = ["Não Classificado (Tema)", "Interação Social e Engajamento"] + todas_categorias_erro
+categorias_erro_cacheaveis = ["Erro API (Conteúdo Bloqueado)"] # Erros determinísticos; os transitórios (Timeout, Geral...) nunca vão para o cache
+safety_settings_padrao = { "HARM_CATEGORY_HARASSMENT": "BLOCK_NONE", "HARM_CATEGORY_HATE_SPEECH": "BLOCK_NONE", "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_NONE", "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE" }
+
+
+# --- Cache Persistente de Classificações ---
+CAMINHO_CACHE_CLASSIFICACAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_classificacao.sqlite3")
+MAX_ENTRADAS_CACHE = 200_000
+
+class CacheClassificacao:
+    """Cache em SQLite das classificações, compartilhado entre execuções.
+
+    A chave é o hash do texto normalizado + prompt + nome do modelo; alterar o
+    prompt invalida automaticamente as entradas antigas. Ao passar de
+    max_entradas, as menos acessadas recentemente (LRU) são removidas.
+    """
+    def __init__(self, caminho=CAMINHO_CACHE_CLASSIFICACAO, max_entradas=MAX_ENTRADAS_CACHE):
+        self.max_entradas = max_entradas; self.acertos = 0; self.falhas = 0; self._gravacoes_desde_limpeza = 0; self._lock = threading.Lock(); self._hashes_prompt = {}
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, timeout=30)
+        with self._lock, self._conexao:
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute("CREATE TABLE IF NOT EXISTS classificacoes (chave TEXT PRIMARY KEY, sentimento TEXT NOT NULL, tema TEXT NOT NULL, categoria_erro TEXT, modelo TEXT NOT NULL, criado_em REAL NOT NULL, ultimo_acesso REAL NOT NULL)")
+            self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_classificacoes_ultimo_acesso ON classificacoes (ultimo_acesso)")
+
+    def _chave(self, comentario, prompt, modelo):
+        hash_prompt = self._hashes_prompt.get(prompt)
+        if hash_prompt is None: hash_prompt = self._hashes_prompt[prompt] = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        texto_normalizado = unicodedata.normalize('NFC', " ".join(comentario.split()))
+        return hashlib.sha256(f"{modelo}\x1f{hash_prompt}\x1f{texto_normalizado}".encode('utf-8')).hexdigest()
+
+    def obter(self, comentario, prompt, modelo):
+        chave = self._chave(comentario, prompt, modelo)
+        with self._lock, self._conexao:
+            linha = self._conexao.execute("SELECT sentimento, tema FROM classificacoes WHERE chave = ?", (chave,)).fetchone()
+            if linha is None: self.falhas += 1; return None
+            self.acertos += 1; self._conexao.execute("UPDATE classificacoes SET ultimo_acesso = ? WHERE chave = ?", (time.time(), chave))
+        return linha[0], linha[1]
+
+    def gravar(self, comentario, prompt, modelo, sentimento, tema):
+        if (sentimento in todas_categorias_erro or tema in todas_categorias_erro) and tema not in categorias_erro_cacheaveis: return
+        categoria_erro = tema if tema in todas_categorias_erro else None; agora = time.time()
+        with self._lock, self._conexao:
+            self._conexao.execute("INSERT OR REPLACE INTO classificacoes VALUES (?, ?, ?, ?, ?, ?, ?)", (self._chave(comentario, prompt, modelo), sentimento, tema, categoria_erro, modelo, agora, agora))
+            self._gravacoes_desde_limpeza += 1
+            if self._gravacoes_desde_limpeza >= 500: self._aplicar_limite()
+
+    def _aplicar_limite(self):
+        # Chamado com o lock já adquirido; a contagem só roda a cada 500 gravações
+        self._gravacoes_desde_limpeza = 0
+        excedente = self._conexao.execute("SELECT COUNT(*) FROM classificacoes").fetchone()[0] - self.max_entradas
+        if excedente > 0: self._conexao.execute("DELETE FROM classificacoes WHERE chave IN (SELECT chave FROM classificacoes ORDER BY ultimo_acesso LIMIT ?)", (excedente,))
+
+    def tamanho(self):
+        with self._lock: return self._conexao.execute("SELECT COUNT(*) FROM classificacoes").fetchone()[0]
+
+    def limpar(self):
+        with self._lock, self._conexao: self._conexao.execute("DELETE FROM classificacoes"); self.acertos = 0; self.falhas = 0
+
+
+# --- Validação de uma Classificação Extraída ---
+def _validar_classificacao(sentimento_extraido, tema_extraido):
+    if sentimento_extraido == "Erro Parsing" or tema_extraido == "Erro Parsing": return "Erro Parsing", "Erro Parsing"
+    if sentimento_extraido not in categorias_sentimento_validas: return "Erro Parsing", "Erro Parsing"
+    if sentimento_extraido == "Não Classificado": return "Não Classificado", "Não Classificado (Tema)"
+    if tema_extraido not in categorias_tema_validas or tema_extraido == "Não Classificado (Tema)": return sentimento_extraido, "Erro Parsing"
+    return sentimento_extraido, tema_extraido
+
+
+# --- Controle Adaptativo de Taxa e Retentativas ---
+MAX_TENTATIVAS_API = 5
+BACKOFF_BASE_SEGUNDOS = 1.0
+BACKOFF_MAXIMO_SEGUNDOS = 30.0
+nomes_erros_transitorios = {"ResourceExhausted", "TooManyRequests", "DeadlineExceeded", "ServiceUnavailable", "InternalServerError", "GatewayTimeout", "TimeoutError", "ConnectionError"}
+
+def _eh_conteudo_bloqueado(erro):
+    return isinstance(erro, genai.types.StopCandidateException) or type(erro).__name__ == "StopCandidateException"
+
+def _motivo_retentativa(erro):
+    """Motivo para erros transitórios (que valem nova tentativa) ou None para os definitivos."""
+    if _eh_conteudo_bloqueado(erro): return None # Bloqueio de conteúdo nunca é reenviado
+    nome_erro = type(erro).__name__; mensagem = str(erro).lower()
+    if nome_erro in ("ResourceExhausted", "TooManyRequests") or "429" in mensagem or "resource exhausted" in mensagem or "quota" in mensagem or "rate limit" in mensagem: return "Cota excedida (429)"
+    if nome_erro in ("DeadlineExceeded", "GatewayTimeout", "TimeoutError") or "timeout" in mensagem or "timed out" in mensagem or "deadline exceeded" in mensagem: return "Timeout"
+    if nome_erro in nomes_erros_transitorios or "unavailable" in mensagem or "503" in mensagem: return "Serviço indisponível"
+    return None
+
+class ControleTaxa:
+    """Controle de taxa compartilhado entre as threads do pool.
+
+    Combina um token bucket (teto de requisições por minuto; rpm <= 0 desativa) com
+    um limite de chamadas simultâneas ajustado por AIMD: cai pela metade quando
+    surgem erros transitórios e volta a subir devagar (+1 a cada "janela" de
+    sucessos) até max_concorrencia. Também conta as retentativas por motivo.
+    """
+    def __init__(self, rpm=0, max_concorrencia=8):
+        self.max_concorrencia = max(1, int(max_concorrencia)); self.limite_concorrencia = float(self.max_concorrencia); self._ativos = 0; self._condicao = threading.Condition()
+        self.taxa_por_segundo = rpm / 60.0 if rpm and rpm > 0 else 0.0; self.capacidade = max(1.0, min(float(self.max_concorrencia), self.taxa_por_segundo)); self._tokens = self.capacidade; self._ultima_recarga = time.monotonic()
+        self._ultima_reducao = 0.0; self.retentativas = Counter(); self.falhas_definitivas = Counter(); self.chamadas = 0
+
+    def _aguardar_token(self):
+        if self.taxa_por_segundo <= 0: return
+        while True:
+            with self._condicao:
+                agora = time.monotonic(); self._tokens = min(self.capacidade, self._tokens + (agora - self._ultima_recarga) * self.taxa_por_segundo); self._ultima_recarga = agora
+                if self._tokens >= 1: self._tokens -= 1; return
+                espera = (1 - self._tokens) / self.taxa_por_segundo
+            time.sleep(espera)
+
+    def adquirir(self):
+        with self._condicao:
+            while self._ativos >= int(self.limite_concorrencia): self._condicao.wait()
+            self._ativos += 1
+        self._aguardar_token()
+
+    def liberar(self, sucesso=True, motivo_erro=None):
+        with self._condicao:
+            self._ativos -= 1; self.chamadas += 1
+            if sucesso: self.limite_concorrencia = min(self.max_concorrencia, self.limite_concorrencia + 1 / self.limite_concorrencia)
+            elif motivo_erro and time.monotonic() - self._ultima_reducao > 1.0:
+                # Uma redução por rajada de erros: várias threads falhando juntas não derrubam o limite a zero
+                self.limite_concorrencia = max(1.0, self.limite_concorrencia / 2); self._ultima_reducao = time.monotonic()
+            self._condicao.notify_all()
+
+    def registrar_retentativa(self, motivo):
+        with self._condicao: self.retentativas[motivo] += 1
+
+    def registrar_falha_definitiva(self, motivo):
+        with self._condicao: self.falhas_definitivas[motivo] += 1
+
+    def resumo(self):
+        with self._condicao: return {"chamadas": self.chamadas, "retentativas": dict(self.retentativas), "falhas_definitivas": dict(self.falhas_definitivas), "concorrencia_final": round(self.limite_concorrencia, 1)}
+
+# --- Telemetria das Chamadas à API ---
+# Preços de referência do gemini-1.5-flash (US$ por 1 milhão de tokens, prompts de até 128k tokens)
+PRECO_ENTRADA_POR_MILHAO_TOKENS = 0.075
+PRECO_SAIDA_POR_MILHAO_TOKENS = 0.30
+RESULTADO_SUCESSO = "Sucesso"
+
+def _categoria_resultado_erro(erro):
+    if _eh_conteudo_bloqueado(erro): return "Conteúdo Bloqueado"
+    return _motivo_retentativa(erro) or "Erro Geral"
+
+MAX_REGISTROS_TELEMETRIA = 10_000 # Registros mantidos em memória para exportar_jsonl (os mais recentes)
+TAMANHO_AMOSTRA_LATENCIAS = 10_000 # Amostra aleatória (reservatório) usada nos percentis de latência
+
+class TelemetriaAPI:
+    """Registro de cada chamada lógica ao Gemini (incluindo suas retentativas), seguro entre threads.
+
+    nova_chamada devolve o registro (um dict); _gerar_conteudo preenche duração,
+    tokens, tentativas e resultado, quem interpreta a resposta pode trocar o
+    resultado para "Erro Parsing" e, por fim, concluir consolida o registro.
+    A memória não cresce com o número de chamadas: resumo usa só totais
+    acumulados e uma amostra de latências, apenas os últimos max_registros
+    ficam disponíveis para exportar_jsonl, e com arquivo cada registro
+    concluído é gravado ali como uma linha JSON.
+    """
+    def __init__(self, arquivo=None, max_registros=MAX_REGISTROS_TELEMETRIA):
+        self._arquivo = open(arquivo, 'w', encoding='utf-8') if arquivo else None; self._lock = threading.Lock(); self._max_registros = max_registros; self.limpar()
+
+    def nova_chamada(self, operacao, comentarios=1, modelo=None):
+        return {"operacao": operacao, "modelo": modelo, "comentarios": comentarios, "inicio": time.time(), "segundos": None, "tentativas": 0, "tokens_prompt": None, "tokens_resposta": None, "resultado": None}
+
+    def concluir(self, registro):
+        if registro["segundos"] is None: return
+        with self._lock:
+            self.registros.append(registro); self._chamadas += 1; self._por_operacao[registro["operacao"]] += 1; self._resultados[registro["resultado"]] += 1
+            self._tentativas_extras += max(0, registro["tentativas"] - 1); self._tokens_prompt += registro["tokens_prompt"] or 0; self._tokens_resposta += registro["tokens_resposta"] or 0
+            if registro["tokens_prompt"] is None: self._sem_uso_informado += 1
+            if registro["operacao"] != "insights":
+                self._comentarios += registro["comentarios"]; self._tokens_classificacao += (registro["tokens_prompt"] or 0) + (registro["tokens_resposta"] or 0)
+                self._inicio_classificacao = min(self._inicio_classificacao, registro["inicio"]); self._fim_classificacao = max(self._fim_classificacao, registro["inicio"] + registro["segundos"])
+            # Amostragem por reservatório: cada latência tem a mesma chance de estar na amostra
+            if len(self._latencias) < TAMANHO_AMOSTRA_LATENCIAS: self._latencias.append(registro["segundos"])
+            elif (posicao := random.randrange(self._chamadas)) < TAMANHO_AMOSTRA_LATENCIAS: self._latencias[posicao] = registro["segundos"]
+            if self._arquivo: self._arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+    def limpar(self):
+        with self._lock:
+            self.registros = deque(maxlen=self._max_registros); self._latencias = []; self._chamadas = 0; self._por_operacao = Counter(); self._resultados = Counter()
+            self._tentativas_extras = 0; self._tokens_prompt = 0; self._tokens_resposta = 0; self._sem_uso_informado = 0; self._comentarios = 0; self._tokens_classificacao = 0
+            self._inicio_classificacao = float('inf'); self._fim_classificacao = float('-inf')
+
+    def fechar(self):
+        if self._arquivo: self._arquivo.close(); self._arquivo = None
+
+    def resumo(self, preco_entrada=PRECO_ENTRADA_POR_MILHAO_TOKENS, preco_saida=PRECO_SAIDA_POR_MILHAO_TOKENS):
+        with self._lock:
+            if not self._chamadas: return None
+            latencias = np.array(self._latencias); duracao = max(0.0, self._fim_classificacao - self._inicio_classificacao) # 0 se não houve chamada de classificação
+            return {
+                "chamadas": self._chamadas, "chamadas_por_operacao": dict(self._por_operacao), "resultados": dict(self._resultados),
+                "tentativas_extras": self._tentativas_extras, "comentarios_enviados": self._comentarios, "comentarios_por_segundo": self._comentarios / duracao if duracao > 0 else None,
+                "latencia_p50": float(np.percentile(latencias, 50)), "latencia_p95": float(np.percentile(latencias, 95)), "latencia_p99": float(np.percentile(latencias, 99)),
+                "tokens_prompt": self._tokens_prompt, "tokens_resposta": self._tokens_resposta, "tokens_por_comentario": self._tokens_classificacao / self._comentarios if self._comentarios else None,
+                "chamadas_sem_uso_informado": self._sem_uso_informado,
+                "custo_estimado_usd": (self._tokens_prompt * preco_entrada + self._tokens_resposta * preco_saida) / 1_000_000,
+            }
+
+    def exportar_jsonl(self):
+        """Uma linha JSON por chamada (as últimas max_registros), para análise externa (pandas.read_json(..., lines=True))."""
+        with self._lock: registros = [dict(registro) for registro in self.registros]
+        return "\n".join(json.dumps(registro, ensure_ascii=False) for registro in registros) + ("\n" if registros else "")
+
+def _gerar_conteudo(modelo_gemini, prompt, timeout, controle=None, registro=None, configuracao_geracao=None):
+    """Chama generate_content com retentativas para erros transitórios.
+
+    Usa backoff exponencial com jitter completo entre as tentativas. Bloqueio de
+    conteúdo e erros definitivos sobem imediatamente para o chamador, assim como
+    o último erro transitório depois de MAX_TENTATIVAS_API tentativas. Se receber
+    um registro de TelemetriaAPI, preenche tempo total, tentativas, tokens e resultado.
+    """
+    inicio = time.perf_counter()
+    try:
+        for tentativa in range(MAX_TENTATIVAS_API):
+            if registro is not None: registro["tentativas"] = tentativa + 1
+            if controle: controle.adquirir()
+            try: resposta = modelo_gemini.generate_content(prompt, safety_settings=safety_settings_padrao, request_options={"timeout": timeout}, generation_config=configuracao_geracao)
+            except Exception as e:
+                motivo = _motivo_retentativa(e)
+                if controle: controle.liberar(sucesso=False, motivo_erro=motivo)
+                if motivo is None or tentativa == MAX_TENTATIVAS_API - 1:
+                    if controle and motivo: controle.registrar_falha_definitiva(motivo)
+                    raise
+                if controle: controle.registrar_retentativa(motivo)
+                time.sleep(random.uniform(0, min(BACKOFF_MAXIMO_SEGUNDOS, BACKOFF_BASE_SEGUNDOS * 2 ** tentativa)))
+            else:
+                if controle: controle.liberar(sucesso=True)
+                if registro is not None:
+                    uso = getattr(resposta, 'usage_metadata', None); registro["resultado"] = RESULTADO_SUCESSO
+                    registro["tokens_prompt"] = getattr(uso, 'prompt_token_count', None); registro["tokens_resposta"] = getattr(uso, 'candidates_token_count', None)
+                return resposta
+    except Exception as e:
+        if registro is not None: registro["resultado"] = _categoria_resultado_erro(e)
+        raise
+    finally:
+        if registro is not None: registro["segundos"] = time.perf_counter() - inicio
+
+def _nova_chamada(telemetria, operacao, modelo_gemini, comentarios=1):
+    return telemetria.nova_chamada(operacao, comentarios, getattr(modelo_gemini, 'model_name', NOME_MODELO_GEMINI)) if telemetria else None
+
+def _concluir_chamada(telemetria, registro):
+    if telemetria and registro is not None: telemetria.concluir(registro)
+
+
+# --- Função para Analisar um Comentário ---
+def _prompt_classificacao(formato_resposta):
+    """Modelo de prompt de um comentário no formato pedido; também faz parte da chave do cache."""
+    if formato_resposta not in formatos_resposta: raise ValueError(f"Formato de resposta desconhecido: {formato_resposta}. Opções: {', '.join(formatos_resposta)}")
+    return prompt_json_completo if formato_resposta == FORMATO_JSON else seu_prompt_completo
+
+def analisar_comentario(comentario, modelo_gemini, controle=None, cache=None, telemetria=None, formato_resposta=FORMATO_TEXTO):
+    if not comentario or not isinstance(comentario, str) or comentario.strip() == "": return "Não Classificado", "Não Classificado (Tema)"
+    prompt_base = _prompt_classificacao(formato_resposta)
+    if cache:
+        nome_modelo = getattr(modelo_gemini, 'model_name', NOME_MODELO_GEMINI); resultado_cache = cache.obter(comentario, prompt_base, nome_modelo)
+        if resultado_cache: return resultado_cache
+    if not modelo_gemini: return "Erro API", "Erro API (Modelo não iniciado)"
+    sentimento, tema = _classificar_comentario_api(comentario, modelo_gemini, controle, telemetria, formato_resposta)
+    if cache: cache.gravar(comentario, prompt_base, nome_modelo, sentimento, tema)
+    return sentimento, tema
+
+def _extrair_classificacao_texto(texto_resposta):
+    sentimento_extraido = "Erro Parsing"; tema_extraido = "Erro Parsing"
+    for linha in texto_resposta.split('\n'):
+        linha_strip = linha.strip()
+        if linha_strip.lower().startswith("sentimento:"): sentimento_extraido = linha_strip.split(":", 1)[1].strip()
+        elif linha_strip.lower().startswith("tema:"): tema_extraido = linha_strip.split(":", 1)[1].strip()
+    return sentimento_extraido, tema_extraido
+
+def _extrair_classificacao_json(texto_resposta):
+    """Parser estrito do modo JSON: só um objeto com exatamente os campos "s" e "t" é aceito; o resto vira "Erro Parsing"."""
+    try: dados = json.loads(texto_resposta)
+    except ValueError: return "Erro Parsing", "Erro Parsing"
+    if not isinstance(dados, dict) or dados.keys() != {"s", "t"}: return "Erro Parsing", "Erro Parsing"
+    return dados["s"], dados["t"]
+
+def _classificar_comentario_api(comentario, modelo_gemini, controle=None, telemetria=None, formato_resposta=FORMATO_TEXTO):
+    prompt_com_comentario = _prompt_classificacao(formato_resposta).format(comment=comentario); registro = _nova_chamada(telemetria, "classificacao", modelo_gemini)
+    try:
+        response = _gerar_conteudo(modelo_gemini, prompt_com_comentario, 60, controle, registro, _configuracao_geracao(formato_resposta))
+        extrair = _extrair_classificacao_json if formato_resposta == FORMATO_JSON else _extrair_classificacao_texto
+        sentimento, tema = _validar_classificacao(*extrair(response.text.strip()))
+        if registro is not None and "Erro Parsing" in (sentimento, tema): registro["resultado"] = "Erro Parsing"
+        return sentimento, tema
+    except Exception as e:
+        # A chamada pode ter tido sucesso e a falha vir depois (ex.: response.text sem candidato válido)
+        if registro is not None and registro["resultado"] == RESULTADO_SUCESSO: registro["resultado"] = _categoria_resultado_erro(e)
+        if _eh_conteudo_bloqueado(e): return "Erro API", "Erro API (Conteúdo Bloqueado)"
+        error_type = "Erro API (Geral)"; error_message = str(e).lower()
+        if "timeout" in error_message or "deadline exceeded" in error_message: error_type = "Erro API (Timeout)"
+        return "Erro API", error_type
+    finally: _concluir_chamada(telemetria, registro)
+
+# --- Funções para Analisar Comentários em Lote ---
+motivos_sem_divisao_lote = ("Cota excedida (429)", "Serviço indisponível") # Falhas do lote que não são reenviadas item a item
+regex_id_lote = re.compile(r"^\[?\s*id\s*[:#]?\s*\[?\s*(\d+)\s*\]?\s*[:.\-]?\s*(.*)$", re.IGNORECASE) # "ID: 2", "ID 2", "[ID 2]", "**ID:** 2", "- ID: 2"...
+regex_marcadores_lote = re.compile(r"[*`]") # Negrito/código em markdown
+
+def _extrair_classificacoes_lote(texto_resposta):
+    """Lê a resposta em lote e devolve {id: (sentimento, tema)}; campos ausentes ficam como "Erro Parsing".
+
+    Um item é encerrado quando recebe Sentimento e Tema; linhas seguintes só valem
+    depois de um novo cabeçalho de ID. Se um ID recebe o mesmo campo duas vezes, os
+    dois campos dele ficam como "Erro Parsing" (e o item é reenviado sozinho), em vez
+    de ficar com o rótulo de outra mensagem.
+    """
+    classificacoes = {}; ids_repetidos = set(); id_atual = None
+    for linha in texto_resposta.split('\n'):
+        linha_strip = regex_marcadores_lote.sub("", linha).strip().lstrip("-•").strip()
+        match_id = regex_id_lote.match(linha_strip)
+        if match_id: id_atual = int(match_id.group(1)); classificacoes.setdefault(id_atual, [None, None]); linha_strip = match_id.group(2).strip()
+        if id_atual is None: continue
+        if linha_strip.lower().startswith("sentimento:"): campo = 0
+        elif linha_strip.lower().startswith("tema:"): campo = 1
+        else: continue
+        if classificacoes[id_atual][campo] is not None: ids_repetidos.add(id_atual)
+        classificacoes[id_atual][campo] = linha_strip.split(":", 1)[1].strip()
+        if None not in classificacoes[id_atual]: id_atual = None
+    return {id_lote: ("Erro Parsing", "Erro Parsing") if id_lote in ids_repetidos else tuple("Erro Parsing" if valor is None else valor for valor in par) for id_lote, par in classificacoes.items()}
+
+def _extrair_classificacoes_lote_json(texto_resposta):
+    """Versão estrita para o modo JSON: itens fora do esquema são ignorados (e reenviados sozinhos por analisar_lote).
+
+    O id precisa ser inteiro (não bool); um id que aparece mais de uma vez fica como
+    "Erro Parsing", em vez de ficar com o rótulo da última ocorrência.
+    """
+    try: itens = json.loads(texto_resposta)
+    except ValueError: return {}
+    if not isinstance(itens, list): return {}
+    classificacoes = {}; ids_repetidos = set()
+    for item in itens:
+        if not isinstance(item, dict) or item.keys() != {"id", "s", "t"} or type(item["id"]) is not int: continue
+        if item["id"] in classificacoes: ids_repetidos.add(item["id"])
+        classificacoes[item["id"]] = (item["s"], item["t"])
+    return {id_lote: ("Erro Parsing", "Erro Parsing") if id_lote in ids_repetidos else par for id_lote, par in classificacoes.items()}
+
+def analisar_lote(comentarios, modelo_gemini, controle=None, cache=None, telemetria=None, formato_resposta=FORMATO_TEXTO):
+    """Classifica vários comentários em uma única chamada ao Gemini.
+
+    Cada par Sentimento/Tema devolvido é validado como em analisar_comentario; os
+    itens ausentes ou malformados (ou todos, se a chamada do lote falhar) são
+    reenviados um a um, mantendo os demais itens que vieram corretos. Se o lote
+    falhar por cota (429) ou serviço indisponível, os itens ficam como "Erro API
+    (Geral)" sem reenvio. Itens já presentes no cache não entram no lote.
+    """
+    resultados = [None] * len(comentarios); posicoes_pendentes = []; nome_modelo = getattr(modelo_gemini, 'model_name', NOME_MODELO_GEMINI); prompt_base = _prompt_classificacao(formato_resposta)
+    for posicao, comentario in enumerate(comentarios):
+        if not comentario or not isinstance(comentario, str) or comentario.strip() == "": resultados[posicao] = ("Não Classificado", "Não Classificado (Tema)")
+        elif cache and (resultado_cache := cache.obter(comentario, prompt_base, nome_modelo)): resultados[posicao] = resultado_cache
+        else: posicoes_pendentes.append(posicao)
+    if not posicoes_pendentes: return resultados
+    if not modelo_gemini: return [resultado or ("Erro API", "Erro API (Modelo não iniciado)") for resultado in resultados]
+    if len(posicoes_pendentes) == 1:
+        comentario = comentarios[posicoes_pendentes[0]]; resultados[posicoes_pendentes[0]] = resultado = _classificar_comentario_api(comentario, modelo_gemini, controle, telemetria, formato_resposta)
+        if cache: cache.gravar(comentario, prompt_base, nome_modelo, *resultado)
+        return resultados
+    comentarios_numerados = "\n".join(f"[ID {id_lote}] {' '.join(comentarios[posicao].split())}" for id_lote, posicao in enumerate(posicoes_pendentes, start=1))
+    sufixo_lote, extrair_lote = (prompt_lote_json_sufixo, _extrair_classificacoes_lote_json) if formato_resposta == FORMATO_JSON else (prompt_lote_sufixo, _extrair_classificacoes_lote)
+    prompt_lote = prompt_regras_classificacao + sufixo_lote.format(comentarios_numerados=comentarios_numerados); registro = _nova_chamada(telemetria, "classificacao_lote", modelo_gemini, len(posicoes_pendentes))
+    try:
+        response = _gerar_conteudo(modelo_gemini, prompt_lote, max(60, 6 * len(posicoes_pendentes)), controle, registro, _configuracao_geracao(formato_resposta, len(posicoes_pendentes)))
+        classificacoes = extrair_lote(response.text.strip())
+    except Exception as e:
+        if registro is not None and registro["resultado"] == RESULTADO_SUCESSO: registro["resultado"] = _categoria_resultado_erro(e)
+        # Cota ou serviço fora do ar já esgotaram as tentativas: reenviar item a item só multiplicaria as chamadas
+        if _motivo_retentativa(e) in motivos_sem_divisao_lote:
+            _concluir_chamada(telemetria, registro)
+            for posicao in posicoes_pendentes: resultados[posicao] = ("Erro API", "Erro API (Geral)")
+            return resultados
+        classificacoes = {} # Bloqueio, timeout...: cada item é reenviado sozinho abaixo
+    validadas = [_validar_classificacao(*classificacoes.get(id_lote, ("Erro Parsing", "Erro Parsing"))) for id_lote in range(1, len(posicoes_pendentes) + 1)]
+    if registro is not None and registro["resultado"] == RESULTADO_SUCESSO and any("Erro Parsing" in par for par in validadas): registro["resultado"] = "Erro Parsing (parcial)"
+    _concluir_chamada(telemetria, registro) # Antes dos reenvios individuais, que têm registros próprios
+    for posicao, (sentimento, tema) in zip(posicoes_pendentes, validadas):
+        if sentimento == "Erro Parsing" or tema == "Erro Parsing":
+            sentimento, tema = _classificar_comentario_api(comentarios[posicao], modelo_gemini, controle, telemetria, formato_resposta)
+        if cache: cache.gravar(comentarios[posicao], prompt_base, nome_modelo, sentimento, tema)
+        resultados[posicao] = (sentimento, tema)
+    return resultados
+
+# --- Motor de Análise Concorrente ---
+def analisar_comentarios_concorrente(comentarios, modelo_gemini, num_workers=8, limite_rpm=0, tamanho_lote=1, cache=None, controle=None, telemetria=None, formato_resposta=FORMATO_TEXTO):
+    """Classifica os comentários em um pool de threads.
+
+    É um gerador: produz (posicao, (sentimento, tema)) na ordem em que as chamadas
+    terminam, sempre na thread de quem itera. Assim o chamador pode atualizar a
+    interface (barra de progresso) e gravar cada resultado na posição original.
+    Com tamanho_lote > 1, cada chamada leva vários comentários (ver analisar_lote).
+    Passe um ControleTaxa próprio em controle para consultar as retentativas depois,
+    e uma TelemetriaAPI em telemetria para registrar cada chamada. Com
+    formato_resposta=FORMATO_JSON, o modelo responde JSON restrito às categorias válidas.
+    """
+    comentarios = [str(comentario) for comentario in comentarios]; controle = controle or ControleTaxa(limite_rpm, num_workers); tamanho_lote = max(1, int(tamanho_lote))
+    if not comentarios: return
+    lotes = [list(range(inicio, min(inicio + tamanho_lote, len(comentarios)))) for inicio in range(0, len(comentarios), tamanho_lote)]
+    with ThreadPoolExecutor(max_workers=max(1, int(num_workers))) as executor:
+        futuros = {executor.submit(analisar_lote, [comentarios[posicao] for posicao in lote], modelo_gemini, controle, cache, telemetria, formato_resposta): lote for lote in lotes}
+        try:
+            for futuro in as_completed(futuros):
+                for posicao, resultado in zip(futuros[futuro], futuro.result()): yield posicao, resultado
+        finally:
+            # Se o chamador interromper a iteração, descarta o que ainda não começou
+            for futuro in futuros: futuro.cancel()
+
+# --- Agrupamento de Comentários Duplicados e Quase Duplicados ---
+NUM_PERMUTACOES_MINHASH = 64
+TAMANHO_SHINGLE = 4 # bytes do texto normalizado por shingle
+MIN_CARACTERES_QUASE_DUPLICADO = 12 # textos mais curtos só são agrupados se forem idênticos
+
+def normalizar_para_agrupamento(textos):
+    """Minúsculas, sem @menções, emojis, pontuação e espaços extras (vetorizado sobre a série)."""
+    textos = textos.astype(str)
+    normalizados = textos.str.lower().str.replace(r"@[\w.]+", " ", regex=True).str.replace(r"[^\w\s]|_", " ", regex=True).str.replace(r"\s+", " ", regex=True).str.strip()
+    # Comentários só de emojis/pontuação/menção ficariam vazios e cairiam todos no mesmo grupo: mantém o texto original
+    return normalizados.where(normalizados != "", "\x00" + textos.str.strip())
+
+def _parametros_lsh(limiar_similaridade, num_permutacoes=NUM_PERMUTACOES_MINHASH):
+    """Escolhe (faixas, linhas por faixa) com limiar aproximado (1/b)^(1/r) logo abaixo do desejado."""
+    opcoes = [(faixas, num_permutacoes // faixas) for faixas in (2, 4, 8, 16, 32)]
+    abaixo = [opcao for opcao in opcoes if (1 / opcao[0]) ** (1 / opcao[1]) <= limiar_similaridade]
+    return max(abaixo, key=lambda opcao: (1 / opcao[0]) ** (1 / opcao[1])) if abaixo else opcoes[-1]
+
+def _assinaturas_minhash(textos, num_permutacoes=NUM_PERMUTACOES_MINHASH, tamanho_bloco=20_000):
+    """Assinaturas MinHash (uint32) sobre shingles de bytes, calculadas em blocos com numpy."""
+    gerador = np.random.default_rng(1234) # Semente fixa: mesmas assinaturas a cada execução
+    multiplicadores = gerador.integers(1, 2**64, size=num_permutacoes, dtype=np.uint64) | np.uint64(1); deslocamentos = gerador.integers(0, 2**64, size=num_permutacoes, dtype=np.uint64)
+    assinaturas = np.empty((len(textos), num_permutacoes), dtype=np.uint32)
+    for inicio in range(0, len(textos), tamanho_bloco):
+        bloco = [texto.encode('utf-8') for texto in textos[inicio:inicio + tamanho_bloco]]
+        tamanhos = np.fromiter((len(texto) for texto in bloco), dtype=np.int64, count=len(bloco)); buffer = np.frombuffer(b"".join(bloco), dtype=np.uint8).astype(np.uint64)
+        num_janelas = len(buffer) - TAMANHO_SHINGLE + 1; janelas = np.zeros(num_janelas, dtype=np.uint64)
+        for deslocamento_byte in range(TAMANHO_SHINGLE): janelas = (janelas << np.uint64(8)) | buffer[deslocamento_byte:deslocamento_byte + num_janelas]
+        # Mantém só as janelas que começam e terminam dentro do mesmo texto
+        janelas_por_texto = tamanhos - TAMANHO_SHINGLE + 1; inicio_texto = np.cumsum(tamanhos) - tamanhos; limites = np.cumsum(janelas_por_texto) - janelas_por_texto
+        posicoes_validas = np.repeat(inicio_texto - limites, janelas_por_texto) + np.arange(janelas_por_texto.sum()); shingles = janelas[posicoes_validas]
+        for permutacao in range(num_permutacoes):
+            hashes = (multiplicadores[permutacao] * shingles + deslocamentos[permutacao]) >> np.uint64(32)
+            assinaturas[inicio:inicio + len(bloco), permutacao] = np.minimum.reduceat(hashes, limites)
+    return assinaturas
+
+def _raiz(pais, elemento):
+    while pais[elemento] != elemento: pais[elemento] = pais[pais[elemento]]; elemento = pais[elemento]
+    return elemento
+
+def agrupar_comentarios(textos, limiar_similaridade=1.0):
+    """Devolve, para cada posição, a posição do representante (primeira ocorrência) do seu grupo.
+
+    Textos idênticos após normalizar_para_agrupamento sempre formam um grupo. Com
+    limiar_similaridade < 1, textos cuja similaridade de Jaccard estimada por
+    MinHash/LSH atinge o limiar também são unidos. O custo é linear no número de
+    textos: só são comparados candidatos que caem no mesmo balde do LSH.
+    """
+    chaves = normalizar_para_agrupamento(pd.Series(list(textos), dtype=object))
+    codigos, chaves_unicas = pd.factorize(chaves); pais = list(range(len(chaves_unicas)))
+    if limiar_similaridade < 1.0:
+        elegiveis = np.flatnonzero((chaves_unicas.str.len() >= MIN_CARACTERES_QUASE_DUPLICADO) & ~chaves_unicas.str.startswith("\x00"))
+        if len(elegiveis) > 1:
+            assinaturas = _assinaturas_minhash([chaves_unicas[i] for i in elegiveis]); faixas, linhas_por_faixa = _parametros_lsh(limiar_similaridade)
+            for faixa in range(faixas):
+                # Condensa as linhas da faixa em um único inteiro e agrupa por balde; cada texto é comparado apenas com o primeiro do seu balde
+                bloco_faixa = assinaturas[:, faixa * linhas_por_faixa:(faixa + 1) * linhas_por_faixa].astype(np.uint64); chave_balde = np.zeros(len(elegiveis), dtype=np.uint64)
+                for coluna in bloco_faixa.T: chave_balde = chave_balde * np.uint64(1_000_003) + coluna
+                _, primeiro_do_balde, balde = np.unique(chave_balde, return_index=True, return_inverse=True); ancora = primeiro_do_balde[balde.ravel()]
+                similares = np.flatnonzero((ancora != np.arange(len(elegiveis))) & ((assinaturas == assinaturas[ancora]).mean(axis=1) >= limiar_similaridade))
+                for posicao in similares:
+                    raiz_a, raiz_b = _raiz(pais, elegiveis[posicao]), _raiz(pais, elegiveis[ancora[posicao]])
+                    if raiz_a != raiz_b: pais[max(raiz_a, raiz_b)] = min(raiz_a, raiz_b)
+    grupos = np.array([_raiz(pais, codigo) for codigo in range(len(chaves_unicas))], dtype=np.int64)[codigos]
+    representantes = np.full(len(chaves_unicas), len(codigos), dtype=np.int64); np.minimum.at(representantes, grupos, np.arange(len(codigos)))
+    return representantes[grupos]
+
+# --- Pré-Classificador Local (Regras e Léxico) ---
+# Comentários triviais que o próprio prompt já descreve (menção isolada, risadas, saudações, emojis isolados,
+# críticas curtas como "Péssimo") são rotulados localmente, sem chamada à API. Cada regra tem uma confiança;
+# só as regras com confiança >= limiar escolhido são aplicadas. A primeira regra da lista que casar vence.
+ORIGEM_LOCAL = "Regras locais"
+ORIGEM_API = "Gemini"
+ORIGEM_SEM_CONTEUDO = "Sem conteúdo" # Linha vazia mantida na saída da linha de comando (o app descarta essas linhas)
+_modificadores_emoji = "[\uFE0F\U0001F3FB-\U0001F3FF]*" # Variação de apresentação e tons de pele
+_emoji = "(?:[\U0001F300-\U0001FAFF\u2600-\u27BF]" + _modificadores_emoji + "\u200d?)"
+_sufixo = r"(?:[\s!.?…]|" + _emoji + ")*" # Pontuação/emojis no fim não mudam a classificação das regras de texto
+_prefixo_mencao = r"(?:@[\w.]+\s+)?"
+regras_pre_classificacao = [
+    # (nome, regex aplicada ao texto em minúsculas e sem espaços extras, sentimento, tema, confiança)
+    ("@ isolado", r"@+", "Não Classificado", "Não Classificado (Tema)", 0.99),
+    ("Pontuação isolada", r"[!?.,;:^<>\-_*~]+", "Não Classificado", "Não Classificado (Tema)", 0.97),
+    ("Risada isolada", r"@?(?:k{3,}|(?:rs){2,}|(?:ha){2,}h?|(?:he){2,}|(?:hu){2,}|[😂🤣]+)(?:\s*(?:k{2,}|[😂🤣]+|aiai))*" + _sufixo, "Não Classificado", "Não Classificado (Tema)", 0.95),
+    ("Saudação isolada", r"@?(?:bom dia|boa tarde|boa tade|boa noite|oi+|ol[aá]|tchau)(?: amig[oa])?" + _sufixo, "Não Classificado", "Não Classificado (Tema)", 0.9),
+    ("Agradecimento/religiosa isolada", r"@?(?:am[eé]m|obg)" + _sufixo, "Não Classificado", "Não Classificado (Tema)", 0.9),
+    ("Menção a usuário isolada", r"@[\w.]+|\[[^\[\]@]+\]", "Positivo", "Interação Social e Engajamento", 0.95),
+    ("Crítica curta ao atendimento", _prefixo_mencao + r"(?:p[eé]ssimo|horr[ií]vel) atendimento" + _sufixo, "Negativo", "Atendimento e Suporte", 0.92),
+    ("Crítica curta à marca", _prefixo_mencao + r"(?:p[eé]ssimo|pior banco(?: da vida| do brasil)?|banco lixo|lixo de banco|que bosta|ita[uú] est[aá] p[eé]ssimo)" + _sufixo, "Negativo", "Marca e Imagem", 0.9),
+    ("Concordância curta", r"isso a[ií]" + _sufixo, "Não Classificado", "Não Classificado (Tema)", 0.85),
+    ("Ok isolado", r"ok" + _sufixo, "Neutro", "Interação Social e Engajamento", 0.8),
+    ("Emoji positivo isolado", "(?:[😍❤🧡💙💖🫶👏🙌✨🎉😘🌷🌹👍]" + _modificadores_emoji + r"\s*)+", "Positivo", "Interação Social e Engajamento", 0.8),
+    ("Emoji negativo isolado", "(?:[😠😡👎😢💩🤮🤢😪]" + _modificadores_emoji + r"\s*)+", "Negativo", "Interação Social e Engajamento", 0.8),
+    ("Emoji ambíguo isolado", "(?:[🙏🤔👀]" + _modificadores_emoji + r"\s*)+", "Neutro", "Interação Social e Engajamento", 0.7),
+]
+
+def pre_classificar_local(textos, limiar_confianca=0.9):
+    """Aplica as regras locais de forma vetorizada sobre a série de textos.
+
+    Devolve um DataFrame com o mesmo índice e as colunas Sentimento, Tema e Regra;
+    as linhas sem regra aplicável (ou com confiança abaixo do limiar) ficam nulas
+    e devem seguir para a API.
+    """
+    textos_normalizados = textos.astype(str).str.lower().str.replace(r"\s+", " ", regex=True).str.strip()
+    resultado = pd.DataFrame({"Sentimento": None, "Tema": None, "Regra": None}, index=textos.index, dtype=object); pendentes = pd.Series(True, index=textos.index)
+    for nome_regra, regex, sentimento, tema, confianca in regras_pre_classificacao:
+        if confianca < limiar_confianca or not pendentes.any(): continue
+        casou = pendentes & textos_normalizados.str.fullmatch(regex).fillna(False).astype(bool)
+        resultado.loc[casou, ["Sentimento", "Tema", "Regra"]] = [sentimento, tema, nome_regra]; pendentes &= ~casou
+    return resultado
+
+
+# --- Checkpoints de Análise (Retomada) ---
+PASTA_CHECKPOINTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints")
+
+class CheckpointAnalise:
+    """Resultados gravados em disco (JSONL) à medida que a análise avança.
+
+    Um arquivo por hash do arquivo enviado; cada linha guarda o índice da linha no
+    DataFrame, o sentimento, o tema e a origem da classificação (Gemini ou regras
+    locais). Ao carregar, a última linha de cada índice prevalece, então para
+    reprocessar erros basta acrescentar novas linhas.
+    """
+    def __init__(self, hash_arquivo, pasta=PASTA_CHECKPOINTS):
+        self.caminho = os.path.join(pasta, f"{hash_arquivo}.jsonl")
+
+    @staticmethod
+    def calcular_hash(conteudo_bytes): return hashlib.sha256(conteudo_bytes).hexdigest()
+
+    def carregar(self):
+        resultados = {}
+        if not os.path.exists(self.caminho): return resultados
+        with open(self.caminho, encoding='utf-8') as arquivo:
+            for linha in arquivo:
+                try: registro = json.loads(linha)
+                except json.JSONDecodeError: continue # Última linha truncada por uma interrupção no meio da gravação
+                resultados[registro["indice"]] = (registro["sentimento"], registro["tema"], registro.get("origem", ORIGEM_API))
+        return resultados
+
+    def gravar(self, indices, sentimento, tema, origem=ORIGEM_API):
+        os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+        with open(self.caminho, 'a', encoding='utf-8') as arquivo:
+            arquivo.writelines(json.dumps({"indice": int(indice), "sentimento": sentimento, "tema": tema, "origem": origem}, ensure_ascii=False) + "\n" for indice in indices)
+
+    def remover(self):
+        if os.path.exists(self.caminho): os.remove(self.caminho)
+
+# --- Colunas de Resultado Categóricas e Agregação Compartilhada ---
+categorias_sentimento_resultado = categorias_sentimento_validas + sorted(set(todas_categorias_erro) - set(categorias_sentimento_validas))
+categorias_tema_resultado = categorias_tema_validas + sorted(set(todas_categorias_erro) - set(categorias_tema_validas))
+categorias_colunas_resultado = {'Sentimento_Classificado': categorias_sentimento_resultado, 'Tema_Classificado': categorias_tema_resultado, 'Origem_Classificacao': [ORIGEM_API, ORIGEM_LOCAL, ORIGEM_SEM_CONTEUDO]}
+
+def converter_colunas_resultado(df):
+    """Converte (no próprio DataFrame) as colunas de resultado para Categorical sobre as listas conhecidas.
+
+    Valores fora das listas viram categorias extras no fim, nunca NaN.
+    """
+    for coluna, categorias in categorias_colunas_resultado.items():
+        if coluna not in df.columns: continue
+        extras = sorted(set(df[coluna].dropna().unique()) - set(categorias)); df[coluna] = pd.Categorical(df[coluna], categories=categorias + extras)
+    return df
+
+def calcular_hash_resultados(df):
+    """Hash das colunas de resultado (e do índice): identifica o conjunto de resultados para a agregação em cache."""
+    return hashlib.sha256(pd.util.hash_pandas_object(df[['Sentimento_Classificado', 'Tema_Classificado']], index=True).to_numpy().tobytes()).hexdigest()
+
+class AgregacaoResultados:
+    """Contagens de um conjunto de resultados, calculadas uma única vez.
+
+    O NPS, os gráficos, as tabelas de resumo e o prompt de insights leem daqui,
+    em vez de refazer filtros e value_counts sobre o DataFrame a cada rerun.
+    Todas as contagens são Series indexadas pelas categorias (com zeros).
+    """
+    def __init__(self, df):
+        sentimentos = df['Sentimento_Classificado']; temas = df['Tema_Classificado']
+        if not isinstance(sentimentos.dtype, pd.CategoricalDtype) or not isinstance(temas.dtype, pd.CategoricalDtype): # Resultados antigos, em texto
+            colunas = converter_colunas_resultado(df[['Sentimento_Classificado', 'Tema_Classificado']].copy()); sentimentos = colunas['Sentimento_Classificado']; temas = colunas['Tema_Classificado']
+        self.total = len(df)
+        self.contagem_sentimento = sentimentos.value_counts(sort=False); self.contagem_tema = temas.value_counts(sort=False)
+        self.contagem_tema_negativo = temas[(sentimentos == 'Negativo').to_numpy()].value_counts(sort=False)
+        self._calcular_recortes()
+
+    @classmethod
+    def de_contagens(cls, contagem_sentimento, contagem_tema, contagem_tema_negativo):
+        """Monta a agregação a partir de contagens já prontas (dicts ou Counters), como as de ContagemIncremental."""
+        agregacao = cls.__new__(cls)
+        def serie(contagem, categorias): return pd.Series({categoria: contagem.get(categoria, 0) for categoria in categorias + sorted(set(contagem) - set(categorias))}, dtype='int64')
+        agregacao.contagem_sentimento = serie(contagem_sentimento, categorias_sentimento_resultado); agregacao.contagem_tema = serie(contagem_tema, categorias_tema_resultado)
+        agregacao.contagem_tema_negativo = serie(contagem_tema_negativo, categorias_tema_resultado); agregacao.total = int(agregacao.contagem_sentimento.sum())
+        agregacao._calcular_recortes(); return agregacao
+
+    def _calcular_recortes(self):
+        # Recortes usados nos gráficos e nos insights (sem Não Classificado, erros e, nos temas, Interação Social)
+        self.sentimentos_grafico = self.contagem_sentimento.reindex(["Positivo", "Neutro", "Negativo"]); self.sentimentos_grafico = self.sentimentos_grafico[self.sentimentos_grafico > 0]
+        self.total_sentimentos_grafico = int(self.sentimentos_grafico.sum())
+        self.temas_grafico = self._temas_relevantes(self.contagem_tema); self.temas_negativos = self._temas_relevantes(self.contagem_tema_negativo)
+        self.nps = None
+        if self.total_sentimentos_grafico > 0:
+            perc_pos = self.sentimentos_grafico.get('Positivo', 0) / self.total_sentimentos_grafico; perc_neg = self.sentimentos_grafico.get('Negativo', 0) / self.total_sentimentos_grafico
+            self.nps = max(0, min(10, ((perc_pos - perc_neg) + 1) / 2 * 10))
+
+    @staticmethod
+    def _temas_relevantes(contagem):
+        contagem = contagem[~contagem.index.isin(categorias_excluir_tema) & (contagem > 0)]
+        return contagem.sort_values(ascending=False, kind='stable')
+
+class ContagemIncremental:
+    """Contagens atualizadas à medida que os resultados chegam, para o painel ao vivo durante a análise.
+
+    Cada resultado custa só o incremento de três Counters; agregacao() monta a
+    AgregacaoResultados parcial sem percorrer os resultados já recebidos.
+    """
+    def __init__(self):
+        self.sentimentos = Counter(); self.temas = Counter(); self.temas_negativos = Counter()
+
+    def adicionar(self, sentimento, tema, quantidade=1):
+        self.sentimentos[sentimento] += quantidade; self.temas[tema] += quantidade
+        if sentimento == 'Negativo': self.temas_negativos[tema] += quantidade
+
+    def agregacao(self): return AgregacaoResultados.de_contagens(self.sentimentos, self.temas, self.temas_negativos)
+
+# --- Amostragem Estratificada e Estimativas com Intervalo de Confiança ---
+TAMANHO_RODADA_AMOSTRA = 200 # Comentários classificados por rodada quando a amostragem para ao atingir a margem de erro
+VALOR_SEM_ESTRATO = "(vazio)"
+LIMITE_ESTRATOS_TEXTO = 50 # Acima disso, uma coluna de texto é testada como data
+
+def ordenar_amostra_estratificada(estratos, semente=None):
+    """Devolve os índices de estratos em uma ordem aleatória cujo início é sempre uma amostra estratificada proporcional.
+
+    Cada linha recebe a chave (posição sorteada dentro do estrato + U(0,1)) / tamanho do
+    estrato; ordenando por ela, os primeiros n índices trazem ~n·N_h/N linhas de cada
+    estrato. Assim a amostra pode crescer em rodadas sem perder a estratificação.
+    """
+    gerador = np.random.default_rng(semente); codigos = pd.factorize(estratos, use_na_sentinel=False)[0]; tamanhos = np.bincount(codigos)
+    permutacao = gerador.permutation(len(codigos)); posicao_no_estrato = np.empty(len(codigos))
+    posicao_no_estrato[permutacao] = pd.Series(codigos[permutacao]).groupby(codigos[permutacao]).cumcount().to_numpy()
+    chaves = (posicao_no_estrato + gerador.random(len(codigos))) / tamanhos[codigos]
+    return pd.Index(estratos.index[np.argsort(chaves, kind='stable')])
+
+def preparar_estratos(valores):
+    """Rótulo de estrato por linha: datas (inclusive em texto, como nas exportações em CSV) viram o dia; vazios viram VALOR_SEM_ESTRATO."""
+    if not pd.api.types.is_datetime64_any_dtype(valores) and (valores.dtype == object or pd.api.types.is_string_dtype(valores)) and valores.nunique() > LIMITE_ESTRATOS_TEXTO:
+        datas = pd.to_datetime(valores, errors='coerce', format='mixed', dayfirst=True)
+        if datas.notna().mean() >= 0.9: valores = datas
+    if pd.api.types.is_datetime64_any_dtype(valores): valores = valores.dt.date
+    return valores.astype(object).where(valores.notna(), VALOR_SEM_ESTRATO).astype(str)
+
+def _estimar_razao(y, x, codigos, tamanhos_populacao, tamanhos_amostra):
+    """Estimador de razão estratificado (soma W_h·ȳ_h / soma W_h·x̄_h) e erro padrão linearizado, com correção de população finita.
+
+    Estratos com uma única linha amostrada não contribuem para a variância.
+    """
+    pesos = tamanhos_populacao / tamanhos_populacao.sum()
+    media_y = np.bincount(codigos, y, len(pesos)) / tamanhos_amostra; media_x = np.bincount(codigos, x, len(pesos)) / tamanhos_amostra; total_x = pesos @ media_x
+    if total_x <= 0: return np.nan, np.nan
+    razao = (pesos @ media_y) / total_x; residuos = y - razao * x; media_residuos = np.bincount(codigos, residuos, len(pesos)) / tamanhos_amostra
+    soma_quadrados = np.bincount(codigos, (residuos - media_residuos[codigos]) ** 2, len(pesos)); variancia_estrato = np.divide(soma_quadrados, tamanhos_amostra - 1, out=np.zeros(len(pesos)), where=tamanhos_amostra > 1)
+    variancia = np.sum(pesos ** 2 * (1 - tamanhos_amostra / tamanhos_populacao) * variancia_estrato / tamanhos_amostra) / total_x ** 2
+    return razao, float(np.sqrt(max(variancia, 0.0)))
+
+def estimar_por_amostra(resultados, estratos, confianca=0.95):
+    """Estimativas da população a partir das linhas amostradas e já classificadas.
+
+    resultados tem Sentimento_Classificado e Tema_Classificado das linhas da amostra
+    (mesmo índice de estratos); estratos traz o estrato de todas as linhas da população.
+    Devolve um dict com NPS Social, participação de cada sentimento (entre Positivo,
+    Neutro e Negativo) e dos temas relevantes, cada um com intervalo de confiança,
+    a maior margem de erro dos sentimentos (pontos percentuais) e contagens
+    estimadas para a população, prontas para AgregacaoResultados.de_contagens.
+    Só os estratos com alguma linha amostrada entram nos pesos.
+    """
+    z = NormalDist().inv_cdf((1 + confianca) / 2); tamanhos_estratos = estratos.value_counts()
+    estratos_amostra = estratos.loc[resultados.index]; tamanhos_amostra = estratos_amostra.value_counts(); tamanhos_populacao = tamanhos_estratos.loc[tamanhos_amostra.index]
+    codigos = pd.Index(tamanhos_amostra.index).get_indexer(estratos_amostra); n_h = tamanhos_amostra.to_numpy(dtype=float); N_h = tamanhos_populacao.to_numpy(dtype=float)
+    sentimentos = resultados['Sentimento_Classificado'].astype(str).to_numpy(); temas = resultados['Tema_Classificado'].astype(str).to_numpy()
+    def intervalo(y, x, escala=100.0):
+        razao, erro_padrao = _estimar_razao(y.astype(float), x.astype(float), codigos, N_h, n_h)
+        return razao * escala, max(0.0, (razao - z * erro_padrao) * escala), min(escala, (razao + z * erro_padrao) * escala), z * erro_padrao * escala
+    validos = np.isin(sentimentos, ["Positivo", "Neutro", "Negativo"]); temas_relevantes = ~np.isin(temas, categorias_excluir_tema)
+    tabela_sentimentos = pd.DataFrame([(categoria, *intervalo(sentimentos == categoria, validos)) for categoria in ["Positivo", "Neutro", "Negativo"]], columns=['Categoria', 'Estimativa (%)', 'IC inferior (%)', 'IC superior (%)', 'Margem de erro (p.p.)'])
+    tabela_temas = pd.DataFrame([(categoria, *intervalo(temas == categoria, temas_relevantes)) for categoria in pd.unique(temas[temas_relevantes])], columns=tabela_sentimentos.columns).sort_values('Estimativa (%)', ascending=False, ignore_index=True)
+    nps, erro_nps = np.nan, np.nan
+    if validos.any():
+        razao, erro_padrao = _estimar_razao((sentimentos == "Positivo").astype(float) - (sentimentos == "Negativo").astype(float), validos.astype(float), codigos, N_h, n_h)
+        nps = max(0, min(10, (razao + 1) / 2 * 10)); erro_nps = z * erro_padrao * 5
+    # Contagens expandidas para a população coberta (soma N_h·proporção no estrato), reescaladas para o total de linhas
+    fator = len(estratos) / N_h.sum(); peso_linha = (N_h / n_h)[codigos] * fator
+    def expandir(rotulos, mascara=None):
+        serie = pd.Series(peso_linha if mascara is None else peso_linha[mascara]).groupby(rotulos if mascara is None else rotulos[mascara]).sum()
+        return {categoria: int(round(volume)) for categoria, volume in serie.items()}
+    return {
+        "tamanho_amostra": len(resultados), "total_populacao": len(estratos), "confianca": confianca, "estratos": len(tamanhos_estratos), "estratos_amostrados": len(tamanhos_amostra),
+        "nps": nps, "nps_inferior": max(0.0, nps - erro_nps) if validos.any() else np.nan, "nps_superior": min(10.0, nps + erro_nps) if validos.any() else np.nan,
+        "sentimentos": tabela_sentimentos, "temas": tabela_temas, "margem_maxima": float(np.nanmax(tabela_sentimentos['Margem de erro (p.p.)'])) if validos.any() else np.inf,
+        "contagem_sentimento": expandir(sentimentos), "contagem_tema": expandir(temas), "contagem_tema_negativo": expandir(temas, sentimentos == "Negativo"),
+    }
+
+def descrever_estimativa(estimativa):
+    """Frase curta que identifica números como estimativas (usada no app e nos insights)."""
+    return (f"Estimativas por amostragem estratificada: {estimativa['tamanho_amostra']} de {estimativa['total_populacao']} comentários classificados, "
+            f"confiança de {estimativa['confianca']:.0%}, margem de erro máxima dos sentimentos de ±{estimativa['margem_maxima']:.1f} pontos percentuais")
+
+# --- Função para Gerar Insights ---
+def _formatar_top(contagem, quantidade, texto_vazio):
+    total = int(contagem.sum())
+    if total == 0: return texto_vazio, 0
+    return "\n".join(f"    - {categoria}: {volume} ({volume / total * 100:.1f}%)" for categoria, volume in contagem.head(quantidade).items()), total
+
+def gerar_insights(df_resultados_func, modelo_gemini, telemetria=None, agregacao=None, estimativa=None):
+    """Gera os insights com o Gemini. Com estimativa (modo amostragem), os números do prompt são as contagens estimadas, o modelo é avisado das margens de erro e o texto devolvido começa com o aviso de estimativa."""
+    if df_resultados_func is None or df_resultados_func.empty: return "Não há dados suficientes para gerar insights."
+    if not modelo_gemini: return "*Erro: Modelo Gemini não inicializado. Não é possível gerar insights.*"
+    try:
+        if estimativa and not agregacao: agregacao = AgregacaoResultados.de_contagens(estimativa['contagem_sentimento'], estimativa['contagem_tema'], estimativa['contagem_tema_negativo'])
+        agregacao = agregacao or AgregacaoResultados(df_resultados_func); total_analisados_func = agregacao.total; contagem_sentimento = agregacao.contagem_sentimento
+        count_pos_func = int(contagem_sentimento.get('Positivo', 0)); count_neg_func = int(contagem_sentimento.get('Negativo', 0)); count_neu_func = int(contagem_sentimento.get('Neutro', 0)); count_nc_err_func = total_analisados_func - (count_pos_func + count_neg_func + count_neu_func)
+        perc_pos_func, perc_neg_func, perc_neu_func, perc_nc_err_func = ((contagem / total_analisados_func * 100) if total_analisados_func > 0 else 0 for contagem in (count_pos_func, count_neg_func, count_neu_func, count_nc_err_func))
+        top_temas_formatado_func, total_temas_insights_func = _formatar_top(agregacao.temas_grafico, 5, "    - Nenhum tema relevante classificado.")
+        top_temas_negativos_formatado_func, total_temas_neg_func = _formatar_top(agregacao.temas_negativos, 3, "    - Nenhum tema negativo relevante classificado (ou nenhum comentário negativo com tema válido).")
+        prompt_final_insights = prompt_geracao_insights.format(total_comentarios_analisados=total_analisados_func, count_pos=count_pos_func, perc_pos=perc_pos_func, count_neg=count_neg_func, perc_neg=perc_neg_func, count_neu=count_neu_func, perc_neu=perc_neu_func, count_nc_err=count_nc_err_func, perc_nc_err=perc_nc_err_func, total_temas_insights=total_temas_insights_func, top_temas_formatado=top_temas_formatado_func, total_temas_neg=total_temas_neg_func, top_temas_negativos_formatado=top_temas_negativos_formatado_func)
+        if estimativa: prompt_final_insights = prompt_aviso_estimativa.format(descricao=descrever_estimativa(estimativa), nps=estimativa['nps'], nps_inferior=estimativa['nps_inferior'], nps_superior=estimativa['nps_superior']) + prompt_final_insights
+        registro_insights = _nova_chamada(telemetria, "insights", modelo_gemini, 0)
+        try:
+            response_insights = _gerar_conteudo(modelo_gemini, prompt_final_insights, 90, registro=registro_insights)
+            # .text é lido antes de concluir o registro: bloqueio ou resposta sem candidato só aparecem aqui (ValueError)
+            try: texto_insights = response_insights.text.strip() if response_insights else ""
+            except ValueError: texto_insights = ""
+            if not texto_insights and registro_insights is not None: registro_insights["resultado"] = "Conteúdo Bloqueado" if getattr(getattr(response_insights, 'prompt_feedback', None), 'block_reason', None) else "Erro Geral"
+        except Exception as e:
+            if registro_insights is not None and registro_insights["resultado"] == RESULTADO_SUCESSO: registro_insights["resultado"] = _categoria_resultado_erro(e)
+            raise
+        finally: _concluir_chamada(telemetria, registro_insights)
+        if texto_insights: return (f"*⚠️ {descrever_estimativa(estimativa)}. Os números abaixo são estimativas.*\n\n" if estimativa else "") + texto_insights
+        error_info = "Resposta da API vazia ou inválida."
+        if getattr(response_insights, 'prompt_feedback', None): error_info = f"Possível bloqueio pela API. Feedback: {response_insights.prompt_feedback}"
+        logger.warning("Não foi possível gerar insights: %s", error_info); return f"*Não foi possível gerar insights: {error_info}*"
+    except Exception as e: logger.exception("Erro durante a geração de insights"); return f"*Ocorreu um erro inesperado durante a geração dos insights: {str(e)}*"
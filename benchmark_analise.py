@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Benchmark offline do pipeline de classificação com o Gemini simulado.
+
+Gera bases sintéticas (com duplicados e comentários triviais, como nas
+exportações reais), classifica cada uma com o mesmo pipeline da linha de
+comando (regras locais, agrupamento e motor concorrente) usando
+ModeloGeminiSimulado, e reporta comentários/s, latência p50/p95 das chamadas,
+tokens de saída, taxa de erros de parsing, contagem por categoria de erro,
+retentativas e pico de memória. Com --formatos-resposta texto json, cada base é
+classificada nos dois formatos de resposta, para comparação. Cada cenário roda em
+um processo novo, então o pico de memória é só dele (e não o maior até ali).
+
+Exemplo:
+    python benchmark_analise.py --tamanhos 1000 10000 100000 --workers 32 --latencia-mediana 0.05 --prob-429 0.01 --prob-malformado 0.02 --formatos-resposta texto json
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from analise_cli import classificar_bloco
+from analise_core import FORMATO_TEXTO, ControleTaxa, TelemetriaAPI, formatos_resposta, todas_categorias_erro
+from simulador_gemini import ModeloGeminiSimulado, distribuicoes_latencia
+
+try: import resource # Pico de memória do processo (indisponível no Windows)
+except ImportError: resource = None
+
+modelos_comentario = [
+    "O app do Itaú não abre desde {dia}, já tentei reinstalar",
+    "Meu pix de {valor} reais sumiu e ninguém resolve",
+    "Quero aumentar o limite do cartão {cartao}, como faço?",
+    "Adorei a campanha com a {pessoa}",
+    "Atendimento da agência de {cidade} foi horrível hoje",
+    "Quando vai ter CDB pagando {taxa}% do CDI?",
+    "Fui vítima de golpe no {canal} e o banco não devolveu",
+    "Que show incrível no {evento}, parabéns Itaú",
+    "A taxa do cartão {cartao} está muito alta",
+    "Cancelei minha conta depois de {dia} esperando retorno",
+]
+valores_modelo = {
+    "dia": ["segunda", "ontem", "sexta", "o feriado", "semana passada"], "valor": ["50", "120", "300", "1.000", "2.500"],
+    "cartao": ["Click", "Platinum", "Personnalité", "Uniclass", "Azul"], "pessoa": ["Julia Iorio", "Ari Segatto", "Fran", "Jorge Ben Jor"],
+    "cidade": ["Recife", "Campinas", "Curitiba", "Belém", "Niterói"], "taxa": ["100", "102", "105", "110"],
+    "canal": ["WhatsApp", "app", "telefone", "e-mail"], "evento": ["Rock in Rio", "The Town", "Mapa Gastal"],
+}
+comentarios_triviais = ["kkkk", "👍", "@fulano.silva", "Bom dia", "Péssimo", "🙏", "Ok", "!!!", "Amém 🙏", "Pior banco"]
+variacoes_duplicado = [lambda texto: f"@usuario{random.randint(1, 999)} {texto}", lambda texto: f"{texto} 😡", lambda texto: texto.upper(), lambda texto: f"{texto}!!!"]
+
+
+def gerar_comentarios_sinteticos(quantidade, semente=42, prop_duplicados=0.3, prop_triviais=0.15):
+    """Base sintética com a coluna 'Conteúdo': textos de modelos, cópias com variações (@menção, emoji, caixa) e triviais."""
+    random.seed(semente); comentarios = []
+    for _ in range(quantidade):
+        sorteio = random.random()
+        if sorteio < prop_triviais: comentarios.append(random.choice(comentarios_triviais))
+        elif sorteio < prop_triviais + prop_duplicados and comentarios: comentarios.append(random.choice(variacoes_duplicado)(random.choice(comentarios)))
+        else:
+            modelo = random.choice(modelos_comentario)
+            comentarios.append(modelo.format(**{chave: random.choice(opcoes) for chave, opcoes in valores_modelo.items()}) + f" #{random.randint(1, 10**6)}")
+    return pd.DataFrame({"Conteúdo": comentarios})
+
+
+def pico_memoria_processo_mb():
+    """Pico de memória residente do processo atual em MB; ru_maxrss vem em KB no Linux e em bytes no macOS."""
+    if resource is None: return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+class ModeloCronometrado:
+    """Envolve um modelo e registra a duração de cada chamada a generate_content (inclusive as que falham)."""
+    def __init__(self, modelo):
+        self.modelo = modelo; self.model_name = modelo.model_name; self.latencias = []; self._lock = threading.Lock()
+
+    def generate_content(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        try: return self.modelo.generate_content(*args, **kwargs)
+        finally:
+            with self._lock: self.latencias.append(time.perf_counter() - inicio)
+
+
+def executar_cenario(tamanho, argumentos, formato_resposta=FORMATO_TEXTO):
+    df = gerar_comentarios_sinteticos(tamanho, semente=argumentos.semente); argumentos.formato_resposta = formato_resposta; telemetria = TelemetriaAPI()
+    modelo = ModeloCronometrado(ModeloGeminiSimulado(argumentos.distribuicao, argumentos.latencia_mediana, argumentos.dispersao, argumentos.prob_429, argumentos.prob_timeout, argumentos.prob_bloqueio, argumentos.prob_malformado, semente=argumentos.semente))
+    controle = ControleTaxa(0, argumentos.workers); categorias = Counter(); total_locais = 0
+    if argumentos.medir_memoria: tracemalloc.start()
+    inicio = time.perf_counter()
+    for inicio_bloco in range(0, tamanho, argumentos.tamanho_bloco):
+        bloco, _, locais_bloco = classificar_bloco(df.iloc[inicio_bloco:inicio_bloco + argumentos.tamanho_bloco], "Conteúdo", modelo, argumentos, None, controle, telemetria)
+        total_locais += locais_bloco; categorias.update(bloco['Tema_Classificado'][bloco['Tema_Classificado'].isin(todas_categorias_erro)])
+    duracao = time.perf_counter() - inicio
+    pico_python_mb = tracemalloc.get_traced_memory()[1] / 2**20 if argumentos.medir_memoria else None
+    if argumentos.medir_memoria: tracemalloc.stop()
+    latencias = np.array(modelo.latencias) if modelo.latencias else np.zeros(1); resumo_controle = controle.resumo(); resumo_telemetria = telemetria.resumo() or {"tokens_resposta": 0, "resultados": {}}
+    # Chamadas cuja resposta (inteira ou algum item do lote) não pôde ser interpretada e gerou reenvio
+    chamadas_com_erro_parsing = resumo_telemetria["resultados"].get("Erro Parsing", 0) + resumo_telemetria["resultados"].get("Erro Parsing (parcial)", 0)
+    return {
+        "formato_resposta": formato_resposta, "comentarios": tamanho, "segundos": round(duracao, 3), "comentarios_por_segundo": round(tamanho / duracao, 1), "chamadas_api": len(modelo.latencias),
+        "rotulados_localmente": total_locais, "latencia_p50_ms": round(float(np.percentile(latencias, 50)) * 1000, 1), "latencia_p95_ms": round(float(np.percentile(latencias, 95)) * 1000, 1),
+        "tokens_resposta": resumo_telemetria["tokens_resposta"], "tokens_resposta_por_chamada": round(resumo_telemetria["tokens_resposta"] / len(modelo.latencias), 1) if modelo.latencias else None,
+        "taxa_erro_parsing": round(chamadas_com_erro_parsing / len(modelo.latencias), 4) if modelo.latencias else 0.0, "erros_por_categoria": dict(categorias), "retentativas": resumo_controle["retentativas"], "pico_memoria_python_mb": round(pico_python_mb, 1) if pico_python_mb is not None else None,
+        "pico_memoria_processo_mb": round(pico_memoria_processo_mb(), 1) if resource else None,
+    }
+
+def executar_cenario_isolado(tamanho, argumentos, formato_resposta=FORMATO_TEXTO):
+    """executar_cenario em um processo novo (spawn): ru_maxrss é o pico desde o início do processo, então só assim cada cenário tem o seu."""
+    with multiprocessing.get_context("spawn").Pool(1) as processo: return processo.apply(executar_cenario, (tamanho, argumentos, formato_resposta))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline de classificação com o Gemini simulado.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[1000, 10000, 100000], help="Quantidade de comentários de cada base sintética.")
+    parser.add_argument("--workers", type=int, default=32); parser.add_argument("--lote", type=int, default=1); parser.add_argument("--tamanho-bloco", type=int, default=5000)
+    parser.add_argument("--limiar", type=float, default=1.0, help="Similaridade mínima do agrupamento de duplicados.")
+    parser.add_argument("--sem-agrupamento", dest="limiar", action="store_const", const=None)
+    parser.add_argument("--confianca-local", type=float, default=0.9, help="Confiança mínima das regras locais.")
+    parser.add_argument("--sem-pre-classificacao", dest="confianca_local", action="store_const", const=None)
+    parser.add_argument("--distribuicao", choices=distribuicoes_latencia, default="lognormal", help="Distribuição da latência simulada.")
+    parser.add_argument("--latencia-mediana", type=float, default=0.05, help="Latência mediana simulada por chamada, em segundos.")
+    parser.add_argument("--dispersao", type=float, default=0.5, help="Sigma da lognormal.")
+    parser.add_argument("--prob-429", type=float, default=0.0); parser.add_argument("--prob-timeout", type=float, default=0.0)
+    parser.add_argument("--prob-bloqueio", type=float, default=0.0); parser.add_argument("--prob-malformado", type=float, default=0.0)
+    parser.add_argument("--formatos-resposta", choices=formatos_resposta, nargs="+", default=[FORMATO_TEXTO], help="Formatos de resposta a comparar (texto: duas linhas; json: resposta estruturada).")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--medir-memoria", action="store_true", help="Mede o pico de memória Python com tracemalloc (deixa a execução mais lenta).")
+    parser.add_argument("--json", help="Grava os resultados neste arquivo JSON.")
+    argumentos = parser.parse_args(argv); argumentos.rpm = 0
+
+    resultados = []
+    for tamanho, formato_resposta in itertools.product(argumentos.tamanhos, argumentos.formatos_resposta):
+        resultado = executar_cenario_isolado(tamanho, argumentos, formato_resposta); resultados.append(resultado)
+        print(f"{tamanho:>7} comentários | {formato_resposta:<5} | {resultado['segundos']:>8.2f}s | {resultado['comentarios_por_segundo']:>9.1f} com/s | {resultado['chamadas_api']:>7} chamadas | {resultado['rotulados_localmente']:>6} locais | "
+              f"p50 {resultado['latencia_p50_ms']:>7.1f} ms | p95 {resultado['latencia_p95_ms']:>7.1f} ms | {resultado['tokens_resposta_por_chamada'] or 0:>6.1f} tokens de saída/chamada | erro de parsing {resultado['taxa_erro_parsing']:.2%} | "
+              f"erros {resultado['erros_por_categoria'] or '-'} | retentativas {resultado['retentativas'] or '-'} | "
+              f"memória {resultado['pico_memoria_python_mb'] if resultado['pico_memoria_python_mb'] is not None else resultado['pico_memoria_processo_mb']} MB")
+    if argumentos.json:
+        with open(argumentos.json, 'w', encoding='utf-8') as arquivo: json.dump({"parametros": {chave: valor for chave, valor in vars(argumentos).items() if chave not in ("json", "formato_resposta")}, "resultados": resultados}, arquivo, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""Fila persistente de análises (SQLite) executada por workers em processos separados.
+
+O app só envia o arquivo para a fila e acompanha o andamento. Cada trabalho é
+dividido em blocos de linhas. Os workers (um processo por API Key, ou mais)
+reservam blocos de qualquer trabalho pendente, classificam com o mesmo
+pipeline da linha de comando e gravam os resultados no banco. Fechar a aba,
+um rerun ou reiniciar o Streamlit não interrompem a análise, e vários
+trabalhos grandes podem rodar em paralelo na mesma máquina.
+
+Exemplo:
+    GOOGLE_API_KEYS=chave1,chave2 python fila_analise.py --workers 16 --rpm 1000
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+from analise_cli import classificar_bloco
+from analise_core import FORMATO_TEXTO, CacheClassificacao, ControleTaxa, configurar_modelo, filtrar_comentarios_validos, ler_arquivo_comentarios
+
+PASTA_BASE = os.path.dirname(os.path.abspath(__file__))
+CAMINHO_FILA = os.path.join(PASTA_BASE, "fila_analise.sqlite3")
+PASTA_TRABALHOS = os.path.join(PASTA_BASE, "trabalhos") # Cópia do arquivo enviado de cada trabalho
+TAMANHO_BLOCO_FILA = 500
+INTERVALO_CONSULTA_SEGUNDOS = 2.0 # Espera do worker quando não há blocos pendentes
+INTERVALO_SINAL_VIDA_SEGUNDOS = 10.0 # O worker renova seu registro e a reserva do bloco em andamento a cada intervalo
+TEMPO_MAXIMO_BLOCO_SEGUNDOS = 2 * 60 # Bloco "executando" sem renovação há mais tempo que isso volta para a fila (worker caiu)
+WORKER_ATIVO_SEGUNDOS = 30 # Sem sinal de vida por mais tempo que isso, o worker é considerado parado
+MAX_TENTATIVAS_BLOCO = 3 # Falhas e reservas expiradas de um mesmo bloco antes de o trabalho ir para 'erro'
+RETENCAO_TRABALHOS_SEGUNDOS = 7 * 24 * 3600 # Trabalhos encerrados há mais tempo que isso são apagados (banco e cópia do arquivo)
+INTERVALO_LIMPEZA_SEGUNDOS = 3600 # Frequência com que um worker ocioso procura trabalhos vencidos
+estados_finais = ("concluido", "erro", "cancelado")
+
+
+class FilaAnalise:
+    """Acesso à fila em SQLite; cada operação abre sua própria conexão, então pode ser usada por várias threads e processos."""
+    def __init__(self, caminho=CAMINHO_FILA, pasta_trabalhos=PASTA_TRABALHOS):
+        self.caminho = caminho; self.pasta_trabalhos = pasta_trabalhos
+        with self._conectar() as conexao:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("CREATE TABLE IF NOT EXISTS trabalhos (id TEXT PRIMARY KEY, criado_em REAL NOT NULL, atualizado_em REAL NOT NULL, estado TEXT NOT NULL, nome_arquivo TEXT NOT NULL, caminho_arquivo TEXT NOT NULL, coluna TEXT NOT NULL, colunas_extras TEXT NOT NULL, parametros TEXT NOT NULL, total INTEGER NOT NULL, processados INTEGER NOT NULL DEFAULT 0, mensagem TEXT)")
+            conexao.execute("CREATE TABLE IF NOT EXISTS blocos (trabalho_id TEXT NOT NULL, numero INTEGER NOT NULL, inicio INTEGER NOT NULL, fim INTEGER NOT NULL, estado TEXT NOT NULL, worker TEXT, tentativas INTEGER NOT NULL DEFAULT 0, atualizado_em REAL NOT NULL, PRIMARY KEY (trabalho_id, numero))")
+            conexao.execute("CREATE INDEX IF NOT EXISTS idx_blocos_estado ON blocos (estado, atualizado_em)")
+            conexao.execute("CREATE TABLE IF NOT EXISTS resultados (trabalho_id TEXT NOT NULL, indice INTEGER NOT NULL, sentimento TEXT NOT NULL, tema TEXT NOT NULL, origem TEXT NOT NULL, PRIMARY KEY (trabalho_id, indice))")
+            conexao.execute("CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, rotulo TEXT NOT NULL, pid INTEGER NOT NULL, atualizado_em REAL NOT NULL)")
+
+    def _conectar(self):
+        conexao = sqlite3.connect(self.caminho, timeout=30, isolation_level=None); conexao.row_factory = sqlite3.Row
+        return _Transacao(conexao)
+
+    # --- Lado do app ---
+    def enviar(self, conteudo, nome_arquivo, coluna, colunas_extras, total, parametros, tamanho_bloco=TAMANHO_BLOCO_FILA):
+        """Grava uma cópia do arquivo e cria o trabalho com seus blocos; total é o número de comentários válidos. Devolve o id."""
+        id_trabalho = uuid.uuid4().hex[:12]; pasta = os.path.join(self.pasta_trabalhos, id_trabalho); os.makedirs(pasta, exist_ok=True)
+        caminho_arquivo = os.path.join(pasta, "entrada" + os.path.splitext(nome_arquivo)[1].lower())
+        with open(caminho_arquivo, 'wb') as arquivo: arquivo.write(conteudo)
+        agora = time.time(); blocos = [(id_trabalho, numero, inicio, min(inicio + tamanho_bloco, total), "pendente", agora) for numero, inicio in enumerate(range(0, total, tamanho_bloco))]
+        with self._conectar() as conexao:
+            conexao.execute("INSERT INTO trabalhos (id, criado_em, atualizado_em, estado, nome_arquivo, caminho_arquivo, coluna, colunas_extras, parametros, total) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (id_trabalho, agora, agora, "pendente" if blocos else "concluido", nome_arquivo, caminho_arquivo, coluna, json.dumps(list(colunas_extras)), json.dumps(parametros), total))
+            conexao.executemany("INSERT INTO blocos (trabalho_id, numero, inicio, fim, estado, atualizado_em) VALUES (?, ?, ?, ?, ?, ?)", blocos)
+        return id_trabalho
+
+    def obter(self, id_trabalho):
+        with self._conectar() as conexao: linha = conexao.execute("SELECT * FROM trabalhos WHERE id = ?", (id_trabalho,)).fetchone()
+        return _trabalho_como_dict(linha) if linha else None
+
+    def listar(self, limite=20):
+        with self._conectar() as conexao: linhas = conexao.execute("SELECT * FROM trabalhos ORDER BY criado_em DESC LIMIT ?", (limite,)).fetchall()
+        return [_trabalho_como_dict(linha) for linha in linhas]
+
+    def cancelar(self, id_trabalho):
+        with self._conectar() as conexao:
+            conexao.execute("UPDATE trabalhos SET estado = 'cancelado', atualizado_em = ? WHERE id = ? AND estado NOT IN ('concluido', 'erro')", (time.time(), id_trabalho))
+
+    def contagens(self, id_trabalho):
+        """Contagem de resultados por (sentimento, tema), para o acompanhamento parcial sem ler todas as linhas."""
+        with self._conectar() as conexao: linhas = conexao.execute("SELECT sentimento, tema, COUNT(*) FROM resultados WHERE trabalho_id = ? GROUP BY sentimento, tema", (id_trabalho,)).fetchall()
+        return [tuple(linha) for linha in linhas]
+
+    def resultados(self, id_trabalho):
+        with self._conectar() as conexao: linhas = conexao.execute("SELECT indice, sentimento, tema, origem FROM resultados WHERE trabalho_id = ?", (id_trabalho,)).fetchall()
+        return pd.DataFrame([tuple(linha) for linha in linhas], columns=['indice', 'Sentimento_Classificado', 'Tema_Classificado', 'Origem_Classificacao']).set_index('indice')
+
+    def workers_ativos(self):
+        with self._conectar() as conexao: linhas = conexao.execute("SELECT rotulo, pid FROM workers WHERE atualizado_em >= ?", (time.time() - WORKER_ATIVO_SEGUNDOS,)).fetchall()
+        return [tuple(linha) for linha in linhas]
+
+    # --- Lado do worker ---
+    def registrar_worker(self, id_worker, rotulo):
+        """Sinal de vida: atualiza o registro do worker e renova a reserva dos blocos que ele está executando."""
+        agora = time.time()
+        with self._conectar() as conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            conexao.execute("INSERT OR REPLACE INTO workers VALUES (?, ?, ?, ?)", (id_worker, rotulo, os.getpid(), agora))
+            conexao.execute("UPDATE blocos SET atualizado_em = ? WHERE worker = ? AND estado = 'executando'", (agora, id_worker))
+
+    def remover_worker(self, id_worker):
+        with self._conectar() as conexao: conexao.execute("DELETE FROM workers WHERE id = ?", (id_worker,))
+
+    def reservar_bloco(self, id_worker):
+        """Reserva o próximo bloco pendente (ou abandonado por um worker que caiu); None se não houver.
+
+        Os blocos são intercalados entre os trabalhos ativos (o bloco 0 de cada um,
+        depois o 1...), então um trabalho novo não espera o mais antigo terminar.
+        Reservar de novo um bloco abandonado conta como tentativa: um bloco que
+        derruba o worker toda vez leva o trabalho a 'erro' em vez de circular para sempre.
+        """
+        agora = time.time()
+        with self._conectar() as conexao:
+            conexao.execute("BEGIN IMMEDIATE") # Duas reservas simultâneas nunca pegam o mesmo bloco
+            while True:
+                linha = conexao.execute("""SELECT b.trabalho_id, b.numero, b.inicio, b.fim, b.estado, b.tentativas FROM blocos b JOIN trabalhos t ON t.id = b.trabalho_id
+                                           WHERE t.estado IN ('pendente', 'executando') AND (b.estado = 'pendente' OR (b.estado = 'executando' AND b.atualizado_em < ?))
+                                           ORDER BY b.numero, t.criado_em LIMIT 1""", (agora - TEMPO_MAXIMO_BLOCO_SEGUNDOS,)).fetchone()
+                if linha is None: return None
+                tentativas = linha['tentativas'] + (linha['estado'] == 'executando')
+                if tentativas < MAX_TENTATIVAS_BLOCO: break
+                conexao.execute("UPDATE blocos SET estado = 'pendente', worker = NULL, tentativas = ?, atualizado_em = ? WHERE trabalho_id = ? AND numero = ?", (tentativas, agora, linha['trabalho_id'], linha['numero']))
+                conexao.execute("UPDATE trabalhos SET estado = 'erro', mensagem = ?, atualizado_em = ? WHERE id = ?", (f"Bloco {linha['numero']} não terminou após {tentativas} tentativas (o worker parou durante o processamento).", agora, linha['trabalho_id']))
+            conexao.execute("UPDATE blocos SET estado = 'executando', worker = ?, tentativas = ?, atualizado_em = ? WHERE trabalho_id = ? AND numero = ?", (id_worker, tentativas, agora, linha['trabalho_id'], linha['numero']))
+            conexao.execute("UPDATE trabalhos SET estado = 'executando', atualizado_em = ? WHERE id = ? AND estado = 'pendente'", (agora, linha['trabalho_id']))
+        return {chave: linha[chave] for chave in ('trabalho_id', 'numero', 'inicio', 'fim')}
+
+    def concluir_bloco(self, id_trabalho, numero, id_worker, bloco_resultados):
+        """Grava os resultados do bloco (índice -> sentimento, tema, origem) e encerra o trabalho quando for o último."""
+        agora = time.time(); linhas = [(id_trabalho, int(indice), str(sentimento), str(tema), str(origem)) for indice, sentimento, tema, origem in bloco_resultados.itertuples()]
+        with self._conectar() as conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            atualizado = conexao.execute("UPDATE blocos SET estado = 'concluido', atualizado_em = ? WHERE trabalho_id = ? AND numero = ? AND estado = 'executando' AND worker = ?", (agora, id_trabalho, numero, id_worker)).rowcount
+            if not atualizado: return # A reserva expirou e o bloco passou para outro worker
+            conexao.executemany("INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?, ?)", linhas)
+            restantes = conexao.execute("SELECT COUNT(*) FROM blocos WHERE trabalho_id = ? AND estado != 'concluido'", (id_trabalho,)).fetchone()[0]
+            conexao.execute("UPDATE trabalhos SET processados = processados + ?, atualizado_em = ?, estado = CASE WHEN ? = 0 AND estado = 'executando' THEN 'concluido' ELSE estado END WHERE id = ?", (len(linhas), agora, restantes, id_trabalho))
+
+    def falhar_bloco(self, id_trabalho, numero, id_worker, mensagem):
+        """Devolve o bloco à fila; depois de MAX_TENTATIVAS_BLOCO falhas, o trabalho inteiro vai para 'erro'."""
+        agora = time.time()
+        with self._conectar() as conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            # UPDATE + SELECT na mesma transação (UPDATE ... RETURNING exige SQLite 3.35+)
+            atualizado = conexao.execute("UPDATE blocos SET estado = 'pendente', worker = NULL, tentativas = tentativas + 1, atualizado_em = ? WHERE trabalho_id = ? AND numero = ? AND estado = 'executando' AND worker = ?", (agora, id_trabalho, numero, id_worker)).rowcount
+            if not atualizado: return # A reserva expirou e o bloco passou para outro worker
+            tentativas = conexao.execute("SELECT tentativas FROM blocos WHERE trabalho_id = ? AND numero = ?", (id_trabalho, numero)).fetchone()[0]
+            if tentativas >= MAX_TENTATIVAS_BLOCO: conexao.execute("UPDATE trabalhos SET estado = 'erro', mensagem = ?, atualizado_em = ? WHERE id = ?", (f"Bloco {numero} falhou após {tentativas} tentativas: {mensagem}", agora, id_trabalho))
+
+    def limpar_trabalhos_antigos(self, retencao_segundos=RETENCAO_TRABALHOS_SEGUNDOS):
+        """Apaga os trabalhos encerrados há mais de retencao_segundos (linhas no banco e pasta com a cópia do arquivo); devolve quantos."""
+        with self._conectar() as conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            ids = [linha[0] for linha in conexao.execute(f"SELECT id FROM trabalhos WHERE estado IN ({', '.join('?' * len(estados_finais))}) AND atualizado_em < ?", (*estados_finais, time.time() - retencao_segundos)).fetchall()]
+            for tabela, coluna in (("resultados", "trabalho_id"), ("blocos", "trabalho_id"), ("trabalhos", "id")): conexao.executemany(f"DELETE FROM {tabela} WHERE {coluna} = ?", [(id_trabalho,) for id_trabalho in ids])
+        for id_trabalho in ids: shutil.rmtree(os.path.join(self.pasta_trabalhos, id_trabalho), ignore_errors=True)
+        return len(ids)
+
+
+class _Transacao:
+    """Conexão em autocommit usada como context manager: confirma um BEGIN aberto, desfaz em caso de erro e sempre fecha."""
+    def __init__(self, conexao): self.conexao = conexao
+    def __enter__(self): return self.conexao
+    def __exit__(self, tipo_erro, erro, rastreamento):
+        try:
+            if self.conexao.in_transaction: self.conexao.execute("ROLLBACK" if tipo_erro else "COMMIT")
+        finally: self.conexao.close()
+
+def _trabalho_como_dict(linha):
+    trabalho = dict(linha); trabalho['colunas_extras'] = json.loads(trabalho['colunas_extras']); trabalho['parametros'] = json.loads(trabalho['parametros'])
+    return trabalho
+
+def ler_comentarios_trabalho(trabalho, colunas_extras=()):
+    """Lê o arquivo guardado do trabalho com as mesmas regras do app (mesmo índice das linhas válidas)."""
+    with open(trabalho['caminho_arquivo'], 'rb') as arquivo: conteudo = arquivo.read()
+    return filtrar_comentarios_validos(ler_arquivo_comentarios(conteudo, trabalho['nome_arquivo'], [trabalho['coluna']] + list(colunas_extras)), trabalho['coluna'])
+
+
+# --- Worker ---
+def executar_worker(api_key, rotulo, argumentos, fila=None, criar_modelo=configurar_modelo, deve_parar=lambda: False):
+    """Laço de um worker: reserva um bloco, classifica, grava e repete até deve_parar() (ou para sempre)."""
+    fila = fila or FilaAnalise(argumentos.fila); id_worker = f"{rotulo}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    modelo = criar_modelo(api_key); cache = None if argumentos.sem_cache else CacheClassificacao(); controle = ControleTaxa(argumentos.rpm, argumentos.workers); trabalhos_lidos = {}; proxima_limpeza = 0.0
+    parar_sinal_vida = threading.Event(); fila.registrar_worker(id_worker, rotulo)
+    def enviar_sinal_vida():
+        # Em thread separada: um bloco pode levar minutos (latência real, --rpm baixo) sem que o worker pareça parado ou perca a reserva
+        while not parar_sinal_vida.wait(INTERVALO_SINAL_VIDA_SEGUNDOS):
+            try: fila.registrar_worker(id_worker, rotulo)
+            except sqlite3.Error as e: print(f"[{rotulo}] Falha ao renovar o sinal de vida: {e}", file=sys.stderr)
+    threading.Thread(target=enviar_sinal_vida, daemon=True).start()
+    try:
+        while not deve_parar():
+            reserva = fila.reservar_bloco(id_worker)
+            if reserva is None:
+                if time.time() >= proxima_limpeza: fila.limpar_trabalhos_antigos(); proxima_limpeza = time.time() + INTERVALO_LIMPEZA_SEGUNDOS
+                time.sleep(INTERVALO_CONSULTA_SEGUNDOS); continue
+            try:
+                trabalho = fila.obter(reserva['trabalho_id'])
+                if reserva['trabalho_id'] not in trabalhos_lidos:
+                    trabalhos_lidos = {reserva['trabalho_id']: ler_comentarios_trabalho(trabalho)} # Mantém só o trabalho atual em memória
+                parametros = trabalho['parametros']; opcoes = argparse.Namespace(confianca_local=parametros.get('confianca_local'), limiar=parametros.get('limiar'), lote=parametros.get('lote', 1), formato_resposta=parametros.get('formato_resposta', FORMATO_TEXTO), workers=argumentos.workers, rpm=argumentos.rpm)
+                bloco = trabalhos_lidos[reserva['trabalho_id']].iloc[reserva['inicio']:reserva['fim']]
+                bloco, _, _ = classificar_bloco(bloco, trabalho['coluna'], modelo, opcoes, cache, controle)
+                fila.concluir_bloco(reserva['trabalho_id'], reserva['numero'], id_worker, bloco[['Sentimento_Classificado', 'Tema_Classificado', 'Origem_Classificacao']])
+                print(f"[{rotulo}] Trabalho {reserva['trabalho_id']}, bloco {reserva['numero']}: {len(bloco)} linhas", file=sys.stderr)
+            except Exception as e:
+                print(f"[{rotulo}] Erro no trabalho {reserva['trabalho_id']}, bloco {reserva['numero']}: {e}", file=sys.stderr); fila.falhar_bloco(reserva['trabalho_id'], reserva['numero'], id_worker, str(e))
+    finally: parar_sinal_vida.set(); fila.remover_worker(id_worker)
+
+def _processo_worker(api_key, rotulo, argumentos):
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    criar_modelo = configurar_modelo
+    if argumentos.simulado:
+        from simulador_gemini import ModeloGeminiSimulado
+        criar_modelo = lambda _: ModeloGeminiSimulado(latencia_mediana=argumentos.simulado)
+    try: executar_worker(api_key, rotulo, argumentos, criar_modelo=criar_modelo)
+    except KeyboardInterrupt: pass
+
+def iniciar_workers_em_segundo_plano(api_keys, workers=8, rpm=0, caminho=CAMINHO_FILA):
+    """Sobe este módulo como processo independente (sobrevive ao fim da sessão e do Streamlit); a saída vai para trabalhos/workers.log."""
+    os.makedirs(PASTA_TRABALHOS, exist_ok=True)
+    with open(os.path.join(PASTA_TRABALHOS, "workers.log"), 'ab') as log: # As chaves vão pelo ambiente, não pela linha de comando (visível no ps)
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__), "--workers", str(workers), "--rpm", str(rpm), "--fila", caminho], env={**os.environ, "GOOGLE_API_KEYS": ",".join(api_keys)}, stdout=log, stderr=log, stdin=subprocess.DEVNULL, start_new_session=True).pid
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Executa os trabalhos da fila de análises em processos separados, um ou mais por API Key.")
+    parser.add_argument("--api-keys", default=os.environ.get("GOOGLE_API_KEYS") or os.environ.get("GOOGLE_API_KEY"), help="API Keys separadas por vírgula (padrão: GOOGLE_API_KEYS ou GOOGLE_API_KEY).")
+    parser.add_argument("--processos-por-chave", type=int, default=1, help="Processos de worker por API Key (padrão: 1).")
+    parser.add_argument("--workers", type=int, default=8, help="Chamadas simultâneas por processo (padrão: 8).")
+    parser.add_argument("--rpm", type=int, default=0, help="Limite de requisições por minuto de cada processo; 0 = sem limite.")
+    parser.add_argument("--sem-cache", action="store_true", help="Não consulta nem grava o cache de classificações.")
+    parser.add_argument("--fila", default=CAMINHO_FILA, help="Banco SQLite da fila.")
+    parser.add_argument("--simulado", type=float, metavar="LATENCIA", help="Usa o Gemini simulado com esta latência mediana (segundos), sem API Key; para testes.")
+    argumentos = parser.parse_args(argv)
+
+    chaves = [chave.strip() for chave in (argumentos.api_keys or "").split(",") if chave.strip()] or (["simulado"] if argumentos.simulado else [])
+    if not chaves: parser.error("informe --api-keys ou defina GOOGLE_API_KEYS.")
+    FilaAnalise(argumentos.fila) # Cria as tabelas antes de subir os processos
+    processos = [multiprocessing.Process(target=_processo_worker, args=(chave, f"chave{numero_chave}-{chave[-4:]}", argumentos), daemon=True)
+                 for numero_chave, chave in enumerate(chaves, start=1) for _ in range(max(1, argumentos.processos_por_chave))]
+    for processo in processos: processo.start()
+    print(f"{len(processos)} processos de worker iniciados para {len(chaves)} API Key(s). Fila: {argumentos.fila}", file=sys.stderr)
+    try:
+        for processo in processos: processo.join()
+    except KeyboardInterrupt:
+        for processo in processos: processo.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Substituto local de genai.GenerativeModel para testes e benchmarks sem API Key.
+
+ModeloGeminiSimulado responde aos mesmos prompts do núcleo (um comentário ou
+lote numerado) no formato Sentimento:/Tema:, ou em JSON quando recebe
+response_mime_type="application/json", com latência sorteada de uma
+distribuição configurável e injeção opcional de erros 429, timeouts, bloqueio
+de conteúdo e respostas malformadas.
+"""
+
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+
+from analise_core import categorias_sentimento_validas, categorias_tema_validas
+
+try: # Usa as mesmas exceções da biblioteca real quando ela está instalada
+    from google.api_core.exceptions import DeadlineExceeded, ResourceExhausted
+    from google.generativeai.types import StopCandidateException
+except ImportError:
+    class ResourceExhausted(Exception): pass
+    class DeadlineExceeded(Exception): pass
+    class StopCandidateException(Exception): pass
+
+distribuicoes_latencia = ["constante", "uniforme", "exponencial", "lognormal"]
+marcador_comentario_unico = "Agora, classifique a seguinte mensagem:"
+regex_item_lote = re.compile(r"^\[ID (\d+)\] (.*)$", re.MULTILINE)
+
+
+class UsoSimulado:
+    """Equivalente a response.usage_metadata (contagem aproximada: 4 caracteres por token)."""
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count; self.candidates_token_count = candidates_token_count; self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class RespostaSimulada:
+    def __init__(self, texto, prompt):
+        self.text = texto; self.prompt_feedback = None; self.usage_metadata = UsoSimulado(len(prompt) // 4, max(1, len(texto) // 4))
+
+
+class ModeloGeminiSimulado:
+    """Modelo falso com a mesma interface de generate_content usada pelo núcleo.
+
+    As classificações são determinísticas (derivadas do hash do comentário), de
+    modo que execuções repetidas produzem os mesmos rótulos; latência e falhas
+    são sorteadas com a semente informada. As probabilidades de erro valem por
+    chamada, e prob_malformado vale por item da resposta. No modo JSON os defeitos
+    são os que o esquema não evita: resposta cortada no meio (MAX_TOKENS), texto
+    vazio, campo a mais e, num lote, o item vir com o id de outra mensagem.
+    """
+    def __init__(self, distribuicao_latencia="lognormal", latencia_mediana=0.2, dispersao_latencia=0.5, prob_429=0.0, prob_timeout=0.0, prob_bloqueio=0.0, prob_malformado=0.0, duracao_timeout=None, semente=None, model_name="models/gemini-simulado"):
+        if distribuicao_latencia not in distribuicoes_latencia: raise ValueError(f"Distribuição de latência desconhecida: {distribuicao_latencia}. Opções: {', '.join(distribuicoes_latencia)}")
+        self.distribuicao_latencia = distribuicao_latencia; self.latencia_mediana = latencia_mediana; self.dispersao_latencia = dispersao_latencia
+        self.prob_429 = prob_429; self.prob_timeout = prob_timeout; self.prob_bloqueio = prob_bloqueio; self.prob_malformado = prob_malformado
+        self.duracao_timeout = latencia_mediana if duracao_timeout is None else duracao_timeout; self.model_name = model_name
+        self._aleatorio = random.Random(semente); self._lock = threading.Lock(); self.chamadas = 0
+
+    def _sortear(self):
+        with self._lock: return self._aleatorio.random()
+
+    def _sortear_latencia(self):
+        with self._lock:
+            if self.distribuicao_latencia == "constante": return self.latencia_mediana
+            if self.distribuicao_latencia == "uniforme": return self._aleatorio.uniform(0, 2 * self.latencia_mediana)
+            if self.distribuicao_latencia == "exponencial": return self._aleatorio.expovariate(math.log(2) / self.latencia_mediana) if self.latencia_mediana > 0 else 0.0
+            return self._aleatorio.lognormvariate(math.log(self.latencia_mediana), self.dispersao_latencia) if self.latencia_mediana > 0 else 0.0
+
+    @staticmethod
+    def classificacao_esperada(comentario):
+        """Rótulo determinístico que o simulador devolve para o comentário (quando não há falha injetada)."""
+        valor = int.from_bytes(hashlib.md5(" ".join(comentario.split()).encode('utf-8')).digest()[:4], 'big')
+        sentimento = categorias_sentimento_validas[valor % len(categorias_sentimento_validas)]
+        if sentimento == "Não Classificado": return sentimento, "Não Classificado (Tema)"
+        temas_classificaveis = [tema for tema in categorias_tema_validas if tema != "Não Classificado (Tema)"]
+        return sentimento, temas_classificaveis[(valor // 7) % len(temas_classificaveis)]
+
+    def _linhas_item(self, comentario):
+        sentimento, tema = self.classificacao_esperada(comentario)
+        if self._sortear() < self.prob_malformado:
+            with self._lock: defeito = self._aleatorio.choice(["sem_tema", "categoria_invalida", "texto_livre"])
+            if defeito == "sem_tema": return [f"Sentimento: {sentimento}"]
+            if defeito == "categoria_invalida": return ["Sentimento: Bom", f"Tema: {tema}"]
+            return ["Acho que essa mensagem é positiva."]
+        return [f"Sentimento: {sentimento}", f"Tema: {tema}"]
+
+    def _item_json(self, comentario, id_lote=None):
+        """Devolve (item, defeito); "truncado" e "vazio" ficam a cargo de _texto_json, que monta o texto da resposta."""
+        sentimento, tema = self.classificacao_esperada(comentario)
+        item = {"s": sentimento, "t": tema} if id_lote is None else {"id": int(id_lote), "s": sentimento, "t": tema}
+        if self._sortear() >= self.prob_malformado: return item, None
+        with self._lock: defeito = self._aleatorio.choice(["truncado", "vazio", "campo_extra"] if id_lote is None else ["truncado", "campo_extra", "id_trocado"])
+        if defeito == "campo_extra": item["confianca"] = 0.9
+        if defeito == "id_trocado": item["id"] += 1 # O item certo fica sem resposta
+        return item, defeito
+
+    def _texto_json(self, itens_lote, prompt):
+        serializar = lambda dados: json.dumps(dados, ensure_ascii=False, separators=(",", ":"))
+        if not itens_lote:
+            item, defeito = self._item_json(prompt.rsplit(marcador_comentario_unico, 1)[-1].strip())
+            if defeito == "vazio": return ""
+            return serializar(item)[:-len(item["t"])] if defeito == "truncado" else serializar(item)
+        partes = []
+        for id_lote, comentario in itens_lote:
+            item, defeito = self._item_json(comentario, id_lote)
+            if defeito == "truncado": return "[" + ",".join(partes + [serializar(item)[:-len(item["t"])]]) # Corte por MAX_TOKENS: o JSON do lote inteiro fica inválido
+            partes.append(serializar(item))
+        return "[" + ",".join(partes) + "]"
+
+    def generate_content(self, prompt, safety_settings=None, request_options=None, generation_config=None):
+        with self._lock: self.chamadas += 1
+        sorteio = self._sortear()
+        if sorteio < self.prob_429: time.sleep(min(0.01, self.latencia_mediana)); raise ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+        if sorteio < self.prob_429 + self.prob_timeout: time.sleep(self.duracao_timeout); raise DeadlineExceeded("504 Deadline Exceeded")
+        time.sleep(self._sortear_latencia())
+        if sorteio < self.prob_429 + self.prob_timeout + self.prob_bloqueio: raise StopCandidateException("finish_reason: SAFETY")
+        itens_lote = regex_item_lote.findall(prompt)
+        if (generation_config or {}).get("response_mime_type") == "application/json":
+            return RespostaSimulada(self._texto_json(itens_lote, prompt), prompt)
+        if itens_lote:
+            linhas = []
+            for id_lote, comentario in itens_lote: linhas += [f"ID: {id_lote}"] + self._linhas_item(comentario)
+        else: linhas = self._linhas_item(prompt.rsplit(marcador_comentario_unico, 1)[-1].strip())
+        return RespostaSimulada("\n".join(linhas), prompt)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Parser das respostas em lote, dirigido pelo ModeloGeminiSimulado (sem API Key)."""
+
+import pytest
+
+from analise_core import FORMATO_JSON, _extrair_classificacoes_lote, _extrair_classificacoes_lote_json, analisar_lote
+from simulador_gemini import ModeloGeminiSimulado, RespostaSimulada, regex_item_lote
+
+
+class ModeloRespostaLoteFixa(ModeloGeminiSimulado):
+    """Devolve texto_lote para o prompt em lote; comentários reenviados sozinhos seguem o simulador."""
+    def __init__(self, texto_lote):
+        super().__init__(latencia_mediana=0.0, semente=0); self.texto_lote = texto_lote; self.prompts_individuais = 0
+
+    def generate_content(self, prompt, safety_settings=None, request_options=None, generation_config=None):
+        if regex_item_lote.search(prompt): return RespostaSimulada(self.texto_lote, prompt)
+        self.prompts_individuais += 1
+        return super().generate_content(prompt, safety_settings, request_options, generation_config)
+
+
+@pytest.mark.parametrize("cabecalho", ["ID: {}", "ID {}", "[ID {}]", "**ID:** {}", "**ID: {}**", "- ID: {}", "* [ID {}]", "ID: [{}]", "ID #{}"])
+def test_cabecalhos_de_id_aceitos(cabecalho):
+    texto = "\n".join([cabecalho.format(1), "Sentimento: Positivo", "Tema: Marca e Imagem", cabecalho.format(2), "**Sentimento:** Negativo", "- Tema: Segurança e Fraude"])
+    assert _extrair_classificacoes_lote(texto) == {1: ("Positivo", "Marca e Imagem"), 2: ("Negativo", "Segurança e Fraude")}
+
+def test_cabecalho_e_campos_na_mesma_linha():
+    assert _extrair_classificacoes_lote("[ID 1] Sentimento: Neutro\nTema: Marca e Imagem") == {1: ("Neutro", "Marca e Imagem")}
+
+def test_item_completo_nao_e_sobrescrito_por_cabecalho_desconhecido():
+    texto = "ID: 1\nSentimento: Positivo\nTema: Marca e Imagem\nMensagem 2\nSentimento: Negativo\nTema: Segurança e Fraude"
+    assert _extrair_classificacoes_lote(texto) == {1: ("Positivo", "Marca e Imagem")}
+
+def test_campo_repetido_no_mesmo_id_vira_erro_parsing():
+    texto = "ID: 1\nSentimento: Positivo\nSentimento: Negativo\nTema: Marca e Imagem\nID: 2\nSentimento: Neutro\nTema: Marca e Imagem\nID: 2\nSentimento: Negativo\nTema: Segurança e Fraude"
+    assert _extrair_classificacoes_lote(texto) == {1: ("Erro Parsing", "Erro Parsing"), 2: ("Erro Parsing", "Erro Parsing")}
+
+def test_campo_ausente_vira_erro_parsing():
+    assert _extrair_classificacoes_lote("ID: 1\nSentimento: Positivo") == {1: ("Positivo", "Erro Parsing")}
+
+def test_analisar_lote_nao_troca_rotulos_entre_comentarios():
+    comentarios = ["Adorei o app", "Fui vítima de golpe"]
+    sentimento_1, tema_1 = ModeloGeminiSimulado.classificacao_esperada(comentarios[0])
+    # O segundo item usa um cabeçalho que o parser não reconhece: só ele deve ser reenviado sozinho
+    texto = f"ID: 1\nSentimento: {sentimento_1}\nTema: {tema_1}\nItem 2\nSentimento: Negativo\nTema: Segurança e Fraude"
+    modelo = ModeloRespostaLoteFixa(texto)
+    assert analisar_lote(comentarios, modelo) == [ModeloGeminiSimulado.classificacao_esperada(comentario) for comentario in comentarios]
+    assert modelo.prompts_individuais == 1
+
+def test_analisar_lote_reenvia_id_com_campos_repetidos():
+    comentarios = ["Adorei o app", "Fui vítima de golpe"]
+    modelo = ModeloRespostaLoteFixa("ID: 1\nSentimento: Positivo\nTema: Marca e Imagem\nID: 1\nSentimento: Negativo\nTema: Segurança e Fraude\n[ID 2]\nSentimento: Neutro\nTema: Marca e Imagem")
+    resultados = analisar_lote(comentarios, modelo)
+    assert resultados[0] == ModeloGeminiSimulado.classificacao_esperada(comentarios[0]) and resultados[1] == ("Neutro", "Marca e Imagem")
+    assert modelo.prompts_individuais == 1
+
+def test_json_aceita_lote_no_esquema():
+    assert _extrair_classificacoes_lote_json('[{"id":1,"s":"Positivo","t":"Marca e Imagem"},{"id":2,"s":"Neutro","t":"Marca e Imagem"}]') == {1: ("Positivo", "Marca e Imagem"), 2: ("Neutro", "Marca e Imagem")}
+
+@pytest.mark.parametrize("id_invalido", ["true", "1.0", '"1"', "null"])
+def test_json_rejeita_id_que_nao_e_inteiro(id_invalido):
+    assert _extrair_classificacoes_lote_json(f'[{{"id":{id_invalido},"s":"Positivo","t":"Marca e Imagem"}}]') == {}
+
+def test_json_id_repetido_vira_erro_parsing():
+    texto = '[{"id":1,"s":"Positivo","t":"Marca e Imagem"},{"id":1,"s":"Negativo","t":"Segurança e Fraude"},{"id":2,"s":"Neutro","t":"Marca e Imagem"}]'
+    assert _extrair_classificacoes_lote_json(texto) == {1: ("Erro Parsing", "Erro Parsing"), 2: ("Neutro", "Marca e Imagem")}
+
+def test_json_texto_truncado_ou_vazio_nao_tem_itens():
+    assert _extrair_classificacoes_lote_json('[{"id":1,"s":"Positivo","t":"Mar') == {} and _extrair_classificacoes_lote_json("") == {}
+
+def test_analisar_lote_json_reenvia_ids_repetidos_e_booleanos():
+    comentarios = ["Adorei o app", "Fui vítima de golpe"]
+    modelo = ModeloRespostaLoteFixa('[{"id":true,"s":"Negativo","t":"Segurança e Fraude"},{"id":2,"s":"Positivo","t":"Marca e Imagem"},{"id":2,"s":"Negativo","t":"Segurança e Fraude"}]')
+    assert analisar_lote(comentarios, modelo, formato_resposta=FORMATO_JSON) == [ModeloGeminiSimulado.classificacao_esperada(comentario) for comentario in comentarios]
+    assert modelo.prompts_individuais == 2